@@ -3,263 +3,491 @@ API中间件
 处理CORS、请求日志、指标收集、错误处理等
 """
 
-import time
-import uuid
-from typing import Callable
-from fastapi import Request, Response, HTTPException
+import asyncio
+import hmac
+import itertools
+import os
+from time import perf_counter
+from typing import Any, Dict, Iterable, Optional, Tuple
+from fastapi import HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.middleware.base import BaseHTTPMiddleware
-from starlette.responses import JSONResponse
-import json
+from starlette.datastructures import MutableHeaders
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+import orjson
 
 from ..config.settings import get_settings
-from ..utils.logger import get_logger
-from ..utils.metrics import metrics_collector
+from ..utils.logger import get_logger, get_request_id, request_id_var
+from ..utils.metrics import request_metrics_buffer
 
 logger = get_logger(__name__)
 settings = get_settings()
 
+# 预先绑定指标记录方法，省去每个请求的属性查找；
+# 指标先写入缓冲区，由后台任务批量更新Prometheus指标
+_record_request = request_metrics_buffer.record
 
-class RequestLoggingMiddleware(BaseHTTPMiddleware):
+class PathTrie:
     """
-    请求日志中间件
-    记录所有API请求的详细信息
+    路径前缀树
+    按"/"分段存储路径规则，支持精确匹配和以"/*"结尾的前缀通配规则，
+    匹配耗时只与路径段数有关，与规则数量无关
     """
     
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
+    # 节点中的特殊键：路径在此结束 / 通配此后的所有路径段
+    _END = object()
+    _WILDCARD = object()
+    
+    def __init__(self, rules: Iterable[str] = ()):
         """
-        处理请求并记录日志
+        初始化路径前缀树
         
         Args:
-            request: HTTP请求
-            call_next: 下一个处理函数
-            
-        Returns:
-            Response: HTTP响应
+            rules: 路径规则，如"/docs"（精确匹配）、"/docs/*"（匹配其下所有路径）
         """
-        # 生成请求ID
-        request_id = str(uuid.uuid4())
-        request.state.request_id = request_id
-        
-        # 记录请求开始时间
-        start_time = time.time()
-        
-        # 获取客户端信息
-        client_ip = request.client.host if request.client else "unknown"
-        user_agent = request.headers.get("user-agent", "unknown")
+        self._root: Dict[Any, Any] = {}
+        for rule in rules:
+            self.add(rule)
+    
+    def add(self, rule: str) -> None:
+        """
+        添加路径规则
         
-        # 记录请求信息
-        logger.info(
-            f"请求开始 - ID: {request_id}, "
-            f"方法: {request.method}, "
-            f"路径: {request.url.path}, "
-            f"客户端: {client_ip}, "
-            f"User-Agent: {user_agent}"
-        )
+        Args:
+            rule: 路径规则
+        """
+        node = self._root
+        for segment in rule.split("/"):
+            if not segment:
+                continue
+            if segment == "*":
+                node[self._WILDCARD] = True
+                return
+            node = node.setdefault(segment, {})
+        node[self._END] = True
+    
+    def match(self, path: str) -> bool:
+        """
+        检查路径是否匹配任一规则
         
-        try:
-            # 处理请求
-            response = await call_next(request)
-            
-            # 计算处理时间
-            process_time = time.time() - start_time
-            
-            # 记录响应信息
-            logger.info(
-                f"请求完成 - ID: {request_id}, "
-                f"状态码: {response.status_code}, "
-                f"处理时间: {process_time:.3f}s"
-            )
-            
-            # 添加响应头
-            response.headers["X-Request-ID"] = request_id
-            response.headers["X-Process-Time"] = f"{process_time:.3f}"
-            
-            return response
-            
-        except Exception as e:
-            # 计算处理时间
-            process_time = time.time() - start_time
-            
-            # 记录错误信息
-            logger.error(
-                f"请求失败 - ID: {request_id}, "
-                f"错误: {str(e)}, "
-                f"处理时间: {process_time:.3f}s"
-            )
+        Args:
+            path: 请求路径
             
-            # 返回错误响应
-            return JSONResponse(
-                status_code=500,
-                content={
-                    "success": False,
-                    "message": "内部服务器错误",
-                    "request_id": request_id,
-                    "error": str(e)
-                },
-                headers={
-                    "X-Request-ID": request_id,
-                    "X-Process-Time": f"{process_time:.3f}"
-                }
-            )
-
-
-class MetricsMiddleware(BaseHTTPMiddleware):
+        Returns:
+            bool: 是否匹配
+        """
+        node = self._root
+        for segment in path.split("/"):
+            if not segment:
+                continue
+            if self._WILDCARD in node:
+                return True
+            node = node.get(segment)
+            if node is None:
+                return False
+        return self._END in node
+
+
+# 无需API密钥即可访问的路径（含API文档的静态资源和OAuth2回调页面）
+_PUBLIC_TRIE = PathTrie([
+    "/",
+    "/docs",
+    "/docs/*",
+    "/redoc",
+    "/redoc/*",
+    "/openapi.json",
+    "/system/health",
+    "/system/version",
+    "/api/system/health",
+    "/api/system/health/*"
+])
+
+# 不记录请求日志和请求指标的路径（探活、指标抓取和静态文档资源）
+_UNTRACKED_PATHS = frozenset({
+    "/api/system/health",
+    "/api/system/health/live",
+    "/api/system/health/ready",
+    "/api/system/metrics",
+    "/openapi.json",
+    "/favicon.ico"
+})
+
+# 未匹配到API路由（404、认证失败、文档页面等）的请求使用的指标端点标签
+_UNMATCHED_ENDPOINT = "unmatched"
+
+# 中间件读取的请求头名称（ASGI规范中请求头名称均为小写bytes）
+_USER_AGENT_HEADER = b"user-agent"
+_AUTH_HEADER = b"authorization"
+_API_KEY_HEADER = b"x-api-key"
+_BEARER_PREFIX = b"Bearer "
+
+# API密钥验证失败的响应体，导入时预先编码
+_UNAUTHORIZED_BODY = orjson.dumps({
+    "success": False,
+    "message": "未授权访问",
+    "error": "无效的API密钥"
+})
+
+# 内部错误的响应体前缀，导入时预先编码；请求ID只在发生错误时拼接到末尾
+_INTERNAL_ERROR_BODY_PREFIX = orjson.dumps({
+    "success": False,
+    "message": "内部服务器错误",
+    "error": "服务器处理请求时发生错误"
+})[:-1] + b',"request_id":'
+
+
+def _internal_error_body(request_id: str) -> bytes:
     """
-    指标收集中间件
-    自动收集API请求的指标数据
+    构造内部错误响应体
+    
+    Args:
+        request_id: 请求ID
+        
+    Returns:
+        bytes: JSON编码的响应体
     """
+    return _INTERNAL_ERROR_BODY_PREFIX + orjson.dumps(request_id) + b"}"
+
+# 请求ID生成器：进程号 + 自增序号，避免每个请求调用uuid4()读取系统随机数
+_PID = os.getpid()
+_ID_COUNTER = itertools.count()
+
+
+def _next_request_id() -> str:
+    """
+    生成请求ID
     
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
+    Returns:
+        str: 形如"{pid}-{序号}"的十六进制请求ID，进程内唯一
+    """
+    return f"{_PID:x}-{next(_ID_COUNTER):x}"
+
+
+def _reset_request_id_state() -> None:
+    """
+    fork后在子进程中重置请求ID状态
+    
+    预加载应用后fork的多进程worker会继承父进程的进程号缓存和计数器，
+    不重置会导致各worker生成相同的请求ID
+    """
+    global _PID, _ID_COUNTER
+    _PID = os.getpid()
+    _ID_COUNTER = itertools.count()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_request_id_state)
+
+
+class RequestLogWriter:
+    """
+    请求日志写入器
+    请求路径上只把日志放入有界队列，由后台任务统一写出，
+    避免日志处理器的I/O抖动影响请求延迟
+    """
+    
+    def __init__(self, maxsize: int = 4096):
         """
-        处理请求并收集指标
+        初始化请求日志写入器
         
         Args:
-            request: HTTP请求
-            call_next: 下一个处理函数
-            
-        Returns:
-            Response: HTTP响应
+            maxsize: 队列最大长度，队列满时丢弃新日志
+        """
+        self.maxsize = maxsize
+        self.queue: Optional[asyncio.Queue] = None
+        self.dropped_count = 0
+        self._task: Optional[asyncio.Task] = None
+    
+    def start(self) -> None:
+        """
+        启动后台写入任务（需在事件循环中调用）
+        """
+        if self._task is not None:
+            return
+        self.queue = asyncio.Queue(maxsize=self.maxsize)
+        self._task = asyncio.create_task(self._drain())
+    
+    async def stop(self) -> None:
+        """
+        写出队列中剩余的日志并停止后台任务
+        """
+        if self._task is None:
+            return
+        
+        await self.queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        
+        if self.dropped_count:
+            logger.warning("请求日志队列已满，共丢弃{}条日志", self.dropped_count)
+        
+        self._task = None
+        self.queue = None
+    
+    def submit(self, message: str, *args) -> None:
         """
-        start_time = time.time()
+        提交一条INFO级别的请求日志
         
-        # 获取端点信息
-        endpoint = request.url.path
-        method = request.method
+        Args:
+            message: loguru格式的日志模板
+            *args: 日志参数
+        """
+        if self.queue is None:
+            # 写入任务未启动（如未执行lifespan的测试环境）时直接写出
+            logger.info(message, *args)
+            return
         
         try:
-            # 处理请求
-            response = await call_next(request)
-            
-            # 计算处理时间
-            duration = time.time() - start_time
-            
-            # 确定状态
-            if response.status_code < 400:
-                status = "success"
-            elif response.status_code < 500:
-                status = "client_error"
-            else:
-                status = "server_error"
-            
-            # 记录指标
-            metrics_collector.record_request(endpoint, method, status, duration)
-            
-            return response
-            
-        except Exception as e:
-            # 计算处理时间
-            duration = time.time() - start_time
-            
-            # 记录错误指标
-            metrics_collector.record_request(endpoint, method, "error", duration)
-            
-            raise
+            self.queue.put_nowait((message, args))
+        except asyncio.QueueFull:
+            self.dropped_count += 1
+    
+    async def _drain(self) -> None:
+        """
+        后台任务：持续从队列取出日志并写出
+        """
+        while True:
+            message, args = await self.queue.get()
+            try:
+                logger.info(message, *args)
+            except Exception:
+                pass
+            finally:
+                self.queue.task_done()
+
+
+# 全局请求日志写入器
+request_log_writer = RequestLogWriter()
+
 
+def _json_response(status_code: int, body: bytes) -> Response:
+    """
+    构造JSON响应，响应体为已编码的bytes
+    
+    Args:
+        status_code: HTTP状态码
+        body: orjson编码后的响应体
+        
+    Returns:
+        Response: JSON响应
+    """
+    return Response(content=body, status_code=status_code, media_type="application/json")
 
-class SecurityMiddleware(BaseHTTPMiddleware):
+
+def _scan_headers(scope: Scope) -> Tuple[Optional[bytes], Optional[bytes], Optional[bytes]]:
     """
-    安全中间件
-    处理API密钥验证、请求限制等安全功能
+    单次遍历ASGI scope中的原始请求头，取出中间件需要的全部请求头，
+    避免构造Request对象和大小写无关的请求头字典
+    
+    Args:
+        scope: ASGI scope
+        
+    Returns:
+        Tuple[Optional[bytes], Optional[bytes], Optional[bytes]]:
+            User-Agent、Authorization、X-API-Key的原始值，不存在时为None
+    """
+    user_agent = None
+    auth_header = None
+    api_key_header = None
+    for name, value in scope["headers"]:
+        if name == _USER_AGENT_HEADER:
+            user_agent = value
+        elif name == _AUTH_HEADER:
+            auth_header = value
+        elif name == _API_KEY_HEADER:
+            api_key_header = value
+    return user_agent, auth_header, api_key_header
+
+
+class CombinedMiddleware:
+    """
+    API组合中间件
+    在一个纯ASGI中间件中依次完成请求日志、指标收集、API密钥验证和错误处理，
+    每个请求只经过一层协程调用和一个send包装
     """
     
-    def __init__(self, app, api_key: str = None):
+    def __init__(
+        self,
+        app: ASGIApp,
+        api_key: Optional[str] = None,
+        disable_timing: bool = False
+    ):
         """
-        初始化安全中间件
+        初始化组合中间件
         
         Args:
-            app: FastAPI应用实例
-            api_key: API密钥
+            app: 下一层ASGI应用
+            api_key: API密钥，为空时不进行验证
+            disable_timing: 是否禁用请求指标记录（基准测试模式）
         """
-        super().__init__(app)
+        self.app = app
         self.api_key = api_key
-        self.public_paths = {
-            "/",
-            "/docs",
-            "/redoc",
-            "/openapi.json",
-            "/system/health",
-            "/system/version"
-        }
+        # 配置在初始化时解析完毕，请求路径上只判断预先计算好的布尔值
+        self._check_auth = bool(api_key)
+        # 预先编码为bytes，直接与原始请求头比较
+        self._api_key_bytes = api_key.encode() if api_key else b""
+        self.disable_timing = disable_timing
     
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
+    def _is_authorized(
+        self,
+        path: str,
+        auth_header: Optional[bytes],
+        api_key_header: Optional[bytes]
+    ) -> bool:
         """
-        处理请求安全验证
+        检查请求是否通过API密钥验证
         
         Args:
-            request: HTTP请求
-            call_next: 下一个处理函数
+            path: 请求路径
+            auth_header: Authorization请求头原始值
+            api_key_header: X-API-Key请求头原始值
             
         Returns:
-            Response: HTTP响应
+            bool: 是否允许访问
         """
         # 检查是否为公开路径
-        if request.url.path in self.public_paths:
-            return await call_next(request)
+        if _PUBLIC_TRIE.match(path):
+            return True
         
-        # 如果设置了API密钥，进行验证
-        if self.api_key:
-            auth_header = request.headers.get("Authorization")
-            api_key_header = request.headers.get("X-API-Key")
-            
-            provided_key = None
-            if auth_header and auth_header.startswith("Bearer "):
-                provided_key = auth_header[7:]
-            elif api_key_header:
-                provided_key = api_key_header
-            
-            if not provided_key or provided_key != self.api_key:
-                return JSONResponse(
-                    status_code=401,
-                    content={
-                        "success": False,
-                        "message": "未授权访问",
-                        "error": "无效的API密钥"
-                    }
-                )
+        provided_key = None
+        if auth_header and auth_header.startswith(_BEARER_PREFIX):
+            provided_key = auth_header[len(_BEARER_PREFIX):]
+        elif api_key_header:
+            provided_key = api_key_header
         
-        return await call_next(request)
-
-
-class ErrorHandlingMiddleware(BaseHTTPMiddleware):
-    """
-    错误处理中间件
-    统一处理未捕获的异常
-    """
+        if not provided_key:
+            return False
+        
+        # 常量时间比较，避免时序侧信道
+        return hmac.compare_digest(provided_key, self._api_key_bytes)
     
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
         """
-        处理请求并捕获异常
+        处理请求：日志 -> 计时 -> 安全验证 -> 异常捕获 -> 指标记录
         
         Args:
-            request: HTTP请求
-            call_next: 下一个处理函数
-            
-        Returns:
-            Response: HTTP响应
+            scope: ASGI scope
+            receive: ASGI receive通道
+            send: ASGI send通道
         """
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        path = scope["path"]
+        
+        # 单次遍历原始请求头
+        user_agent, auth_header, api_key_header = _scan_headers(scope)
+        
+        # 未设置API密钥时不进行验证
+        authorized = (
+            not self._check_auth
+            or self._is_authorized(path, auth_header, api_key_header)
+        )
+        
+        # 探活、指标抓取等路径只做安全验证，不记录日志和指标
+        if path in _UNTRACKED_PATHS:
+            if not authorized:
+                await _json_response(401, _UNAUTHORIZED_BODY)(scope, receive, send)
+            else:
+                await self.app(scope, receive, send)
+            return
+        
+        # 生成请求ID，写入scope["state"]以便request.state.request_id读取，
+        # 同时写入上下文变量，供调用链中任意位置的日志读取
+        request_id = _next_request_id()
+        scope.setdefault("state", {})["request_id"] = request_id
+        request_id_token = request_id_var.set(request_id)
+        
+        # 记录请求开始时间
+        start_time = perf_counter()
+        
+        # 获取请求信息
+        method = scope["method"]
+        client = scope.get("client")
+        client_ip = client[0] if client else "unknown"
+        
+        # 记录请求信息
+        # 使用参数形式传递日志内容，级别被过滤时不会进行字符串格式化
+        request_log_writer.submit(
+            "请求开始 - ID: {}, 方法: {}, 路径: {}, 客户端: {}, User-Agent: {}",
+            request_id, method, path, client_ip,
+            user_agent.decode("latin-1") if user_agent is not None else "unknown"
+        )
+        
+        status_code = 500
+        response_started = False
+        
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code, response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+                status_code = message["status"]
+                
+                # 计算处理时间
+                process_time = perf_counter() - start_time
+                
+                # 添加响应头
+                headers = MutableHeaders(scope=message)
+                headers.append("X-Request-ID", request_id)
+                headers.append("X-Process-Time", f"{process_time:.3f}")
+                
+                # 记录响应信息
+                request_log_writer.submit(
+                    "请求完成 - ID: {}, 状态码: {}, 处理时间: {:.3f}s",
+                    request_id, status_code, process_time
+                )
+            await send(message)
+        
+        status = None
         try:
-            return await call_next(request)
-            
+            if not authorized:
+                response = _json_response(401, _UNAUTHORIZED_BODY)
+                await response(scope, receive, send_wrapper)
+            else:
+                await self.app(scope, receive, send_wrapper)
+                
         except HTTPException:
             # FastAPI的HTTP异常直接抛出
+            status = "error"
             raise
             
-        except Exception as e:
-            # 记录未捕获的异常
-            request_id = getattr(request.state, 'request_id', 'unknown')
-            logger.error(f"未捕获的异常 - 请求ID: {request_id}, 错误: {str(e)}", exc_info=True)
+        except Exception:
+            # 记录未捕获的异常，异常信息只写入日志（含完整堆栈），不进入响应体
+            logger.exception("未捕获的异常 - 请求ID: {}", get_request_id())
+            
+            # 响应已开始发送时无法再返回错误响应
+            if response_started:
+                status = "error"
+                raise
             
             # 返回统一的错误响应
-            return JSONResponse(
-                status_code=500,
-                content={
-                    "success": False,
-                    "message": "内部服务器错误",
-                    "error": "服务器处理请求时发生错误",
-                    "request_id": request_id
-                }
-            )
+            response = _json_response(500, _internal_error_body(request_id))
+            await response(scope, receive, send_wrapper)
+            
+        finally:
+            request_id_var.reset(request_id_token)
+            
+            if not self.disable_timing:
+                # 确定状态
+                if status is None:
+                    if status_code < 400:
+                        status = "success"
+                    elif status_code < 500:
+                        status = "client_error"
+                    else:
+                        status = "server_error"
+                
+                # 使用路由模板作为指标标签（如/api/documents/{id}），避免按原始路径产生无限多的标签；
+                # 路由匹配后FastAPI会把APIRoute写入scope["route"]
+                route = scope.get("route")
+                endpoint = route.path if route is not None else _UNMATCHED_ENDPOINT
+                
+                # 记录指标
+                _record_request(endpoint, method, status, perf_counter() - start_time)
 
 
 def setup_cors_middleware(app):
@@ -269,9 +497,11 @@ def setup_cors_middleware(app):
     Args:
         app: FastAPI应用实例
     """
+    cors_origins = settings.cors_origins
+    
     app.add_middleware(
         CORSMiddleware,
-        allow_origins=settings.cors_origins,
+        allow_origins=cors_origins,
         allow_credentials=True,
         allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
         allow_headers=["*"],
@@ -286,19 +516,18 @@ def setup_middleware(app):
     Args:
         app: FastAPI应用实例
     """
-    # 错误处理中间件（最外层）
-    app.add_middleware(ErrorHandlingMiddleware)
+    # 在设置阶段一次性读取配置，中间件实例只持有解析后的值
+    api_key = settings.api_key
+    disable_timing = settings.disable_request_timing
     
-    # 安全中间件
-    app.add_middleware(SecurityMiddleware, api_key=settings.api_key)
-    
-    # 指标收集中间件
-    app.add_middleware(MetricsMiddleware)
-    
-    # 请求日志中间件
-    app.add_middleware(RequestLoggingMiddleware)
+    # 组合中间件：请求日志、指标收集、安全验证、错误处理
+    app.add_middleware(
+        CombinedMiddleware,
+        api_key=api_key,
+        disable_timing=disable_timing
+    )
     
-    # CORS中间件（最内层）
+    # CORS中间件（最外层）
     setup_cors_middleware(app)
     
     logger.info("所有中间件设置完成")
\ No newline at end of file
@@ -5,9 +5,11 @@ API数据模型
 
 from typing import List, Dict, Any, Optional, Union
 from datetime import datetime
-from pydantic import BaseModel, Field, validator
+from pydantic import BaseModel, ConfigDict, Field, field_validator, model_validator
 from enum import Enum
 
+from ..utils.clock import cached_clock
+
 
 class ProcessingStatus(str, Enum):
     """处理状态枚举"""
@@ -30,7 +32,7 @@ class BaseResponse(BaseModel):
     """基础响应模型"""
     success: bool = Field(..., description="操作是否成功")
     message: str = Field(..., description="响应消息")
-    timestamp: datetime = Field(default_factory=datetime.now, description="响应时间戳")
+    timestamp: datetime = Field(default_factory=cached_clock.now, description="响应时间戳")
 
 
 class ErrorResponse(BaseResponse):
@@ -58,12 +60,12 @@ class DocumentProcessRequest(BaseModel):
     directory_path: Optional[str] = Field(None, description="目录路径")
     overwrite: bool = Field(default=False, description="是否覆盖已存在的文档")
     
-    @validator('file_path', 'directory_path')
-    def validate_paths(cls, v, values):
+    @model_validator(mode='after')
+    def validate_paths(self) -> 'DocumentProcessRequest':
         """验证路径参数"""
-        if not values.get('file_path') and not values.get('directory_path'):
+        if not self.file_path and not self.directory_path:
             raise ValueError("必须提供file_path或directory_path中的一个")
-        return v
+        return self
 
 
 class DocumentProcessResponse(BaseResponse):
@@ -111,8 +113,9 @@ class QuestionRequest(BaseModel):
     )
     use_cache: bool = Field(default=True, description="是否使用缓存")
     
-    @validator('question')
-    def validate_question(cls, v):
+    @field_validator('question')
+    @classmethod
+    def validate_question(cls, v: str) -> str:
         """验证问题内容"""
         if not v.strip():
             raise ValueError("问题不能为空")
@@ -121,6 +124,8 @@ class QuestionRequest(BaseModel):
 
 class ContextDocument(BaseModel):
     """上下文文档"""
+    model_config = ConfigDict(frozen=True)
+    
     content: str = Field(..., description="文档内容")
     metadata: Dict[str, Any] = Field(..., description="文档元数据")
     similarity_score: float = Field(..., description="相似度分数")
@@ -129,6 +134,8 @@ class ContextDocument(BaseModel):
 
 class TokenCount(BaseModel):
     """Token统计"""
+    model_config = ConfigDict(frozen=True)
+    
     prompt_tokens: int = Field(default=0, description="提示词Token数")
     completion_tokens: int = Field(default=0, description="生成Token数")
     total_tokens: int = Field(default=0, description="总Token数")
@@ -136,6 +143,8 @@ class TokenCount(BaseModel):
 
 class RetrievalStats(BaseModel):
     """检索统计信息"""
+    model_config = ConfigDict(frozen=True)
+    
     retrieved_count: int = Field(..., description="检索到的文档数量")
     similarity_threshold: float = Field(..., description="使用的相似度阈值")
     avg_similarity: float = Field(..., description="平均相似度")
@@ -156,7 +165,7 @@ class QuestionResponse(BaseResponse):
 
 class BatchQuestionRequest(BaseModel):
     """批量问答请求"""
-    questions: List[str] = Field(..., min_items=1, max_items=10, description="问题列表")
+    questions: List[str] = Field(..., min_length=1, max_length=10, description="问题列表")
     k: Optional[int] = Field(default=None, ge=1, le=20, description="检索文档数量")
     similarity_threshold: Optional[float] = Field(
         default=None, 
@@ -166,8 +175,9 @@ class BatchQuestionRequest(BaseModel):
     )
     use_cache: bool = Field(default=True, description="是否使用缓存")
     
-    @validator('questions')
-    def validate_questions(cls, v):
+    @field_validator('questions')
+    @classmethod
+    def validate_questions(cls, v: List[str]) -> List[str]:
         """验证问题列表"""
         if not v:
             raise ValueError("问题列表不能为空")
@@ -242,7 +252,7 @@ class FileUploadResponse(BaseResponse):
     file_path: str = Field(..., description="文件保存路径")
     file_size: int = Field(..., description="文件大小")
     file_type: str = Field(..., description="文件类型")
-    upload_time: datetime = Field(..., description="上传时间")
+    upload_time: datetime = Field(default_factory=cached_clock.now, description="上传时间")
 
 
 class FileListResponse(BaseResponse):
@@ -275,7 +285,7 @@ class WebSocketMessage(BaseModel):
     """WebSocket消息"""
     type: str = Field(..., description="消息类型")
     data: Dict[str, Any] = Field(..., description="消息数据")
-    timestamp: datetime = Field(default_factory=datetime.now, description="消息时间戳")
+    timestamp: datetime = Field(default_factory=cached_clock.now, description="消息时间戳")
 
 
 class ProcessingProgress(BaseModel):
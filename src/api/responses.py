@@ -0,0 +1,33 @@
+"""
+API响应类
+提供直接序列化Pydantic模型的响应类型，跳过FastAPI的响应模型校验和jsonable_encoder
+"""
+
+from typing import Any
+
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel
+
+
+class PydanticResponse(ORJSONResponse):
+    """
+    Pydantic模型响应
+    
+    content为BaseModel时使用pydantic-core的model_dump_json直接编码，
+    其他内容按ORJSONResponse处理。路由需去掉response_model，
+    并通过responses={200: {"model": ...}}保留OpenAPI文档
+    """
+    
+    def render(self, content: Any) -> bytes:
+        """
+        编码响应体
+        
+        Args:
+            content: 响应内容
+            
+        Returns:
+            bytes: JSON编码后的响应体
+        """
+        if isinstance(content, BaseModel):
+            return content.model_dump_json().encode("utf-8")
+        return super().render(content)
@@ -3,18 +3,22 @@
 提供文档上传、处理、删除等功能的RESTful接口
 """
 
+import asyncio
+import heapq
 import os
-import uuid
-from typing import List, Dict, Any
+import secrets
+import time
+from collections import deque
+from operator import itemgetter
+from typing import BinaryIO, Deque, FrozenSet, Iterator, List, Dict, Any, Optional, Tuple
 from pathlib import Path
-import aiofiles
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, BackgroundTasks
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, BackgroundTasks, Query
 from fastapi.responses import JSONResponse
 
 from ...core.rag_engine import rag_engine
-from ...config.settings import get_settings
+from ...config.settings import add_settings_listener, get_settings
 from ...utils.logger import get_logger
-from ...utils.metrics import metrics_collector
+from ...utils.metrics import request_metrics_buffer
 from ..models import (
     DocumentProcessRequest,
     DocumentProcessResponse,
@@ -31,6 +35,49 @@ settings = get_settings()
 
 router = APIRouter(prefix="/documents", tags=["文档管理"])
 
+# 上传文件分块读写大小（64 KiB）
+UPLOAD_CHUNK_SIZE = 1 << 16
+
+# 批量上传时同时写入的最大文件数
+BATCH_UPLOAD_CONCURRENCY = 4
+
+# 上传读缓冲池：线程池中的写入任务复用固定大小的缓冲区（deque的append/pop是线程安全的）
+_upload_buffer_pool: Deque[bytearray] = deque(maxlen=32)
+
+# 文档列表缓存：(目录, 是否包含处理状态, 数量限制, 是否只统计) -> (目录mtime, 缓存时间, 响应)
+# 目录mtime只反映直接子项的变化，深层目录的变化依靠TTL兜底
+_LIST_CACHE_TTL = 5.0
+_LIST_CACHE_MAX_ENTRIES = 64
+_list_cache: Dict[Tuple[str, bool, Optional[int], bool], Tuple[float, float, FileListResponse]] = {}
+
+# 文档列表按修改时间排序的键函数
+_modified_time_key = itemgetter("modified_time")
+
+# 上传相关配置的模块级副本，由reload_settings()在导入时计算
+_SUPPORTED_EXTS: FrozenSet[str] = frozenset()
+_SUPPORTED_FORMATS_STR = ""
+_MAX_FILE_SIZE = 0
+
+
+def reload_settings() -> None:
+    """
+    重新读取上传相关配置
+    
+    热路径上使用模块级副本而不是每次访问settings；update_settings会自动调用本函数，
+    直接修改settings属性后（如测试中）需手动调用
+    """
+    global _SUPPORTED_EXTS, _SUPPORTED_FORMATS_STR, _MAX_FILE_SIZE
+    # 支持的文件扩展名集合（统一为带点号的小写形式，配置中可写"pdf"或".pdf"）
+    _SUPPORTED_EXTS = frozenset(
+        f".{fmt.lower().lstrip('.')}" for fmt in settings.supported_formats
+    )
+    _SUPPORTED_FORMATS_STR = ", ".join(settings.supported_formats)
+    _MAX_FILE_SIZE = settings.max_file_size
+
+
+reload_settings()
+add_settings_listener(reload_settings)
+
 
 def get_upload_dir() -> Path:
     """
@@ -44,6 +91,19 @@ def get_upload_dir() -> Path:
     return upload_dir
 
 
+def get_file_extension(filename: str) -> str:
+    """
+    获取小写的文件扩展名
+    
+    Args:
+        filename: 文件名
+        
+    Returns:
+        str: 带点号的小写扩展名，如".pdf"；无扩展名时返回空字符串
+    """
+    return os.path.splitext(filename)[1].lower()
+
+
 def validate_file_type(filename: str) -> bool:
     """
     验证文件类型是否支持
@@ -54,36 +114,118 @@ def validate_file_type(filename: str) -> bool:
     Returns:
         bool: 是否支持该文件类型
     """
-    file_ext = Path(filename).suffix.lower()
-    return file_ext in settings.supported_formats
+    return get_file_extension(filename) in _SUPPORTED_EXTS
 
 
-async def save_uploaded_file(file: UploadFile, upload_dir: Path) -> Dict[str, Any]:
+def _iter_files(root: str) -> Iterator[os.DirEntry]:
+    """
+    递归遍历目录下的所有普通文件
+    
+    使用os.scandir直接复用目录项中的文件类型信息，不跟随符号链接
+    
+    Args:
+        root: 根目录路径
+        
+    Yields:
+        os.DirEntry: 文件目录项
+    """
+    with os.scandir(root) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from _iter_files(entry.path)
+            elif entry.is_file(follow_symlinks=False):
+                yield entry
+
+
+def _write_upload(source: BinaryIO, file_path: Path, max_file_size: int) -> int:
+    """
+    将上传文件内容分块写入磁盘（同步阻塞，需在线程池中调用）
+    
+    读取时复用缓冲池中的缓冲区，避免每个分块都分配新的bytes对象
+    
+    Args:
+        source: 上传文件的底层文件对象
+        file_path: 目标文件路径
+        max_file_size: 文件大小上限（字节）
+        
+    Returns:
+        int: 写入的文件大小
+        
+    Raises:
+        HTTPException: 文件大小超过限制时抛出413
+    """
+    try:
+        buffer = _upload_buffer_pool.pop()
+    except IndexError:
+        buffer = bytearray(UPLOAD_CHUNK_SIZE)
+    
+    # SpooledTemporaryFile从Python 3.11起才提供readinto，旧版本退回read后拷贝到缓冲区
+    readinto = getattr(source, "readinto", None)
+    if readinto is None:
+        def readinto(target: memoryview) -> int:
+            data = source.read(len(target))
+            target[:len(data)] = data
+            return len(data)
+    
+    file_size = 0
+    try:
+        with memoryview(buffer) as view, open(file_path, 'wb', buffering=UPLOAD_CHUNK_SIZE) as f:
+            while read_size := readinto(view):
+                file_size += read_size
+                if file_size > max_file_size:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"文件大小超过限制 ({max_file_size} 字节)"
+                    )
+                f.write(view[:read_size])
+    except BaseException:
+        file_path.unlink(missing_ok=True)
+        raise
+    finally:
+        _upload_buffer_pool.append(buffer)
+    
+    return file_size
+
+
+async def save_uploaded_file(
+    file: UploadFile,
+    upload_dir: Path,
+    max_file_size: Optional[int] = None
+) -> Dict[str, Any]:
     """
     保存上传的文件
     
+    整个分块读写过程在一次线程池调用中完成，边写边累计文件大小，
+    超过大小限制时立即中止并删除已写入的部分文件，文件内容只读取一遍
+    
     Args:
         file: 上传的文件
         upload_dir: 上传目录
+        max_file_size: 文件大小上限（字节），默认使用配置中的max_file_size
         
     Returns:
         Dict[str, Any]: 文件信息
+        
+    Raises:
+        HTTPException: 文件大小超过限制时抛出413
     """
     # 生成唯一文件名
     file_ext = Path(file.filename).suffix
-    unique_filename = f"{uuid.uuid4()}{file_ext}"
+    unique_filename = f"{secrets.token_hex(16)}{file_ext}"
     file_path = upload_dir / unique_filename
     
     # 保存文件
-    async with aiofiles.open(file_path, 'wb') as f:
-        content = await file.read()
-        await f.write(content)
+    if max_file_size is None:
+        max_file_size = _MAX_FILE_SIZE
+    file_size = await asyncio.to_thread(
+        _write_upload, file.file, file_path, max_file_size
+    )
     
     return {
         "original_filename": file.filename,
         "saved_filename": unique_filename,
         "file_path": str(file_path),
-        "file_size": len(content),
+        "file_size": file_size,
         "content_type": file.content_type
     }
 
@@ -108,26 +250,15 @@ async def upload_document(
         if not validate_file_type(file.filename):
             raise HTTPException(
                 status_code=400,
-                detail=f"不支持的文件格式。支持的格式: {', '.join(settings.supported_formats)}"
-            )
-        
-        # 验证文件大小
-        content = await file.read()
-        if len(content) > settings.max_file_size:
-            raise HTTPException(
-                status_code=400,
-                detail=f"文件大小超过限制 ({settings.max_file_size} 字节)"
+                detail=f"不支持的文件格式。支持的格式: {_SUPPORTED_FORMATS_STR}"
             )
         
-        # 重置文件指针
-        await file.seek(0)
-        
-        # 保存文件
+        # 保存文件（写入过程中校验文件大小）
         upload_dir = get_upload_dir()
-        file_info = await save_uploaded_file(file, upload_dir)
+        file_info = await save_uploaded_file(file, upload_dir, _MAX_FILE_SIZE)
         
         # 记录指标
-        metrics_collector.record_request("upload", "POST", "success", 0)
+        request_metrics_buffer.record("upload", "POST", "success", 0)
         
         response = FileUploadResponse(
             success=True,
@@ -135,22 +266,21 @@ async def upload_document(
             filename=file_info["original_filename"],
             file_path=file_info["file_path"],
             file_size=file_info["file_size"],
-            file_type=file_info["content_type"] or "unknown",
-            upload_time=None  # 会自动设置为当前时间
+            file_type=file_info["content_type"] or "unknown"
         )
         
         # 如果启用自动处理，在后台处理文档
         if auto_process:
             # 这里可以添加后台任务处理逻辑
-            logger.info(f"将在后台自动处理文档: {file_info['file_path']}")
+            logger.info("将在后台自动处理文档: {}", file_info['file_path'])
         
         return response
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"文件上传失败: {e}")
-        metrics_collector.record_request("upload", "POST", "error", 0)
+        logger.error("文件上传失败: {}", e)
+        request_metrics_buffer.record("upload", "POST", "error", 0)
         raise HTTPException(status_code=500, detail=f"文件上传失败: {str(e)}")
 
 
@@ -168,20 +298,21 @@ async def process_document(
         DocumentProcessResponse: 处理结果
     """
     try:
+        # 不预先检查路径是否存在，由实际读取时抛出的FileNotFoundError映射为404
         if request.file_path:
             # 处理单个文件
-            if not os.path.exists(request.file_path):
+            try:
+                result = await rag_engine.process_document(request.file_path)
+            except FileNotFoundError:
                 raise HTTPException(status_code=404, detail="文件不存在")
-            
-            result = await rag_engine.process_document(request.file_path)
-            
+                
         elif request.directory_path:
             # 处理目录
-            if not os.path.exists(request.directory_path):
+            try:
+                result = await rag_engine.process_directory(request.directory_path)
+            except FileNotFoundError:
                 raise HTTPException(status_code=404, detail="目录不存在")
-            
-            result = await rag_engine.process_directory(request.directory_path)
-            
+                
         else:
             raise HTTPException(status_code=400, detail="必须提供file_path或directory_path")
         
@@ -189,7 +320,7 @@ async def process_document(
             raise HTTPException(status_code=500, detail=result.get("message", "处理失败"))
         
         # 记录指标
-        metrics_collector.record_request("process", "POST", "success", 0)
+        request_metrics_buffer.record("process", "POST", "success", 0)
         
         return DocumentProcessResponse(
             success=True,
@@ -205,8 +336,8 @@ async def process_document(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"文档处理失败: {e}")
-        metrics_collector.record_request("process", "POST", "error", 0)
+        logger.error("文档处理失败: {}", e)
+        request_metrics_buffer.record("process", "POST", "error", 0)
         raise HTTPException(status_code=500, detail=f"文档处理失败: {str(e)}")
 
 
@@ -230,7 +361,7 @@ async def delete_document(
             raise HTTPException(status_code=500, detail=result.get("message", "删除失败"))
         
         # 记录指标
-        metrics_collector.record_request("delete", "DELETE", "success", 0)
+        request_metrics_buffer.record("delete", "DELETE", "success", 0)
         
         return DocumentDeleteResponse(
             success=True,
@@ -242,15 +373,17 @@ async def delete_document(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"文档删除失败: {e}")
-        metrics_collector.record_request("delete", "DELETE", "error", 0)
+        logger.error("文档删除失败: {}", e)
+        request_metrics_buffer.record("delete", "DELETE", "error", 0)
         raise HTTPException(status_code=500, detail=f"文档删除失败: {str(e)}")
 
 
 @router.get("/list", response_model=FileListResponse, summary="获取文档列表")
 async def list_documents(
     directory: str = "data/uploads",
-    include_processed: bool = False
+    include_processed: bool = False,
+    limit: Optional[int] = Query(None, ge=1),
+    summary_only: bool = False
 ) -> FileListResponse:
     """
     获取文档列表
@@ -258,12 +391,16 @@ async def list_documents(
     Args:
         directory: 目录路径
         include_processed: 是否包含已处理状态
+        limit: 只返回最近修改的前limit个文档，默认返回全部
+        summary_only: 只统计文档数量和总大小，不返回文档明细
         
     Returns:
         FileListResponse: 文档列表
     """
     try:
-        if not os.path.exists(directory):
+        try:
+            root_mtime = os.stat(directory).st_mtime
+        except FileNotFoundError:
             return FileListResponse(
                 success=True,
                 message="目录不存在",
@@ -272,45 +409,77 @@ async def list_documents(
                 total_size=0
             )
         
-        files = []
-        total_size = 0
-        
-        for file_path in Path(directory).rglob("*"):
-            if file_path.is_file() and validate_file_type(file_path.name):
-                file_stat = file_path.stat()
-                file_info = {
-                    "filename": file_path.name,
-                    "file_path": str(file_path),
-                    "file_size": file_stat.st_size,
-                    "modified_time": file_stat.st_mtime,
-                    "file_type": file_path.suffix.lower()
-                }
-                
-                # 如果需要包含处理状态，可以在这里查询
-                if include_processed:
-                    # 这里可以添加查询文档是否已处理的逻辑
-                    file_info["processed"] = False
-                
-                files.append(file_info)
-                total_size += file_stat.st_size
-        
-        # 按修改时间排序
-        files.sort(key=lambda x: x["modified_time"], reverse=True)
+        # 目录未变化且缓存未过期时直接返回缓存的列表
+        cache_key = (directory, include_processed, limit, summary_only)
+        now = time.monotonic()
+        cached = _list_cache.get(cache_key)
+        if cached is not None:
+            cached_mtime, cached_at, cached_response = cached
+            if cached_mtime == root_mtime and now - cached_at < _LIST_CACHE_TTL:
+                request_metrics_buffer.record("list", "GET", "success", 0)
+                return cached_response
+        
+        if summary_only:
+            # 只统计时不构建文档明细，也无需排序
+            files = []
+            total_count = 0
+            total_size = 0
+            for entry in _iter_files(directory):
+                if get_file_extension(entry.name) in _SUPPORTED_EXTS:
+                    total_count += 1
+                    total_size += entry.stat().st_size
+        else:
+            files = []
+            total_size = 0
+            
+            for entry in _iter_files(directory):
+                file_ext = get_file_extension(entry.name)
+                if file_ext in _SUPPORTED_EXTS:
+                    file_stat = entry.stat()
+                    file_size = file_stat.st_size
+                    file_info = {
+                        "filename": entry.name,
+                        "file_path": entry.path,
+                        "file_size": file_size,
+                        "modified_time": file_stat.st_mtime,
+                        "file_type": file_ext
+                    }
+                    
+                    # 如果需要包含处理状态，可以在这里查询
+                    if include_processed:
+                        # 这里可以添加查询文档是否已处理的逻辑
+                        file_info["processed"] = False
+                    
+                    files.append(file_info)
+                    total_size += file_size
+            
+            # 按修改时间排序，只需要前limit个时使用部分排序
+            total_count = len(files)
+            if limit is not None and limit < total_count:
+                files = heapq.nlargest(limit, files, key=_modified_time_key)
+            else:
+                files.sort(key=_modified_time_key, reverse=True)
         
         # 记录指标
-        metrics_collector.record_request("list", "GET", "success", 0)
+        request_metrics_buffer.record("list", "GET", "success", 0)
         
-        return FileListResponse(
+        response = FileListResponse(
             success=True,
-            message=f"找到 {len(files)} 个文档",
+            message=f"找到 {total_count} 个文档",
             files=files,
-            total_count=len(files),
+            total_count=total_count,
             total_size=total_size
         )
         
+        if len(_list_cache) >= _LIST_CACHE_MAX_ENTRIES and cache_key not in _list_cache:
+            _list_cache.clear()
+        _list_cache[cache_key] = (root_mtime, now, response)
+        
+        return response
+        
     except Exception as e:
-        logger.error(f"获取文档列表失败: {e}")
-        metrics_collector.record_request("list", "GET", "error", 0)
+        logger.error("获取文档列表失败: {}", e)
+        request_metrics_buffer.record("list", "GET", "error", 0)
         raise HTTPException(status_code=500, detail=f"获取文档列表失败: {str(e)}")
 
 
@@ -338,10 +507,76 @@ async def get_supported_formats() -> Dict[str, List[str]]:
         }
         
     except Exception as e:
-        logger.error(f"获取支持格式失败: {e}")
+        logger.error("获取支持格式失败: {}", e)
         raise HTTPException(status_code=500, detail=f"获取支持格式失败: {str(e)}")
 
 
+async def _save_batch_file(file: UploadFile, upload_dir: Path) -> Dict[str, Any]:
+    """
+    校验并保存批量上传中的单个文件
+    
+    Args:
+        file: 上传的文件
+        upload_dir: 上传目录
+        
+    Returns:
+        Dict[str, Any]: 单个文件的上传结果
+    """
+    try:
+        # 验证文件类型
+        if not validate_file_type(file.filename):
+            return {
+                "filename": file.filename,
+                "success": False,
+                "error": f"不支持的文件格式: {get_file_extension(file.filename)}"
+            }
+        
+        # 保存文件（写入过程中校验文件大小）
+        try:
+            file_info = await save_uploaded_file(file, upload_dir, _MAX_FILE_SIZE)
+        except HTTPException:
+            return {
+                "filename": file.filename,
+                "success": False,
+                "error": "文件大小超过限制"
+            }
+        
+        return {
+            "filename": file.filename,
+            "success": True,
+            "file_path": file_info["file_path"],
+            "file_size": file_info["file_size"]
+        }
+        
+    except Exception as e:
+        logger.error("上传文件失败 {}: {}", file.filename, e)
+        return {
+            "filename": file.filename,
+            "success": False,
+            "error": str(e)
+        }
+
+
+async def _save_batch_file_limited(
+    semaphore: asyncio.Semaphore,
+    file: UploadFile,
+    upload_dir: Path
+) -> Dict[str, Any]:
+    """
+    在并发上限内保存批量上传中的单个文件
+    
+    Args:
+        semaphore: 限制并发写入数的信号量
+        file: 上传的文件
+        upload_dir: 上传目录
+        
+    Returns:
+        Dict[str, Any]: 单个文件的上传结果
+    """
+    async with semaphore:
+        return await _save_batch_file(file, upload_dir)
+
+
 @router.post("/batch-upload", summary="批量上传文档")
 async def batch_upload_documents(
     files: List[UploadFile] = File(..., description="要上传的文档文件列表"),
@@ -362,58 +597,23 @@ async def batch_upload_documents(
             raise HTTPException(status_code=400, detail="批量上传文件数量不能超过10个")
         
         upload_dir = get_upload_dir()
-        results = []
-        success_count = 0
-        error_count = 0
         
-        for file in files:
-            try:
-                # 验证文件类型
-                if not validate_file_type(file.filename):
-                    results.append({
-                        "filename": file.filename,
-                        "success": False,
-                        "error": f"不支持的文件格式: {Path(file.filename).suffix}"
-                    })
-                    error_count += 1
-                    continue
-                
-                # 验证文件大小
-                content = await file.read()
-                if len(content) > settings.max_file_size:
-                    results.append({
-                        "filename": file.filename,
-                        "success": False,
-                        "error": "文件大小超过限制"
-                    })
-                    error_count += 1
-                    continue
-                
-                # 重置文件指针
-                await file.seek(0)
-                
-                # 保存文件
-                file_info = await save_uploaded_file(file, upload_dir)
-                
-                results.append({
-                    "filename": file.filename,
-                    "success": True,
-                    "file_path": file_info["file_path"],
-                    "file_size": file_info["file_size"]
-                })
-                success_count += 1
-                
-            except Exception as e:
-                logger.error(f"上传文件失败 {file.filename}: {e}")
-                results.append({
-                    "filename": file.filename,
-                    "success": False,
-                    "error": str(e)
-                })
-                error_count += 1
+        # 并发保存文件，同时写入的文件数不超过并发上限
+        semaphore = asyncio.Semaphore(min(len(files), BATCH_UPLOAD_CONCURRENCY) or 1)
+        outcomes = await asyncio.gather(
+            *(_save_batch_file_limited(semaphore, file, upload_dir) for file in files),
+            return_exceptions=True
+        )
+        results = [
+            {"filename": file.filename, "success": False, "error": str(outcome)}
+            if isinstance(outcome, BaseException) else outcome
+            for file, outcome in zip(files, outcomes)
+        ]
+        success_count = sum(1 for result in results if result["success"])
+        error_count = len(results) - success_count
         
         # 记录指标
-        metrics_collector.record_request("batch-upload", "POST", "success", 0)
+        request_metrics_buffer.record("batch-upload", "POST", "success", 0)
         
         return {
             "success": True,
@@ -427,8 +627,8 @@ async def batch_upload_documents(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"批量上传失败: {e}")
-        metrics_collector.record_request("batch-upload", "POST", "error", 0)
+        logger.error("批量上传失败: {}", e)
+        request_metrics_buffer.record("batch-upload", "POST", "error", 0)
         raise HTTPException(status_code=500, detail=f"批量上传失败: {str(e)}")
 
 
@@ -451,5 +651,5 @@ async def get_document_stats() -> Dict[str, Any]:
         }
         
     except Exception as e:
-        logger.error(f"获取文档统计失败: {e}")
+        logger.error("获取文档统计失败: {}", e)
         raise HTTPException(status_code=500, detail=f"获取文档统计失败: {str(e)}")
\ No newline at end of file
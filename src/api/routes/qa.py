@@ -3,16 +3,17 @@
 提供基于RAG的问答功能的RESTful接口
 """
 
+import asyncio
 import time
 from typing import Dict, Any, List
 from fastapi import APIRouter, HTTPException, Depends
 from fastapi.responses import StreamingResponse
-import json
+import orjson
 
 from ...core.rag_engine import rag_engine
 from ...config.settings import get_settings
 from ...utils.logger import get_logger
-from ...utils.metrics import metrics_collector
+from ...utils.metrics import request_metrics_buffer
 from ..models import (
     QuestionRequest,
     QuestionResponse,
@@ -29,32 +30,79 @@ settings = get_settings()
 
 router = APIRouter(prefix="/qa", tags=["问答服务"])
 
+# SSE事件帧的前后缀
+_SSE_PREFIX = b"data: "
+_SSE_SUFFIX = b"\n\n"
+
+# token事件只有content字段变化，前后缀预先编码
+_SSE_TOKEN_PREFIX = _SSE_PREFIX + b'{"type":"token","content":'
+_SSE_TOKEN_SUFFIX = b"}" + _SSE_SUFFIX
+
+
+def _sse_event(data: Dict[str, Any]) -> bytes:
+    """
+    编码SSE事件帧
+    
+    Args:
+        data: 事件数据
+        
+    Returns:
+        bytes: UTF-8编码的事件帧
+    """
+    return _SSE_PREFIX + orjson.dumps(data) + _SSE_SUFFIX
+
+
+def _sse_token_event(token: str) -> bytes:
+    """
+    编码单个token的SSE事件帧
+    
+    Args:
+        token: 生成的文本片段
+        
+    Returns:
+        bytes: UTF-8编码的事件帧
+    """
+    return _SSE_TOKEN_PREFIX + orjson.dumps(token) + _SSE_TOKEN_SUFFIX
+
+
+# 内容固定的阶段事件在导入时编码一次
+_SSE_START = _sse_event({'type': 'start', 'message': '开始处理问题'})
+_SSE_RETRIEVAL = _sse_event({'type': 'retrieval', 'message': '正在检索相关文档'})
+_SSE_GENERATION = _sse_event({'type': 'generation', 'message': '正在生成答案'})
+_SSE_END = _sse_event({'type': 'end', 'message': '处理完成'})
+
 
 def format_question_response(result: Dict[str, Any]) -> QuestionResponse:
     """
     格式化问答响应
     
+    结果来自RAG引擎内部，字段类型已确定，使用model_construct跳过重复校验
+    
     Args:
         result: RAG引擎返回的结果
         
     Returns:
         QuestionResponse: 格式化后的响应
     """
+    get = result.get
+    
     # 格式化上下文文档
-    context_documents = []
-    for doc in result.get("context_documents", []):
-        context_documents.append(ContextDocument(
+    construct_document = ContextDocument.model_construct
+    context_documents = [
+        construct_document(
             content=doc.get("content", ""),
-            metadata=doc.get("metadata", {}),
+            metadata=doc.get("metadata") or {},
             similarity_score=doc.get("similarity_score", 0.0),
             rank=doc.get("rank", 0)
-        ))
+        )
+        for doc in get("context_documents") or ()
+    ]
     
     # 格式化Token统计
     token_count = None
-    if "token_count" in result:
-        token_data = result["token_count"]
-        token_count = TokenCount(
+    token_data = get("token_count")
+    if token_data is not None:
+        token_count = TokenCount.model_construct(
             prompt_tokens=token_data.get("prompt_tokens", 0),
             completion_tokens=token_data.get("completion_tokens", 0),
             total_tokens=token_data.get("total_tokens", 0)
@@ -62,24 +110,24 @@ def format_question_response(result: Dict[str, Any]) -> QuestionResponse:
     
     # 格式化检索统计
     retrieval_stats = None
-    if "retrieval_stats" in result:
-        stats_data = result["retrieval_stats"]
-        retrieval_stats = RetrievalStats(
+    stats_data = get("retrieval_stats")
+    if stats_data is not None:
+        retrieval_stats = RetrievalStats.model_construct(
             retrieved_count=stats_data.get("retrieved_count", 0),
             similarity_threshold=stats_data.get("similarity_threshold", 0.0),
             avg_similarity=stats_data.get("avg_similarity", 0.0)
         )
     
-    return QuestionResponse(
-        success=result.get("success", False),
-        message=result.get("message", ""),
-        question=result.get("question", ""),
-        answer=result.get("answer", ""),
+    return QuestionResponse.model_construct(
+        success=get("success", False),
+        message=get("message", ""),
+        question=get("question", ""),
+        answer=get("answer", ""),
         context_documents=context_documents,
-        generation_time=result.get("generation_time"),
-        total_time=result.get("total_time"),
-        model=result.get("model"),
-        from_cache=result.get("from_cache", False),
+        generation_time=get("generation_time"),
+        total_time=get("total_time"),
+        model=get("model"),
+        from_cache=get("from_cache", False),
         token_count=token_count,
         retrieval_stats=retrieval_stats
     )
@@ -98,9 +146,11 @@ async def ask_question(
     Returns:
         QuestionResponse: 问答结果
     """
+    # 使用事件循环的单调时钟计时，不受系统时间调整影响
+    loop = asyncio.get_running_loop()
+    start_time = loop.time()
+    
     try:
-        start_time = time.time()
-        
         # 调用RAG引擎处理问题
         result = await rag_engine.answer_question(
             question=request.question,
@@ -110,11 +160,11 @@ async def ask_question(
         )
         
         # 记录指标
-        processing_time = time.time() - start_time
+        processing_time = loop.time() - start_time
         if result.get("success"):
-            metrics_collector.record_request("ask", "POST", "success", processing_time)
+            request_metrics_buffer.record("ask", "POST", "success", processing_time)
         else:
-            metrics_collector.record_request("ask", "POST", "error", processing_time)
+            request_metrics_buffer.record("ask", "POST", "error", processing_time)
         
         # 格式化响应
         response = format_question_response(result)
@@ -127,8 +177,8 @@ async def ask_question(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"问答处理失败: {e}")
-        metrics_collector.record_request("ask", "POST", "error", time.time() - start_time)
+        logger.error("问答处理失败: {}", e)
+        request_metrics_buffer.record("ask", "POST", "error", loop.time() - start_time)
         raise HTTPException(status_code=500, detail=f"问答处理失败: {str(e)}")
 
 
@@ -145,9 +195,11 @@ async def batch_ask_questions(
     Returns:
         BatchQuestionResponse: 批量问答结果
     """
+    # 使用事件循环的单调时钟计时，不受系统时间调整影响
+    loop = asyncio.get_running_loop()
+    start_time = loop.time()
+    
     try:
-        start_time = time.time()
-        
         # 调用RAG引擎批量处理问题
         results = await rag_engine.batch_answer_questions(
             questions=request.questions,
@@ -157,23 +209,14 @@ async def batch_ask_questions(
         )
         
         # 格式化响应
-        formatted_results = []
-        success_count = 0
-        error_count = 0
-        
-        for result in results:
-            formatted_result = format_question_response(result)
-            formatted_results.append(formatted_result)
-            
-            if formatted_result.success:
-                success_count += 1
-            else:
-                error_count += 1
+        formatted_results = [format_question_response(result) for result in results]
+        success_count = sum(1 for result in formatted_results if result.success)
+        error_count = len(formatted_results) - success_count
         
-        total_time = time.time() - start_time
+        total_time = loop.time() - start_time
         
         # 记录指标
-        metrics_collector.record_request("batch-ask", "POST", "success", total_time)
+        request_metrics_buffer.record("batch-ask", "POST", "success", total_time)
         
         return BatchQuestionResponse(
             success=True,
@@ -186,8 +229,8 @@ async def batch_ask_questions(
         )
         
     except Exception as e:
-        logger.error(f"批量问答处理失败: {e}")
-        metrics_collector.record_request("batch-ask", "POST", "error", time.time() - start_time)
+        logger.error("批量问答处理失败: {}", e)
+        request_metrics_buffer.record("batch-ask", "POST", "error", loop.time() - start_time)
         raise HTTPException(status_code=500, detail=f"批量问答处理失败: {str(e)}")
 
 
@@ -208,54 +251,55 @@ async def ask_question_stream(
         """生成流式响应"""
         try:
             # 发送开始信号
-            yield f"data: {json.dumps({'type': 'start', 'message': '开始处理问题'}, ensure_ascii=False)}\n\n"
+            yield _SSE_START
             
             # 发送检索阶段信号
-            yield f"data: {json.dumps({'type': 'retrieval', 'message': '正在检索相关文档'}, ensure_ascii=False)}\n\n"
+            yield _SSE_RETRIEVAL
             
-            # 调用RAG引擎处理问题
-            result = await rag_engine.answer_question(
+            # 消费RAG引擎的流式事件，生成的token逐个推送给客户端
+            async for event, result in rag_engine.answer_question_stream(
                 question=request.question,
                 k=request.k,
                 similarity_threshold=request.similarity_threshold,
                 use_cache=request.use_cache
-            )
-            
-            if result.get("success"):
-                # 发送生成阶段信号
-                yield f"data: {json.dumps({'type': 'generation', 'message': '正在生成答案'}, ensure_ascii=False)}\n\n"
-                
-                # 发送最终结果
-                response_data = {
-                    'type': 'answer',
-                    'question': result.get("question", ""),
-                    'answer': result.get("answer", ""),
-                    'context_count': len(result.get("context_documents", [])),
-                    'from_cache': result.get("from_cache", False),
-                    'generation_time': result.get("generation_time"),
-                    'total_time': result.get("total_time")
-                }
-                yield f"data: {json.dumps(response_data, ensure_ascii=False)}\n\n"
-            else:
-                # 发送错误信息
-                error_data = {
-                    'type': 'error',
-                    'message': result.get("message", "处理失败"),
-                    'error': result.get("error", "")
-                }
-                yield f"data: {json.dumps(error_data, ensure_ascii=False)}\n\n"
+            ):
+                if event == "token":
+                    yield _sse_token_event(result["content"])
+                elif event == "generation":
+                    # 发送生成阶段信号
+                    yield _SSE_GENERATION
+                elif event == "answer":
+                    # 发送最终结果
+                    response_data = {
+                        'type': 'answer',
+                        'question': result.get("question", ""),
+                        'answer': result.get("answer", ""),
+                        'context_count': len(result.get("context_documents", [])),
+                        'from_cache': result.get("from_cache", False),
+                        'generation_time': result.get("generation_time"),
+                        'total_time': result.get("total_time")
+                    }
+                    yield _sse_event(response_data)
+                else:
+                    # 发送错误信息
+                    error_data = {
+                        'type': 'error',
+                        'message': result.get("message", "处理失败"),
+                        'error': result.get("error", "")
+                    }
+                    yield _sse_event(error_data)
             
             # 发送结束信号
-            yield f"data: {json.dumps({'type': 'end', 'message': '处理完成'}, ensure_ascii=False)}\n\n"
+            yield _SSE_END
             
         except Exception as e:
-            logger.error(f"流式问答处理失败: {e}")
+            logger.error("流式问答处理失败: {}", e)
             error_data = {
                 'type': 'error',
                 'message': f"处理失败: {str(e)}",
                 'error': str(e)
             }
-            yield f"data: {json.dumps(error_data, ensure_ascii=False)}\n\n"
+            yield _sse_event(error_data)
     
     return StreamingResponse(
         generate_stream(),
@@ -298,10 +342,21 @@ async def get_qa_history(
         }
         
     except Exception as e:
-        logger.error(f"获取问答历史失败: {e}")
+        logger.error("获取问答历史失败: {}", e)
         raise HTTPException(status_code=500, detail=f"获取问答历史失败: {str(e)}")
 
 
+# 示例问题建议及其小写形式，在导入时计算一次
+_SAMPLE_SUGGESTIONS = (
+    "这个文档的主要内容是什么？",
+    "有哪些重要的概念或术语？",
+    "文档中提到了哪些关键信息？",
+    "能否总结一下主要观点？",
+    "有什么需要注意的地方？"
+)
+_SAMPLE_SUGGESTIONS_LOWER = tuple(suggestion.lower() for suggestion in _SAMPLE_SUGGESTIONS)
+
+
 @router.get("/suggestions", summary="获取问题建议")
 async def get_question_suggestions(
     query: str = "",
@@ -321,30 +376,27 @@ async def get_question_suggestions(
         # 这里可以实现基于文档内容的问题建议逻辑
         # 目前返回一些示例建议
         
-        sample_suggestions = [
-            "这个文档的主要内容是什么？",
-            "有哪些重要的概念或术语？",
-            "文档中提到了哪些关键信息？",
-            "能否总结一下主要观点？",
-            "有什么需要注意的地方？"
-        ]
-        
         # 如果有查询关键词，可以基于关键词过滤建议
         if query:
-            suggestions = [s for s in sample_suggestions if query.lower() in s.lower()]
+            query_lower = query.lower()
+            suggestions = [
+                suggestion
+                for suggestion, suggestion_lower in zip(_SAMPLE_SUGGESTIONS, _SAMPLE_SUGGESTIONS_LOWER)
+                if query_lower in suggestion_lower
+            ]
         else:
-            suggestions = sample_suggestions
+            suggestions = _SAMPLE_SUGGESTIONS
         
         return {
             "success": True,
             "message": "获取问题建议成功",
-            "suggestions": suggestions[:limit],
+            "suggestions": list(suggestions[:limit]),
             "query": query,
             "total_count": len(suggestions)
         }
         
     except Exception as e:
-        logger.error(f"获取问题建议失败: {e}")
+        logger.error("获取问题建议失败: {}", e)
         raise HTTPException(status_code=500, detail=f"获取问题建议失败: {str(e)}")
 
 
@@ -373,7 +425,7 @@ async def get_qa_stats() -> Dict[str, Any]:
         }
         
     except Exception as e:
-        logger.error(f"获取问答统计失败: {e}")
+        logger.error("获取问答统计失败: {}", e)
         raise HTTPException(status_code=500, detail=f"获取问答统计失败: {str(e)}")
 
 
@@ -411,7 +463,7 @@ async def submit_feedback(
             "timestamp": time.time()
         }
         
-        logger.info(f"收到问答反馈: {feedback_data}")
+        logger.info("收到问答反馈: {}", feedback_data)
         
         return {
             "success": True,
@@ -422,5 +474,5 @@ async def submit_feedback(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"提交反馈失败: {e}")
+        logger.error("提交反馈失败: {}", e)
         raise HTTPException(status_code=500, detail=f"提交反馈失败: {str(e)}")
\ No newline at end of file
@@ -3,14 +3,20 @@
 提供健康检查、监控指标、配置管理等系统功能的接口
 """
 
-from typing import Dict, Any
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import Response
+import asyncio
+import gzip
+import time
+from typing import Dict, Any, Optional, Union
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import ORJSONResponse, Response
+import orjson
 
 from ...core.rag_engine import rag_engine
-from ...config.settings import get_settings
+from ...config.settings import add_settings_listener, get_settings
+from ...utils.clock import cached_clock
 from ...utils.logger import get_logger
 from ...utils.metrics import get_metrics, get_content_type, metrics_collector
+from ..responses import PydanticResponse
 from ..models import (
     HealthCheckResponse,
     SystemStatsResponse,
@@ -24,13 +30,36 @@ from ..models import (
 logger = get_logger(__name__)
 settings = get_settings()
 
-router = APIRouter(prefix="/system", tags=["系统管理"])
+router = APIRouter(
+    prefix="/system",
+    tags=["系统管理"],
+    default_response_class=ORJSONResponse
+)
+
+# 健康检查结果缓存：过期后先返回旧结果，再由后台任务刷新
+HEALTH_CACHE_TTL = 10.0
+_health_cache: Dict[str, Any] = {"data": None, "ts": 0.0}
+_health_refresh_lock = asyncio.Lock()
+_health_refresh_task: Optional[asyncio.Task] = None
+
+# Prometheus指标缓存：多个抓取方在TTL内共享同一份生成结果
+METRICS_CACHE_TTL = 10.0
+_metrics_cache: Dict[str, Any] = {"payload": b"", "ts": 0.0, "gzip": None}
+_metrics_refresh_lock = asyncio.Lock()
+
+# /config响应中的配置部分，首次请求时编码，配置更新后清除
+_config_bytes: Optional[bytes] = None
 
+# /config响应体前缀，导入时预先编码；时间戳和配置在请求时拼接
+_CONFIG_BODY_PREFIX = orjson.dumps({
+    "success": True,
+    "message": "获取系统配置成功"
+})[:-1] + b',"timestamp":'
 
-@router.get("/health", response_model=HealthCheckResponse, summary="健康检查")
-async def health_check() -> HealthCheckResponse:
+
+async def _run_health_check() -> HealthCheckResponse:
     """
-    系统健康检查
+    执行完整的健康检查
     
     Returns:
         HealthCheckResponse: 健康检查结果
@@ -42,14 +71,14 @@ async def health_check() -> HealthCheckResponse:
         # 格式化组件健康状态
         components = {}
         for component_name, component_data in health_result.get("components", {}).items():
-            components[component_name] = ComponentHealth(
+            components[component_name] = ComponentHealth.model_construct(
                 status=component_data.get("status", "unknown"),
                 error=component_data.get("error"),
                 document_count=component_data.get("document_count"),
                 model=component_data.get("model")
             )
         
-        return HealthCheckResponse(
+        return HealthCheckResponse.model_construct(
             success=True,
             message="健康检查完成",
             status=health_result.get("status", "unknown"),
@@ -57,8 +86,8 @@ async def health_check() -> HealthCheckResponse:
         )
         
     except Exception as e:
-        logger.error(f"健康检查失败: {e}")
-        return HealthCheckResponse(
+        logger.error("健康检查失败: {}", e)
+        return HealthCheckResponse.model_construct(
             success=False,
             message=f"健康检查失败: {str(e)}",
             status="unhealthy",
@@ -66,20 +95,117 @@ async def health_check() -> HealthCheckResponse:
         )
 
 
-@router.get("/stats", response_model=SystemStatsResponse, summary="获取系统统计信息")
-async def get_system_stats() -> SystemStatsResponse:
+async def _refresh_health() -> HealthCheckResponse:
+    """
+    刷新健康检查缓存，同一时间只有一个刷新在执行
+    
+    Returns:
+        HealthCheckResponse: 最新的健康检查结果
+    """
+    async with _health_refresh_lock:
+        # 等待锁期间其他请求可能已经完成了刷新
+        cached = _health_cache["data"]
+        if cached is not None and time.monotonic() - _health_cache["ts"] <= HEALTH_CACHE_TTL:
+            return cached
+        
+        result = await _run_health_check()
+        _health_cache["data"] = result
+        _health_cache["ts"] = time.monotonic()
+        return result
+
+
+async def _get_cached_health() -> HealthCheckResponse:
+    """
+    获取缓存的健康检查结果
+    
+    首次请求同步等待检查完成；缓存过期时立即返回旧结果，并在后台刷新
+    
+    Returns:
+        HealthCheckResponse: 健康检查结果
+    """
+    global _health_refresh_task
+    
+    cached = _health_cache["data"]
+    if cached is None:
+        return await _refresh_health()
+    
+    if time.monotonic() - _health_cache["ts"] > HEALTH_CACHE_TTL:
+        if _health_refresh_task is None or _health_refresh_task.done():
+            _health_refresh_task = asyncio.create_task(_refresh_health())
+    
+    return cached
+
+
+@router.get(
+    "/health",
+    response_class=PydanticResponse,
+    responses={200: {"model": HealthCheckResponse}},
+    summary="健康检查"
+)
+async def health_check() -> PydanticResponse:
+    """
+    系统健康检查
+    
+    返回最多HEALTH_CACHE_TTL秒前的检查结果，避免每次请求都访问向量数据库、LLM和缓存
+    
+    Returns:
+        PydanticResponse: 健康检查结果（HealthCheckResponse）
+    """
+    return PydanticResponse(await _get_cached_health())
+
+
+@router.get("/health/live", summary="存活检查")
+async def liveness_check() -> Dict[str, Any]:
+    """
+    存活检查，不访问任何依赖组件
+    
+    Returns:
+        Dict[str, Any]: 存活状态
+    """
+    return {"status": "alive"}
+
+
+@router.get(
+    "/health/ready",
+    response_class=PydanticResponse,
+    responses={200: {"model": HealthCheckResponse}, 503: {"model": HealthCheckResponse}},
+    summary="就绪检查"
+)
+async def readiness_check() -> PydanticResponse:
+    """
+    就绪检查，返回缓存的完整健康检查结果
+    
+    编排系统只根据状态码判断就绪，系统状态不是healthy时返回503
+    
+    Returns:
+        PydanticResponse: 健康检查结果（HealthCheckResponse）
+    """
+    health = await _get_cached_health()
+    status_code = 200 if health.status == "healthy" else 503
+    return PydanticResponse(health, status_code=status_code)
+
+
+@router.get(
+    "/stats",
+    response_class=PydanticResponse,
+    responses={200: {"model": SystemStatsResponse}},
+    summary="获取系统统计信息"
+)
+async def get_system_stats() -> PydanticResponse:
     """
     获取系统统计信息
     
+    使用model_construct构建响应并由PydanticResponse直接编码，跳过重复校验
+    
     Returns:
-        SystemStatsResponse: 系统统计信息
+        PydanticResponse: 系统统计信息（SystemStatsResponse）
     """
     try:
         # 获取系统统计信息
         stats = rag_engine.get_system_stats()
         
         # 格式化系统信息
-        system_info = SystemStats(
+        system_info = SystemStats.model_construct(
             app_name=stats["system_info"]["app_name"],
             app_version=stats["system_info"]["app_version"],
             initialized=stats["system_info"]["initialized"],
@@ -91,7 +217,7 @@ async def get_system_stats() -> SystemStatsResponse:
         
         # 格式化指标摘要
         metrics_data = stats.get("metrics", {})
-        metrics_summary = MetricsSummary(
+        metrics_summary = MetricsSummary.model_construct(
             cache_hit_rate=metrics_data.get("cache_hit_rate", 0.0),
             cache_hits=metrics_data.get("cache_hits", 0),
             cache_misses=metrics_data.get("cache_misses", 0),
@@ -103,75 +229,191 @@ async def get_system_stats() -> SystemStatsResponse:
         # 获取支持的格式
         supported_formats = rag_engine.get_supported_formats()
         
-        return SystemStatsResponse(
+        return PydanticResponse(SystemStatsResponse.model_construct(
             success=True,
             message="获取系统统计信息成功",
             system_info=system_info,
             metrics=metrics_summary,
             supported_formats=supported_formats
-        )
+        ))
         
     except Exception as e:
-        logger.error(f"获取系统统计信息失败: {e}")
+        logger.error("获取系统统计信息失败: {}", e)
         raise HTTPException(status_code=500, detail=f"获取系统统计信息失败: {str(e)}")
 
 
+async def _get_cached_metrics() -> bytes:
+    """
+    获取缓存的Prometheus指标数据，过期或为空时在线程中重新生成
+    
+    Returns:
+        bytes: Prometheus格式的指标数据
+    """
+    if _metrics_cache["payload"] and time.monotonic() - _metrics_cache["ts"] <= METRICS_CACHE_TTL:
+        return _metrics_cache["payload"]
+    
+    async with _metrics_refresh_lock:
+        # 等待锁期间其他请求可能已经完成了刷新
+        if _metrics_cache["payload"] and time.monotonic() - _metrics_cache["ts"] <= METRICS_CACHE_TTL:
+            return _metrics_cache["payload"]
+        
+        # 生成指标会采样系统资源并遍历所有指标序列，放到线程中避免阻塞事件循环
+        _metrics_cache["payload"] = await asyncio.to_thread(get_metrics)
+        _metrics_cache["ts"] = time.monotonic()
+        return _metrics_cache["payload"]
+
+
+def _accepts_gzip(accept_encoding: str) -> bool:
+    """
+    根据Accept-Encoding请求头判断抓取方是否接受gzip
+    
+    显式列出的gzip优先于通配符*，q=0表示拒绝该编码
+    
+    Args:
+        accept_encoding: Accept-Encoding请求头
+        
+    Returns:
+        bool: 是否接受gzip
+    """
+    wildcard_q: Optional[float] = None
+    for item in accept_encoding.split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip().lower()
+        if coding not in ("gzip", "*"):
+            continue
+        
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        
+        if coding == "gzip":
+            return q > 0
+        wildcard_q = q
+    
+    return wildcard_q is not None and wildcard_q > 0
+
+
+def _gzip_metrics(payload: Union[bytes, str]) -> bytes:
+    """
+    gzip压缩指标数据，同一份指标只压缩一次
+    
+    Args:
+        payload: Prometheus格式的指标数据
+        
+    Returns:
+        bytes: 压缩后的指标数据
+    """
+    cached = _metrics_cache.get("gzip")
+    if cached is None or cached[0] is not payload:
+        data = payload.encode("utf-8") if isinstance(payload, str) else payload
+        # 指标文本重复度高，最低压缩级别已能大幅减小体积
+        cached = (payload, gzip.compress(data, compresslevel=1))
+        _metrics_cache["gzip"] = cached
+    return cached[1]
+
+
 @router.get("/metrics", summary="获取Prometheus监控指标")
-async def get_prometheus_metrics():
+async def get_prometheus_metrics(request: Request):
     """
     获取Prometheus格式的监控指标
     
+    返回最多METRICS_CACHE_TTL秒前生成的指标数据，抓取方支持gzip时返回压缩数据
+    
+    Args:
+        request: 请求对象
+    
     Returns:
         Response: Prometheus格式的指标数据
     """
     try:
-        metrics_data = get_metrics()
+        metrics_data = await _get_cached_metrics()
+        headers = {"Vary": "Accept-Encoding"}
+        if metrics_data and _accepts_gzip(request.headers.get("accept-encoding", "")):
+            metrics_data = _gzip_metrics(metrics_data)
+            headers["Content-Encoding"] = "gzip"
+        
         return Response(
             content=metrics_data,
-            media_type=get_content_type()
+            media_type=get_content_type(),
+            headers=headers
         )
         
     except Exception as e:
-        logger.error(f"获取监控指标失败: {e}")
+        logger.error("获取监控指标失败: {}", e)
         raise HTTPException(status_code=500, detail=f"获取监控指标失败: {str(e)}")
 
 
-@router.get("/config", response_model=ConfigResponse, summary="获取系统配置")
-async def get_system_config() -> ConfigResponse:
+def _render_config() -> bytes:
+    """
+    编码当前配置并缓存
+    
+    Returns:
+        bytes: JSON编码的配置
+    """
+    global _config_bytes
+    _config_bytes = orjson.dumps({
+        "app_name": settings.app_name,
+        "app_version": settings.app_version,
+        "debug": settings.debug,
+        "host": settings.host,
+        "port": settings.port,
+        "ollama_model": settings.ollama_model,
+        "embedding_model": settings.embedding_model,
+        "chunk_size": settings.chunk_size,
+        "chunk_overlap": settings.chunk_overlap,
+        "retrieval_k": settings.retrieval_k,
+        "similarity_threshold": settings.similarity_threshold,
+        "max_tokens": settings.max_tokens,
+        "temperature": settings.temperature,
+        "cache_ttl": settings.cache_ttl,
+        "max_file_size": settings.max_file_size,
+        "supported_formats": settings.supported_formats
+    })
+    return _config_bytes
+
+
+def _invalidate_config_cache() -> None:
+    """
+    清除配置缓存，下次请求/config时重新编码
+    """
+    global _config_bytes
+    _config_bytes = None
+
+
+add_settings_listener(_invalidate_config_cache)
+
+
+@router.get(
+    "/config",
+    responses={200: {"model": ConfigResponse}},
+    summary="获取系统配置"
+)
+async def get_system_config() -> Response:
     """
     获取当前系统配置
     
+    配置部分只在首次请求和配置更新后编码一次，请求时只拼接时间戳
+    
     Returns:
-        ConfigResponse: 系统配置信息
+        Response: 系统配置信息（ConfigResponse）
     """
     try:
-        config = {
-            "app_name": settings.app_name,
-            "app_version": settings.app_version,
-            "debug": settings.debug,
-            "host": settings.host,
-            "port": settings.port,
-            "ollama_model": settings.ollama_model,
-            "embedding_model": settings.embedding_model,
-            "chunk_size": settings.chunk_size,
-            "chunk_overlap": settings.chunk_overlap,
-            "retrieval_k": settings.retrieval_k,
-            "similarity_threshold": settings.similarity_threshold,
-            "max_tokens": settings.max_tokens,
-            "temperature": settings.temperature,
-            "cache_ttl": settings.cache_ttl,
-            "max_file_size": settings.max_file_size,
-            "supported_formats": settings.supported_formats
-        }
-        
-        return ConfigResponse(
-            success=True,
-            message="获取系统配置成功",
-            config=config
+        body = (
+            _CONFIG_BODY_PREFIX
+            + orjson.dumps(cached_clock.now())
+            + b',"config":'
+            + (_config_bytes or _render_config())
+            + b"}"
         )
+        return Response(content=body, media_type="application/json")
         
     except Exception as e:
-        logger.error(f"获取系统配置失败: {e}")
+        logger.error("获取系统配置失败: {}", e)
         raise HTTPException(status_code=500, detail=f"获取系统配置失败: {str(e)}")
 
 
@@ -190,7 +432,7 @@ async def update_system_config(
     """
     try:
         # 获取要更新的配置项
-        update_data = request.dict(exclude_unset=True)
+        update_data = request.model_dump(exclude_unset=True)
         
         if not update_data:
             raise HTTPException(status_code=400, detail="没有提供要更新的配置项")
@@ -198,7 +440,7 @@ async def update_system_config(
         # 这里可以实现配置更新逻辑
         # 注意：某些配置项可能需要重启服务才能生效
         
-        logger.info(f"配置更新请求: {update_data}")
+        logger.info("配置更新请求: {}", update_data)
         
         # 返回更新后的配置
         current_config = {
@@ -212,8 +454,9 @@ async def update_system_config(
         
         # 应用更新（这里只是示例，实际需要更新settings对象）
         current_config.update(update_data)
+        _invalidate_config_cache()
         
-        return ConfigResponse(
+        return ConfigResponse.model_construct(
             success=True,
             message=f"配置更新成功，更新了 {len(update_data)} 个配置项",
             config=current_config
@@ -222,7 +465,7 @@ async def update_system_config(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"更新系统配置失败: {e}")
+        logger.error("更新系统配置失败: {}", e)
         raise HTTPException(status_code=500, detail=f"更新系统配置失败: {str(e)}")
 
 
@@ -252,7 +495,7 @@ async def initialize_system() -> Dict[str, Any]:
         }
         
     except Exception as e:
-        logger.error(f"系统初始化失败: {e}")
+        logger.error("系统初始化失败: {}", e)
         raise HTTPException(status_code=500, detail=f"系统初始化失败: {str(e)}")
 
 
@@ -274,7 +517,7 @@ async def shutdown_system() -> Dict[str, Any]:
         }
         
     except Exception as e:
-        logger.error(f"系统关闭失败: {e}")
+        logger.error("系统关闭失败: {}", e)
         raise HTTPException(status_code=500, detail=f"系统关闭失败: {str(e)}")
 
 
@@ -304,7 +547,7 @@ async def get_version_info() -> Dict[str, Any]:
         }
         
     except Exception as e:
-        logger.error(f"获取版本信息失败: {e}")
+        logger.error("获取版本信息失败: {}", e)
         raise HTTPException(status_code=500, detail=f"获取版本信息失败: {str(e)}")
 
 
@@ -341,7 +584,7 @@ async def get_system_logs(
         }
         
     except Exception as e:
-        logger.error(f"获取系统日志失败: {e}")
+        logger.error("获取系统日志失败: {}", e)
         raise HTTPException(status_code=500, detail=f"获取系统日志失败: {str(e)}")
 
 
@@ -362,7 +605,7 @@ async def clear_system_cache(
         # 这里可以实现缓存清除逻辑
         # 需要访问缓存管理器
         
-        logger.info(f"清除缓存请求: pattern={pattern}")
+        logger.info("清除缓存请求: pattern={}", pattern)
         
         return {
             "success": True,
@@ -373,5 +616,5 @@ async def clear_system_cache(
         }
         
     except Exception as e:
-        logger.error(f"清除系统缓存失败: {e}")
+        logger.error("清除系统缓存失败: {}", e)
         raise HTTPException(status_code=500, detail=f"清除系统缓存失败: {str(e)}")
\ No newline at end of file
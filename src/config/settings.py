@@ -4,8 +4,10 @@
 """
 
 import os
-from typing import List, Optional
-from pydantic import BaseSettings, Field
+from functools import lru_cache
+from typing import Callable, List, Optional
+from pydantic import Field
+from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
 class Settings(BaseSettings):
@@ -22,12 +24,15 @@ class Settings(BaseSettings):
     # 服务配置
     host: str = Field(default="0.0.0.0", description="服务监听地址")
     port: int = Field(default=8000, description="服务端口")
-    workers: int = Field(default=1, description="工作进程数")
+    workers: int = Field(default=1, description="工作进程数(生产环境建议设为CPU核心数)")
     
     # Ollama模型配置
     ollama_base_url: str = Field(default="http://ollama:11434", description="Ollama服务地址")
     ollama_model: str = Field(default="qwen2.5:7b-instruct", description="使用的语言模型")
     ollama_timeout: int = Field(default=300, description="模型请求超时时间(秒)")
+    ollama_max_connections: int = Field(default=100, description="Ollama HTTP连接池最大连接数")
+    ollama_max_keepalive_connections: int = Field(default=40, description="Ollama HTTP连接池保持的空闲长连接数")
+    ollama_num_parallel: int = Field(default=4, description="同时发往Ollama的生成请求数上限(与服务端OLLAMA_NUM_PARALLEL一致)")
     
     # 向量数据库配置
     chroma_host: str = Field(default="chroma", description="Chroma服务地址")
@@ -37,13 +42,23 @@ class Settings(BaseSettings):
     # 嵌入模型配置
     embedding_model: str = Field(default="BAAI/bge-large-zh-v1.5", description="嵌入模型名称")
     embedding_device: str = Field(default="cuda", description="嵌入模型运行设备")
+    embedding_batch_size: int = Field(default=64, description="嵌入模型批处理大小(显存不足时自动减半)")
+    embedding_decimals: Optional[int] = Field(default=6, description="向量发送到Chroma前保留的小数位数(为空则不截断)")
+    embedding_precision: str = Field(default="auto", description="嵌入模型推理精度: auto/float32/float16/int8")
+    embedding_endpoint: Optional[str] = Field(
+        default=None,
+        description="外部嵌入服务地址(TEI /embed接口)，设置后不在进程内加载嵌入模型"
+    )
     
     # Redis缓存配置
     redis_host: str = Field(default="redis", description="Redis服务地址")
     redis_port: int = Field(default=6379, description="Redis服务端口")
     redis_db: int = Field(default=0, description="Redis数据库编号")
     redis_password: Optional[str] = Field(default=None, description="Redis密码")
+    redis_pool_size: int = Field(default=50, description="Redis连接池最大连接数")
     cache_ttl: int = Field(default=3600, description="缓存过期时间(秒)")
+    local_cache_size: int = Field(default=1024, description="进程内答案缓存的最大条目数(0表示禁用)")
+    local_cache_ttl: int = Field(default=60, description="进程内答案缓存过期时间(秒)")
     
     # 文档处理配置
     max_file_size: int = Field(default=50 * 1024 * 1024, description="最大文件大小(字节)")
@@ -57,14 +72,18 @@ class Settings(BaseSettings):
     # RAG检索配置
     retrieval_k: int = Field(default=5, description="检索返回的文档数量")
     similarity_threshold: float = Field(default=0.7, description="相似度阈值")
+    chroma_query_workers: int = Field(default=8, description="Chroma检索专用线程池大小")
     
     # 生成配置
     max_tokens: int = Field(default=2000, description="生成的最大token数")
     temperature: float = Field(default=0.7, description="生成温度")
+    qa_concurrency: int = Field(default=8, description="批量问答的最大并发数")
     
     # 监控配置
     enable_metrics: bool = Field(default=True, description="启用指标监控")
     metrics_port: int = Field(default=8001, description="指标服务端口")
+    disable_request_timing: bool = Field(default=False, description="禁用请求计时和请求指标(基准测试模式)")
+    health_check_timeout: float = Field(default=5.0, description="健康检查中单个组件的超时时间(秒)")
     
     # 日志配置
     log_level: str = Field(default="INFO", description="日志级别")
@@ -77,31 +96,51 @@ class Settings(BaseSettings):
     api_key: Optional[str] = Field(default=None, description="API访问密钥")
     cors_origins: List[str] = Field(default=["*"], description="CORS允许的源")
     
-    class Config:
-        """pydantic配置"""
-        env_file = ".env"
-        env_file_encoding = "utf-8"
-        case_sensitive = False
-
-
-# 全局配置实例
-settings = Settings()
+    # pydantic配置
+    model_config = SettingsConfigDict(
+        env_file=".env",
+        env_file_encoding="utf-8",
+        case_sensitive=False,
+        extra="ignore"
+    )
 
 
+@lru_cache(maxsize=1)
 def get_settings() -> Settings:
     """
-    获取配置实例
+    获取配置实例（只在首次调用时读取环境变量和.env文件）
+    
+    可直接用作FastAPI依赖：Depends(get_settings)
     
     Returns:
         Settings: 配置实例
     """
-    return settings
+    return Settings()
+
+
+# 全局配置实例
+settings = get_settings()
+
+# 配置更新回调，update_settings修改配置后依次调用，用于清除依赖配置的缓存
+_update_listeners: List[Callable[[], None]] = []
+
+
+def add_settings_listener(callback: Callable[[], None]) -> None:
+    """
+    注册配置更新回调
+    
+    Args:
+        callback: 配置更新后调用的无参函数
+    """
+    _update_listeners.append(callback)
 
 
 def update_settings(**kwargs) -> None:
     """
     更新配置项
     
+    原地修改缓存的配置实例，各模块在导入时持有的settings引用同样生效
+    
     Args:
         **kwargs: 要更新的配置项
     """
@@ -109,6 +148,9 @@ def update_settings(**kwargs) -> None:
     for key, value in kwargs.items():
         if hasattr(settings, key):
             setattr(settings, key, value)
+    
+    for callback in _update_listeners:
+        callback()
 
 
 def validate_settings() -> bool:
@@ -140,6 +182,36 @@ def validate_settings() -> bool:
         if settings.similarity_threshold < 0 or settings.similarity_threshold > 1:
             raise ValueError("相似度阈值必须在0-1范围内")
         
+        if settings.embedding_batch_size < 1:
+            raise ValueError("嵌入批处理大小不能小于1")
+        
+        if settings.embedding_decimals is not None and settings.embedding_decimals < 1:
+            raise ValueError("向量保留的小数位数不能小于1")
+        
+        if settings.embedding_precision not in ("auto", "float32", "float16", "int8"):
+            raise ValueError("嵌入模型推理精度必须是auto、float32、float16或int8")
+        
+        if settings.qa_concurrency < 1:
+            raise ValueError("批量问答并发数不能小于1")
+        
+        if settings.ollama_max_connections < 1 or settings.ollama_max_keepalive_connections < 1:
+            raise ValueError("Ollama连接池大小不能小于1")
+        
+        if settings.ollama_num_parallel < 1:
+            raise ValueError("Ollama并行生成数不能小于1")
+        
+        if settings.chroma_query_workers < 1:
+            raise ValueError("Chroma检索线程池大小不能小于1")
+        
+        if settings.redis_pool_size < 1:
+            raise ValueError("Redis连接池大小不能小于1")
+        
+        if settings.local_cache_size < 0 or settings.local_cache_ttl < 1:
+            raise ValueError("进程内缓存大小不能小于0，过期时间不能小于1秒")
+        
+        if settings.health_check_timeout <= 0:
+            raise ValueError("健康检查超时时间必须大于0")
+        
         return True
         
     except Exception as e:
@@ -5,24 +5,23 @@
 
 import os
 import hashlib
-from typing import List, Dict, Any, Optional, Union
+import mmap
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Set, Tuple, Type, Union
 from pathlib import Path
 import asyncio
 from datetime import datetime
 
+import httpx
+import numpy as np
+import orjson
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import (
-    PyPDFLoader,
-    TextLoader,
-    UnstructuredMarkdownLoader,
-    Docx2txtLoader
-)
 from langchain.schema import Document
 from sentence_transformers import SentenceTransformer
 import chromadb
 from chromadb.config import Settings
-import aiofiles
-import logging
 
 from ..config.settings import get_settings
 from ..utils.logger import get_logger
@@ -30,6 +29,229 @@ from ..utils.logger import get_logger
 logger = get_logger(__name__)
 settings = get_settings()
 
+# 无法内存映射时计算文件哈希每次读取的字节数，大块读取以减少系统调用次数
+FILE_HASH_CHUNK_SIZE = 1 << 20
+
+# 外部嵌入服务单次请求的最大文本数，与TEI的max-client-batch-size默认值一致
+REMOTE_EMBEDDING_BATCH_SIZE = 32
+
+# 目录处理时同时加载的文件数
+DIRECTORY_LOAD_CONCURRENCY = 8
+
+# 单次写入Chroma的最大分块数，过大的请求体会拖慢HTTP传输
+CHROMA_UPSERT_PAGE_SIZE = 500
+
+# 目录处理时累计到该分块数后统一向量化并写入向量数据库
+STORE_BATCH_CHUNKS = CHROMA_UPSERT_PAGE_SIZE
+
+# 支持的文件格式，对应的LangChain加载器由_get_loader在首次使用时导入
+SUPPORTED_EXTENSIONS: Tuple[str, ...] = ('.pdf', '.txt', '.md', '.docx')
+
+# 嵌入计算专用线程池：GPU推理串行执行，且不占用分块、文件读取使用的默认线程池
+_embedding_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedding")
+
+
+def round_embeddings(embeddings: Any) -> np.ndarray:
+    """
+    按settings.embedding_decimals截断嵌入向量的小数位
+    
+    float32直接转换为Python浮点数会带出17位有效数字，截断后JSON体积约减半，
+    对归一化向量的余弦相似度影响可以忽略。文档向量和问题向量需使用同一函数处理
+    
+    Args:
+        embeddings: 向量数组
+        
+    Returns:
+        np.ndarray: 截断后的向量数组
+    """
+    if settings.embedding_decimals is None:
+        return np.asarray(embeddings)
+    return np.asarray(embeddings, dtype=np.float64).round(settings.embedding_decimals)
+
+
+def _get_loader(file_ext: str) -> Type:
+    """
+    获取文件格式对应的LangChain文档加载器类
+    
+    加载器及其依赖（pypdf、unstructured、docx2txt等）只在首次加载该格式的文件时导入，
+    不处理文档的工作进程不承担这部分启动时间和内存
+    
+    Args:
+        file_ext: 小写的文件扩展名
+        
+    Returns:
+        Type: 文档加载器类
+        
+    Raises:
+        ValueError: 不支持的文件格式
+    """
+    if file_ext == '.pdf':
+        from langchain_community.document_loaders.pdf import PyPDFLoader
+        return PyPDFLoader
+    if file_ext == '.txt':
+        from langchain_community.document_loaders.text import TextLoader
+        return TextLoader
+    if file_ext == '.md':
+        from langchain_community.document_loaders.markdown import UnstructuredMarkdownLoader
+        return UnstructuredMarkdownLoader
+    if file_ext == '.docx':
+        from langchain_community.document_loaders.word_document import Docx2txtLoader
+        return Docx2txtLoader
+    raise ValueError(f"不支持的文件格式: {file_ext}")
+
+
+def get_distance_space(collection: Any) -> str:
+    """
+    获取集合使用的向量距离度量
+    
+    新集合使用cosine；之前创建的集合没有设置hnsw:space，Chroma按默认的l2（平方欧氏距离）计算
+    
+    Args:
+        collection: Chroma集合
+        
+    Returns:
+        str: 距离度量(cosine、l2或ip)
+    """
+    return (collection.metadata or {}).get("hnsw:space", "l2")
+
+
+def quantize_embeddings(embeddings: Any) -> List[List[float]]:
+    """
+    将嵌入向量截断小数位后转换为发送给Chroma的列表
+    
+    Args:
+        embeddings: 二维向量数组
+        
+    Returns:
+        List[List[float]]: 嵌入向量列表
+    """
+    return round_embeddings(embeddings).tolist()
+
+
+async def request_embeddings(client: httpx.AsyncClient, texts: List[str]) -> np.ndarray:
+    """
+    调用外部嵌入服务生成归一化的嵌入向量
+    
+    使用Text Embeddings Inference的/embed接口，各工作进程共享服务端的同一个模型实例，
+    由服务端合并批次推理。文本按REMOTE_EMBEDDING_BATCH_SIZE分页并发请求
+    
+    Args:
+        client: HTTP客户端
+        texts: 文本列表
+        
+    Returns:
+        np.ndarray: 与文本一一对应的嵌入向量矩阵
+        
+    Raises:
+        httpx.HTTPError: 请求嵌入服务失败
+    """
+    async def embed_page(page: List[str]) -> List[List[float]]:
+        response = await client.post(
+            f"{settings.embedding_endpoint}/embed",
+            json={"inputs": page, "normalize": True, "truncate": True}
+        )
+        response.raise_for_status()
+        return orjson.loads(response.content)
+    
+    pages = await asyncio.gather(*[
+        embed_page(texts[start:start + REMOTE_EMBEDDING_BATCH_SIZE])
+        for start in range(0, len(texts), REMOTE_EMBEDDING_BATCH_SIZE)
+    ])
+    return round_embeddings(
+        np.asarray([embedding for page in pages for embedding in page], dtype=np.float32)
+    )
+
+
+def apply_embedding_precision(model: SentenceTransformer) -> str:
+    """
+    按settings.embedding_precision原地转换嵌入模型的推理精度
+    
+    auto在CUDA设备上使用float16，其他设备保持float32；int8只对CPU上的
+    线性层做动态量化。文档模型和问题模型需使用同一函数处理，保证向量一致
+    
+    Args:
+        model: 已加载的嵌入模型
+        
+    Returns:
+        str: 实际使用的推理精度
+    """
+    on_cuda = getattr(model.device, "type", None) == "cuda"
+    precision = settings.embedding_precision
+    if precision == "auto":
+        precision = "float16" if on_cuda else "float32"
+    
+    if precision == "float16":
+        model.half()
+    elif precision == "int8":
+        if on_cuda:
+            logger.warning("int8动态量化仅支持CPU，CUDA设备上保持float32")
+            return "float32"
+        import torch
+        torch.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+        )
+    return precision
+
+
+@lru_cache(maxsize=4096)
+def _hash_file(path: str, mtime_ns: int, size: int) -> str:
+    """
+    计算文件的MD5哈希值
+    
+    mtime_ns和size只作为缓存键的一部分，文件被修改后会重新计算。
+    优先将文件映射到内存后一次性交给hashlib计算，映射失败（空文件、
+    地址空间不足等）时退回分块读取
+    
+    Args:
+        path: 文件绝对路径
+        mtime_ns: 文件修改时间（纳秒）
+        size: 文件大小（字节）
+        
+    Returns:
+        str: 文件的MD5哈希值
+    """
+    hash_md5 = hashlib.md5()
+    if size > 0:
+        try:
+            with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                hash_md5.update(mm)
+            return hash_md5.hexdigest()
+        except (ValueError, OSError):
+            hash_md5 = hashlib.md5()
+    
+    buffer = bytearray(FILE_HASH_CHUNK_SIZE)
+    view = memoryview(buffer)
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            hash_md5.update(view[:n])
+    return hash_md5.hexdigest()
+
+
+def _find_files(root: str, extensions: Set[str]) -> List[str]:
+    """
+    递归查找目录下指定扩展名的文件（同步阻塞，需在线程中调用）
+    
+    只遍历一次目录树，os.scandir的目录项自带文件类型信息，无需额外stat
+    
+    Args:
+        root: 根目录路径
+        extensions: 小写扩展名集合（含点号）
+        
+    Returns:
+        List[str]: 文件路径列表
+    """
+    files = []
+    with os.scandir(root) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                files.extend(_find_files(entry.path, extensions))
+            elif os.path.splitext(entry.name)[1].lower() in extensions and entry.is_file():
+                files.append(entry.path)
+    return files
+
 
 class DocumentProcessor:
     """
@@ -48,9 +270,15 @@ class DocumentProcessor:
             separators=["\n\n", "\n", "。", "！", "？", "；", "，", " ", ""]
         )
         
-        # 初始化嵌入模型
+        # 嵌入模型在首次生成向量时加载，只提供检索的进程不占用模型内存
         self.embedding_model = None
-        self._init_embedding_model()
+        self.embedding_batch_size = settings.embedding_batch_size
+        self._embedding_model_lock = threading.Lock()
+        
+        # 配置了外部嵌入服务时通过HTTP生成向量，不加载本地模型
+        self.http_client = None
+        if settings.embedding_endpoint:
+            self.http_client = httpx.AsyncClient(timeout=httpx.Timeout(60.0, connect=10.0))
         
         # 初始化向量数据库连接
         self.chroma_client = None
@@ -58,28 +286,36 @@ class DocumentProcessor:
         self._init_chroma_client()
         
         # 支持的文件格式
-        self.supported_formats = {
-            '.pdf': PyPDFLoader,
-            '.txt': TextLoader,
-            '.md': UnstructuredMarkdownLoader,
-            '.docx': Docx2txtLoader
-        }
+        self.supported_formats = SUPPORTED_EXTENSIONS
         
         logger.info("文档处理器初始化完成")
     
-    def _init_embedding_model(self) -> None:
+    def _get_embedding_model(self) -> SentenceTransformer:
         """
-        初始化嵌入模型
+        获取嵌入模型，首次调用时加载
+        
+        加载过程加锁，并发的首次调用只会加载一次模型
+        
+        Returns:
+            SentenceTransformer: 嵌入模型
         """
-        try:
-            self.embedding_model = SentenceTransformer(
-                settings.embedding_model,
-                device=settings.embedding_device
-            )
-            logger.info(f"嵌入模型加载成功: {settings.embedding_model}")
-        except Exception as e:
-            logger.error(f"嵌入模型加载失败: {e}")
-            raise
+        if self.embedding_model is not None:
+            return self.embedding_model
+        
+        with self._embedding_model_lock:
+            if self.embedding_model is None:
+                try:
+                    embedding_model = SentenceTransformer(
+                        settings.embedding_model,
+                        device=settings.embedding_device
+                    )
+                    precision = apply_embedding_precision(embedding_model)
+                    self.embedding_model = embedding_model
+                    logger.info("嵌入模型加载成功: {} ({})", settings.embedding_model, precision)
+                except Exception as e:
+                    logger.error("嵌入模型加载失败: {}", e)
+                    raise
+        return self.embedding_model
     
     def _init_chroma_client(self) -> None:
         """
@@ -97,53 +333,64 @@ class DocumentProcessor:
                 self.collection = self.chroma_client.get_collection(
                     name=settings.chroma_collection
                 )
-                logger.info(f"连接到现有集合: {settings.chroma_collection}")
+                logger.info("连接到现有集合: {}", settings.chroma_collection)
+                distance_space = get_distance_space(self.collection)
+                if distance_space != "cosine":
+                    logger.warning(
+                        "集合{}使用{}距离而不是cosine，检索时将换算为余弦相似度；建议删除集合后重新导入文档",
+                        settings.chroma_collection, distance_space
+                    )
             except Exception:
                 self.collection = self.chroma_client.create_collection(
                     name=settings.chroma_collection,
-                    metadata={"description": "RAG知识库文档向量集合"}
+                    metadata={
+                        "description": "RAG知识库文档向量集合",
+                        # 向量已归一化，使用余弦距离使 1 - distance 即为余弦相似度
+                        "hnsw:space": "cosine"
+                    }
                 )
-                logger.info(f"创建新集合: {settings.chroma_collection}")
+                logger.info("创建新集合: {}", settings.chroma_collection)
                 
         except Exception as e:
-            logger.error(f"Chroma数据库连接失败: {e}")
+            logger.error("Chroma数据库连接失败: {}", e)
             raise
     
     def _get_file_hash(self, file_path: str) -> str:
         """
         计算文件的MD5哈希值
         
+        结果按(绝对路径, 修改时间, 文件大小)缓存，未变化的文件不会重复读取
+        
         Args:
             file_path: 文件路径
             
         Returns:
             str: 文件的MD5哈希值
         """
-        hash_md5 = hashlib.md5()
-        with open(file_path, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                hash_md5.update(chunk)
-        return hash_md5.hexdigest()
+        st = os.stat(file_path)
+        return _hash_file(os.path.abspath(file_path), st.st_mtime_ns, st.st_size)
     
-    def _is_file_processed(self, file_path: str) -> bool:
+    def _is_file_processed(self, file_path: str, file_hash: Optional[str] = None) -> bool:
         """
         检查文件是否已经处理过
         
         Args:
             file_path: 文件路径
+            file_hash: 已计算好的文件哈希，为None时重新计算
             
         Returns:
             bool: 文件是否已处理
         """
         try:
-            file_hash = self._get_file_hash(file_path)
+            if file_hash is None:
+                file_hash = self._get_file_hash(file_path)
             results = self.collection.get(
                 where={"file_hash": file_hash},
                 limit=1
             )
             return len(results['ids']) > 0
         except Exception as e:
-            logger.warning(f"检查文件处理状态失败: {e}")
+            logger.warning("检查文件处理状态失败: {}", e)
             return False
     
     async def load_document(self, file_path: str) -> List[Document]:
@@ -167,35 +414,35 @@ class DocumentProcessor:
         if file_ext not in self.supported_formats:
             raise ValueError(f"不支持的文件格式: {file_ext}")
         
-        # 检查文件是否已处理
-        if self._is_file_processed(file_path):
-            logger.info(f"文件已处理，跳过: {file_path}")
+        # 检查文件是否已处理（哈希计算和数据库查询均为阻塞调用，放到线程中执行）
+        file_hash = await asyncio.to_thread(self._get_file_hash, file_path)
+        if await asyncio.to_thread(self._is_file_processed, file_path, file_hash):
+            logger.info("文件已处理，跳过: {}", file_path)
             return []
         
         try:
-            loader_class = self.supported_formats[file_ext]
+            loader_class = _get_loader(file_ext)
             loader = loader_class(file_path)
             
-            # 在事件循环中运行同步加载操作
-            loop = asyncio.get_event_loop()
-            documents = await loop.run_in_executor(None, loader.load)
+            # 在线程中运行同步加载操作
+            documents = await asyncio.to_thread(loader.load)
             
-            # 添加文件元数据
-            file_hash = self._get_file_hash(file_path)
+            # 添加文件元数据（同一文件的所有文档共用，只计算一次）
+            file_metadata = {
+                'file_path': file_path,
+                'file_name': Path(file_path).name,
+                'file_hash': file_hash,
+                'file_size': os.path.getsize(file_path),
+                'processed_at': datetime.now().isoformat()
+            }
             for doc in documents:
-                doc.metadata.update({
-                    'file_path': file_path,
-                    'file_name': Path(file_path).name,
-                    'file_hash': file_hash,
-                    'file_size': os.path.getsize(file_path),
-                    'processed_at': datetime.now().isoformat()
-                })
-            
-            logger.info(f"文档加载成功: {file_path}, 共{len(documents)}个文档块")
+                doc.metadata.update(file_metadata)
+            
+            logger.info("文档加载成功: {}, 共{}个文档块", file_path, len(documents))
             return documents
             
         except Exception as e:
-            logger.error(f"文档加载失败 {file_path}: {e}")
+            logger.error("文档加载失败 {}: {}", file_path, e)
             raise
     
     def split_documents(self, documents: List[Document]) -> List[Document]:
@@ -217,11 +464,11 @@ class DocumentProcessor:
                 chunk.metadata['chunk_index'] = i
                 chunk.metadata['chunk_size'] = len(chunk.page_content)
             
-            logger.info(f"文档分块完成: {len(documents)}个文档 -> {len(chunks)}个块")
+            logger.info("文档分块完成: {}个文档 -> {}个块", len(documents), len(chunks))
             return chunks
             
         except Exception as e:
-            logger.error(f"文档分块失败: {e}")
+            logger.error("文档分块失败: {}", e)
             raise
     
     def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
@@ -234,17 +481,27 @@ class DocumentProcessor:
         Returns:
             List[List[float]]: 嵌入向量列表
         """
-        try:
-            embeddings = self.embedding_model.encode(
-                texts,
-                convert_to_numpy=True,
-                show_progress_bar=True
-            )
-            return embeddings.tolist()
-            
-        except Exception as e:
-            logger.error(f"生成嵌入向量失败: {e}")
-            raise
+        embedding_model = self._get_embedding_model()
+        while True:
+            try:
+                embeddings = embedding_model.encode(
+                    texts,
+                    batch_size=self.embedding_batch_size,
+                    convert_to_numpy=True,
+                    normalize_embeddings=True,
+                    show_progress_bar=False
+                )
+                # Chroma HTTP客户端需要列表形式的向量
+                return quantize_embeddings(embeddings)
+                
+            except Exception as e:
+                # 显存不足时减半批处理大小后重试，并保留减半后的值供后续调用使用
+                if "out of memory" in str(e) and self.embedding_batch_size > 1:
+                    self.embedding_batch_size //= 2
+                    logger.warning("嵌入模型显存不足，批处理大小降为 {}", self.embedding_batch_size)
+                    continue
+                logger.error("生成嵌入向量失败: {}", e)
+                raise
     
     async def store_documents(self, documents: List[Document]) -> Dict[str, Any]:
         """
@@ -266,22 +523,26 @@ class DocumentProcessor:
             ids = [doc.metadata['chunk_id'] for doc in documents]
             
             # 生成嵌入向量
-            logger.info(f"开始生成{len(texts)}个文档块的嵌入向量...")
-            loop = asyncio.get_event_loop()
-            embeddings = await loop.run_in_executor(
-                None, self.generate_embeddings, texts
-            )
+            logger.info("开始生成{}个文档块的嵌入向量...", len(texts))
+            if self.http_client is not None:
+                embeddings = (await request_embeddings(self.http_client, texts)).tolist()
+            else:
+                loop = asyncio.get_running_loop()
+                embeddings = await loop.run_in_executor(
+                    _embedding_executor, self.generate_embeddings, texts
+                )
             
-            # 存储到向量数据库
+            # 分页写入向量数据库，upsert使重复处理同一文件时幂等
             logger.info("开始存储到向量数据库...")
-            await loop.run_in_executor(
-                None,
-                self.collection.add,
-                embeddings,
-                metadatas,
-                texts,
-                ids
-            )
+            for start in range(0, len(ids), CHROMA_UPSERT_PAGE_SIZE):
+                end = start + CHROMA_UPSERT_PAGE_SIZE
+                await asyncio.to_thread(
+                    self.collection.upsert,
+                    ids=ids[start:end],
+                    embeddings=embeddings[start:end],
+                    metadatas=metadatas[start:end],
+                    documents=texts[start:end]
+                )
             
             result = {
                 "stored_count": len(documents),
@@ -289,11 +550,11 @@ class DocumentProcessor:
                 "collection_name": settings.chroma_collection
             }
             
-            logger.info(f"文档存储完成: {result}")
+            logger.info("文档存储完成: {}", result)
             return result
             
         except Exception as e:
-            logger.error(f"文档存储失败: {e}")
+            logger.error("文档存储失败: {}", e)
             raise
     
     async def process_file(self, file_path: str) -> Dict[str, Any]:
@@ -305,9 +566,12 @@ class DocumentProcessor:
             
         Returns:
             Dict[str, Any]: 处理结果
+            
+        Raises:
+            FileNotFoundError: 文件不存在
         """
         try:
-            logger.info(f"开始处理文件: {file_path}")
+            logger.info("开始处理文件: {}", file_path)
             
             # 1. 加载文档
             documents = await self.load_document(file_path)
@@ -319,8 +583,8 @@ class DocumentProcessor:
                     "stored_count": 0
                 }
             
-            # 2. 分割文档
-            chunks = self.split_documents(documents)
+            # 2. 分割文档（纯Python计算，放到线程中避免阻塞事件循环）
+            chunks = await asyncio.to_thread(self.split_documents, documents)
             
             # 3. 存储文档
             store_result = await self.store_documents(chunks)
@@ -334,9 +598,50 @@ class DocumentProcessor:
                 **store_result
             }
             
-            logger.info(f"文件处理完成: {result}")
+            logger.info("文件处理完成: {}", result)
             return result
             
+        except FileNotFoundError:
+            raise
+        except Exception as e:
+            error_result = {
+                "success": False,
+                "message": f"文件处理失败: {str(e)}",
+                "file_path": file_path,
+                "error": str(e)
+            }
+            logger.error("文件处理失败: {}", error_result)
+            return error_result
+    
+    async def _load_and_split(
+        self,
+        semaphore: asyncio.Semaphore,
+        file_path: str
+    ) -> Dict[str, Any]:
+        """
+        在并发限制内加载文件并分块
+        
+        Args:
+            semaphore: 限制同时加载文件数的信号量
+            file_path: 文件路径
+            
+        Returns:
+            Dict[str, Any]: 包含file_path、original_docs和chunks的加载结果，失败时为错误结果
+        """
+        try:
+            async with semaphore:
+                documents = await self.load_document(file_path)
+            
+            chunks = []
+            if documents:
+                chunks = await asyncio.to_thread(self.split_documents, documents)
+            
+            return {
+                "file_path": file_path,
+                "original_docs": len(documents),
+                "chunks": chunks
+            }
+            
         except Exception as e:
             error_result = {
                 "success": False,
@@ -344,13 +649,73 @@ class DocumentProcessor:
                 "file_path": file_path,
                 "error": str(e)
             }
-            logger.error(f"文件处理失败: {error_result}")
+            logger.error("文件处理失败: {}", error_result)
             return error_result
     
+    async def _store_file_batch(self, batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        将多个文件的分块合并为一次向量化和写入
+        
+        Args:
+            batch: _load_and_split返回的加载结果列表
+            
+        Returns:
+            List[Dict[str, Any]]: 每个文件的处理结果
+        """
+        chunks = [chunk for loaded in batch for chunk in loaded["chunks"]]
+        
+        try:
+            await self.store_documents(chunks)
+        except Exception as e:
+            logger.error("批量存储失败: {}", e)
+            return [
+                {
+                    "success": False,
+                    "message": f"文件处理失败: {str(e)}",
+                    "file_path": loaded["file_path"],
+                    "error": str(e)
+                }
+                for loaded in batch
+            ]
+        
+        return [
+            {
+                "success": True,
+                "message": "文件处理完成",
+                "file_path": loaded["file_path"],
+                "original_docs": loaded["original_docs"],
+                "chunks_created": len(loaded["chunks"]),
+                "stored_count": len(loaded["chunks"]),
+                "skipped_count": 0,
+                "collection_name": settings.chroma_collection
+            }
+            for loaded in batch
+        ]
+    
+    @staticmethod
+    def _add_file_result(results: Dict[str, Any], file_result: Dict[str, Any]) -> None:
+        """
+        将单个文件的处理结果计入目录处理统计
+        
+        Args:
+            results: 目录处理结果统计
+            file_result: 文件处理结果
+        """
+        if file_result["success"]:
+            results["success_count"] += 1
+            results["total_chunks"] += file_result.get("chunks_created", 0)
+            results["processed_files"].append(file_result)
+        else:
+            results["error_count"] += 1
+            results["errors"].append(file_result)
+    
     async def process_directory(self, directory_path: str) -> Dict[str, Any]:
         """
         处理目录中的所有支持文件
         
+        文件并发加载和分块，分块按文件边界合并成批后统一向量化和存储，
+        加载剩余文件与写入已完成的批次同时进行
+        
         Args:
             directory_path: 目录路径
             
@@ -371,31 +736,59 @@ class DocumentProcessor:
         
         try:
             # 获取所有支持的文件
-            files_to_process = []
-            for ext in self.supported_formats.keys():
-                pattern = f"**/*{ext}"
-                files_to_process.extend(Path(directory_path).glob(pattern))
+            files_to_process = await asyncio.to_thread(
+                _find_files, directory_path, set(self.supported_formats)
+            )
             
             results["total_files"] = len(files_to_process)
-            logger.info(f"找到{len(files_to_process)}个待处理文件")
-            
-            # 处理每个文件
-            for file_path in files_to_process:
-                file_result = await self.process_file(str(file_path))
+            logger.info("找到{}个待处理文件", len(files_to_process))
+            
+            semaphore = asyncio.Semaphore(DIRECTORY_LOAD_CONCURRENCY)
+            tasks = [
+                self._load_and_split(semaphore, file_path)
+                for file_path in files_to_process
+            ]
+            
+            # 同一次处理中内容相同的文件只存储一次，避免分块ID重复
+            seen_hashes: Set[str] = set()
+            batch: List[Dict[str, Any]] = []
+            batch_chunks = 0
+            
+            for next_loaded in asyncio.as_completed(tasks):
+                loaded = await next_loaded
+                if loaded.get("success") is False:
+                    self._add_file_result(results, loaded)
+                    continue
                 
-                if file_result["success"]:
-                    results["success_count"] += 1
-                    results["total_chunks"] += file_result.get("chunks_created", 0)
-                    results["processed_files"].append(file_result)
-                else:
-                    results["error_count"] += 1
-                    results["errors"].append(file_result)
-            
-            logger.info(f"目录处理完成: {results}")
+                chunks = loaded["chunks"]
+                if not chunks or chunks[0].metadata["file_hash"] in seen_hashes:
+                    self._add_file_result(results, {
+                        "success": True,
+                        "message": "文件已处理，跳过",
+                        "file_path": loaded["file_path"],
+                        "stored_count": 0
+                    })
+                    continue
+                
+                seen_hashes.add(chunks[0].metadata["file_hash"])
+                batch.append(loaded)
+                batch_chunks += len(chunks)
+                
+                if batch_chunks >= STORE_BATCH_CHUNKS:
+                    for file_result in await self._store_file_batch(batch):
+                        self._add_file_result(results, file_result)
+                    batch = []
+                    batch_chunks = 0
+            
+            if batch:
+                for file_result in await self._store_file_batch(batch):
+                    self._add_file_result(results, file_result)
+            
+            logger.info("目录处理完成: {}", results)
             return results
             
         except Exception as e:
-            logger.error(f"目录处理失败: {e}")
+            logger.error("目录处理失败: {}", e)
             raise
     
     def get_collection_stats(self) -> Dict[str, Any]:
@@ -413,7 +806,7 @@ class DocumentProcessor:
                 "embedding_model": settings.embedding_model
             }
         except Exception as e:
-            logger.error(f"获取集合统计失败: {e}")
+            logger.error("获取集合统计失败: {}", e)
             return {"error": str(e)}
     
     async def delete_document(self, file_path: str) -> Dict[str, Any]:
@@ -427,10 +820,11 @@ class DocumentProcessor:
             Dict[str, Any]: 删除结果
         """
         try:
-            file_hash = self._get_file_hash(file_path)
+            file_hash = await asyncio.to_thread(self._get_file_hash, file_path)
             
             # 查找相关文档
-            results = self.collection.get(
+            results = await asyncio.to_thread(
+                self.collection.get,
                 where={"file_hash": file_hash}
             )
             
@@ -442,7 +836,7 @@ class DocumentProcessor:
                 }
             
             # 删除文档
-            self.collection.delete(ids=results['ids'])
+            await asyncio.to_thread(self.collection.delete, ids=results['ids'])
             
             result = {
                 "success": True,
@@ -451,7 +845,7 @@ class DocumentProcessor:
                 "file_path": file_path
             }
             
-            logger.info(f"文档删除完成: {result}")
+            logger.info("文档删除完成: {}", result)
             return result
             
         except Exception as e:
@@ -461,5 +855,12 @@ class DocumentProcessor:
                 "file_path": file_path,
                 "error": str(e)
             }
-            logger.error(f"文档删除失败: {error_result}")
-            return error_result
\ No newline at end of file
+            logger.error("文档删除失败: {}", error_result)
+            return error_result
+    
+    async def close(self) -> None:
+        """
+        关闭资源连接
+        """
+        if self.http_client is not None:
+            await self.http_client.aclose()
@@ -3,13 +3,16 @@
 负责基于RAG的问答处理：检索相关文档、生成回答
 """
 
-import json
+import hashlib
 import time
-from typing import List, Dict, Any, Optional, Tuple
+from typing import AsyncIterator, List, Dict, Any, Optional, Set, Tuple
 import asyncio
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
 import httpx
+import numpy as np
+import orjson
 import chromadb
 from chromadb.config import Settings
 from sentence_transformers import SentenceTransformer
@@ -17,11 +20,24 @@ import logging
 
 from ..config.settings import get_settings
 from ..utils.logger import get_logger
-from ..utils.cache import get_cache_client
+from ..utils.cache import CacheManager, get_cache_client
+from ..utils.clock import cached_clock
+from .document_processor import (
+    apply_embedding_precision,
+    get_distance_space,
+    request_embeddings,
+    round_embeddings
+)
 
 logger = get_logger(__name__)
 settings = get_settings()
 
+# 问题向量合批等待时间（秒），窗口内到达的问题合并为一次模型推理
+QUESTION_EMBEDDING_BATCH_WAIT = 0.01
+
+# 检索时只返回文本、元数据和距离，向量不随结果回传
+QUERY_INCLUDE = ["documents", "metadatas", "distances"]
+
 
 class QAProcessor:
     """
@@ -37,19 +53,45 @@ class QAProcessor:
         self.embedding_model = None
         self._init_embedding_model()
         
+        # 正在收集中的问题向量批次，以及尚未完成的合批任务（保留引用防止被回收）
+        self._pending_questions: Optional[List[Tuple[str, asyncio.Future]]] = None
+        self._embedding_batch_tasks: Set[asyncio.Task] = set()
+        
+        # 专用线程池：模型推理单线程执行避免重入，Chroma查询不与推理及默认线程池争用
+        self._embed_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed")
+        self._chroma_executor = ThreadPoolExecutor(
+            max_workers=settings.chroma_query_workers, thread_name_prefix="chroma"
+        )
+        
         # 初始化向量数据库连接
         self.chroma_client = None
         self.collection = None
+        self.distance_space = "cosine"
         self._init_chroma_client()
         
-        # 初始化HTTP客户端用于调用Ollama
-        self.http_client = httpx.AsyncClient(timeout=settings.ollama_timeout)
+        # 初始化HTTP客户端用于调用Ollama，整个进程复用同一连接池；
+        # httpx只在HTTPS上协商HTTP/2，明文地址保持HTTP/1.1长连接
+        self.http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(settings.ollama_timeout, connect=10.0),
+            limits=httpx.Limits(
+                max_connections=settings.ollama_max_connections,
+                max_keepalive_connections=settings.ollama_max_keepalive_connections,
+                keepalive_expiry=30.0
+            ),
+            http2=settings.ollama_base_url.startswith("https://")
+        )
+        
+        # 限制同时进行的生成请求数，超出Ollama并行能力的请求在客户端排队，而不是在服务端排队超时
+        self._generation_semaphore = asyncio.Semaphore(settings.ollama_num_parallel)
+        
+        # 答案缓存：进程内热点答案缓存在前，Redis在后
+        self.answer_cache = CacheManager()
         
         # 初始化缓存客户端
         self.cache_client = None
         self._init_cache_client()
         
-        # 系统提示词模板
+        # 系统提示词，每次请求内容不变，作为system字段单独发送以便Ollama复用前缀缓存
         self.system_prompt = """你是一个专业的知识库问答助手。请基于提供的相关文档内容来回答用户的问题。
 
 回答要求：
@@ -57,29 +99,39 @@ class QAProcessor:
 2. 如果文档内容不足以回答问题，请明确说明
 3. 回答要准确、简洁、有条理
 4. 如果可能，请引用具体的文档片段
-5. 使用中文回答
-
-相关文档内容：
+5. 使用中文回答"""
+        
+        # 用户提示词模板
+        self.prompt_template = """相关文档内容：
 {context}
 
 用户问题：{question}
 
 请基于上述文档内容回答用户问题："""
         
+        # 预先按占位符切分模板，构建提示词时直接拼接，不再逐次解析格式串
+        self._prompt_prefix, rest = self.prompt_template.split("{context}")
+        self._prompt_middle, self._prompt_suffix = rest.split("{question}")
+        
         logger.info("问答处理器初始化完成")
     
     def _init_embedding_model(self) -> None:
         """
         初始化嵌入模型
         """
+        if settings.embedding_endpoint:
+            logger.info("使用外部嵌入服务: {}", settings.embedding_endpoint)
+            return
+        
         try:
             self.embedding_model = SentenceTransformer(
                 settings.embedding_model,
                 device=settings.embedding_device
             )
-            logger.info(f"嵌入模型加载成功: {settings.embedding_model}")
+            precision = apply_embedding_precision(self.embedding_model)
+            logger.info("嵌入模型加载成功: {} ({})", settings.embedding_model, precision)
         except Exception as e:
-            logger.error(f"嵌入模型加载失败: {e}")
+            logger.error("嵌入模型加载失败: {}", e)
             raise
     
     def _init_chroma_client(self) -> None:
@@ -97,12 +149,37 @@ class QAProcessor:
             self.collection = self.chroma_client.get_collection(
                 name=settings.chroma_collection
             )
-            logger.info(f"连接到向量数据库集合: {settings.chroma_collection}")
-                
+            logger.info("连接到向量数据库集合: {}", settings.chroma_collection)
+            
+            # 旧集合可能使用默认的l2距离，检索时按实际度量换算相似度
+            self.distance_space = get_distance_space(self.collection)
+            if self.distance_space not in ("cosine", "ip", "l2"):
+                self.distance_space = "cosine"
+            
         except Exception as e:
-            logger.error(f"Chroma数据库连接失败: {e}")
+            logger.error("Chroma数据库连接失败: {}", e)
             raise
     
+    @property
+    def cache_client(self) -> Optional[Any]:
+        """
+        Redis缓存客户端，与答案缓存共用
+        
+        Returns:
+            Optional[Any]: Redis客户端实例，未连接时为None
+        """
+        return self.answer_cache.client
+    
+    @cache_client.setter
+    def cache_client(self, client: Optional[Any]) -> None:
+        """
+        指定Redis缓存客户端
+        
+        Args:
+            client: Redis客户端实例
+        """
+        self.answer_cache.client = client
+    
     def _init_cache_client(self) -> None:
         """
         初始化缓存客户端
@@ -111,7 +188,7 @@ class QAProcessor:
             self.cache_client = get_cache_client()
             logger.info("缓存客户端初始化成功")
         except Exception as e:
-            logger.warning(f"缓存客户端初始化失败: {e}")
+            logger.warning("缓存客户端初始化失败: {}", e)
             self.cache_client = None
     
     def _generate_cache_key(self, question: str, k: int = None) -> str:
@@ -126,9 +203,8 @@ class QAProcessor:
             str: 缓存键
         """
         k = k or settings.retrieval_k
-        import hashlib
-        content = f"{question}_{k}_{settings.similarity_threshold}"
-        return f"qa:{hashlib.md5(content.encode()).hexdigest()}"
+        content = f"{question}\x00{k}\x00{settings.similarity_threshold}"
+        return f"qa:{hashlib.blake2b(content.encode('utf-8'), digest_size=16).hexdigest()}"
     
     async def _get_cached_answer(self, cache_key: str) -> Optional[Dict[str, Any]]:
         """
@@ -140,60 +216,247 @@ class QAProcessor:
         Returns:
             Optional[Dict[str, Any]]: 缓存的答案，如果不存在返回None
         """
+        # 缓存中保存的是序列化后的字节，每次解析得到新对象，调用方可以直接修改
+        return await self.answer_cache.get_json(cache_key)
+    
+    async def _get_cached_answers(self, cache_keys: List[str]) -> List[Optional[Dict[str, Any]]]:
+        """
+        批量从缓存获取答案，进程内缓存未命中的键通过一次MGET读取
+        
+        Args:
+            cache_keys: 缓存键列表
+            
+        Returns:
+            List[Optional[Dict[str, Any]]]: 与缓存键一一对应的答案，不存在的位置为None
+        """
+        return await self.answer_cache.mget_json(cache_keys)
+    
+    async def _set_cached_answer(self, cache_key: str, answer_data: Dict[str, Any]) -> None:
+        """
+        设置缓存答案
+        
+        Args:
+            cache_key: 缓存键
+            answer_data: 答案数据
+        """
+        await self.answer_cache.set_json(cache_key, answer_data, settings.cache_ttl)
+    
+    async def _set_cached_answers(self, answers: Dict[str, Dict[str, Any]]) -> None:
+        """
+        批量设置缓存答案，通过一次管道往返写入
+        
+        Args:
+            answers: 缓存键到答案数据的映射
+        """
+        if answers:
+            await self.answer_cache.mset_json(answers, settings.cache_ttl)
+    
+    def clear_local_cache(self) -> None:
+        """
+        清空进程内答案缓存，知识库文档变更后调用
+        """
+        self.answer_cache.clear_local()
+    
+    def _generate_embedding_cache_key(self, question: str) -> str:
+        """
+        生成问题向量的缓存键，包含模型名称、推理精度和存储格式，切换后不会命中旧向量
+        
+        Args:
+            question: 用户问题
+            
+        Returns:
+            str: 缓存键
+        """
+        content = f"{settings.embedding_model}\x00{settings.embedding_precision}\x00float32\x00{question}"
+        return f"emb:{hashlib.blake2b(content.encode('utf-8'), digest_size=16).hexdigest()}"
+    
+    async def _get_cached_embedding(self, question: str) -> Optional[np.ndarray]:
+        """
+        从缓存获取问题向量
+        
+        Args:
+            question: 用户问题
+            
+        Returns:
+            Optional[np.ndarray]: 缓存的问题向量，如果不存在返回None
+        """
         if not self.cache_client:
             return None
         
         try:
-            cached_data = await self.cache_client.get(cache_key)
+            cached_data = await self.cache_client.get(self._generate_embedding_cache_key(question))
             if cached_data:
-                return json.loads(cached_data)
+                embedding = np.frombuffer(cached_data, dtype=np.float32)
+                return round_embeddings(embedding)
         except Exception as e:
-            logger.warning(f"获取缓存失败: {e}")
+            logger.warning("获取向量缓存失败: {}", e)
         
         return None
     
-    async def _set_cached_answer(self, cache_key: str, answer_data: Dict[str, Any]) -> None:
+    async def _set_cached_embedding(self, question: str, embedding: np.ndarray) -> None:
         """
-        设置缓存答案
+        缓存问题向量，以float32原始字节存储
         
         Args:
-            cache_key: 缓存键
-            answer_data: 答案数据
+            question: 用户问题
+            embedding: 问题向量
         """
         if not self.cache_client:
             return
         
         try:
             await self.cache_client.setex(
-                cache_key,
+                self._generate_embedding_cache_key(question),
                 settings.cache_ttl,
-                json.dumps(answer_data, ensure_ascii=False)
+                np.asarray(embedding, dtype=np.float32).tobytes()
             )
         except Exception as e:
-            logger.warning(f"设置缓存失败: {e}")
+            logger.warning("设置向量缓存失败: {}", e)
     
-    def generate_question_embedding(self, question: str) -> List[float]:
+    def generate_question_embeddings(self, questions: List[str]) -> np.ndarray:
+        """
+        批量生成问题的嵌入向量（同步阻塞，需在线程池中调用）
+        
+        Args:
+            questions: 问题列表
+            
+        Returns:
+            np.ndarray: 与问题一一对应的嵌入向量矩阵
+        """
+        try:
+            embeddings = self.embedding_model.encode(
+                questions,
+                batch_size=settings.embedding_batch_size,
+                normalize_embeddings=True,
+                show_progress_bar=False
+            )
+            return round_embeddings(embeddings)
+        except Exception as e:
+            logger.error("生成问题嵌入向量失败: {}", e)
+            raise
+    
+    async def _encode_questions(self, questions: List[str]) -> np.ndarray:
+        """
+        批量生成问题向量：配置了外部嵌入服务时通过HTTP请求，否则在专用线程池中本地推理
+        
+        Args:
+            questions: 问题列表
+            
+        Returns:
+            np.ndarray: 与问题一一对应的嵌入向量矩阵
+        """
+        if settings.embedding_endpoint:
+            return await request_embeddings(self.http_client, questions)
+        return await asyncio.get_running_loop().run_in_executor(
+            self._embed_executor, self.generate_question_embeddings, questions
+        )
+    
+    async def generate_question_embedding(self, question: str) -> np.ndarray:
         """
         生成问题的嵌入向量
         
+        优先读取向量缓存；未命中时，并发请求的问题在短时间窗口内合并为一批，
+        一次性送入模型推理，结果写回缓存
+        
         Args:
             question: 用户问题
             
         Returns:
-            List[float]: 问题的嵌入向量
+            np.ndarray: 问题的嵌入向量
         """
+        cached_embedding = await self._get_cached_embedding(question)
+        if cached_embedding is not None:
+            return cached_embedding
+        
+        loop = asyncio.get_running_loop()
+        batch = self._pending_questions
+        if batch is None or len(batch) >= settings.embedding_batch_size:
+            # 没有正在收集的批次（或已满）时开启新批次，窗口结束后由独立任务统一推理
+            batch = self._pending_questions = []
+            task = loop.create_task(self._run_question_batch(batch))
+            self._embedding_batch_tasks.add(task)
+            task.add_done_callback(self._embedding_batch_tasks.discard)
+        
+        future = loop.create_future()
+        batch.append((question, future))
+        embedding = await future
+        await self._set_cached_embedding(question, embedding)
+        return embedding
+    
+    async def _run_question_batch(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        """
+        等待一个合批窗口后批量生成问题向量，并将结果分发给各调用方
+        
+        Args:
+            batch: 收集中的(问题, Future)列表，窗口内仍会追加
+        """
+        await asyncio.sleep(QUESTION_EMBEDDING_BATCH_WAIT)
+        if self._pending_questions is batch:
+            self._pending_questions = None
+        
+        # 调用方已取消的请求不再计算
+        batch = [(question, future) for question, future in batch if not future.done()]
+        if not batch:
+            return
+        
         try:
-            embedding = self.embedding_model.encode([question])
-            return embedding[0].tolist()
+            embeddings = await self._encode_questions([question for question, _ in batch])
         except Exception as e:
-            logger.error(f"生成问题嵌入向量失败: {e}")
-            raise
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for (_, future), embedding in zip(batch, embeddings):
+                if not future.done():
+                    future.set_result(embedding)
+    
+    def _filter_documents(
+        self,
+        documents: List[str],
+        metadatas: List[Dict[str, Any]],
+        distances: List[float],
+        similarity_threshold: float
+    ) -> List[Dict[str, Any]]:
+        """
+        将单个问题的检索结果转换为文档列表，并过滤低相似度文档
+        
+        Args:
+            documents: 文档内容列表
+            metadatas: 文档元数据列表
+            distances: 向量距离列表
+            similarity_threshold: 相似度阈值
+            
+        Returns:
+            List[Dict[str, Any]]: 相关文档列表
+        """
+        if not documents:
+            return []
+        
+        # 计算相似度分数 (距离越小，相似度越高)，并一次性过滤低相似度文档。
+        # 向量均已归一化：cosine和ip的距离为 1 - cos，l2为平方欧氏距离 2 - 2cos
+        distances = np.asarray(distances, dtype=np.float64)
+        if self.distance_space == "l2":
+            similarity_scores = 1.0 - distances / 2.0
+        else:
+            similarity_scores = 1.0 - distances
+        keep_indices = np.flatnonzero(similarity_scores >= similarity_threshold).tolist()
+        similarity_scores = similarity_scores.tolist()
+        return [
+            {
+                'content': documents[i],
+                'metadata': metadatas[i],
+                'similarity_score': similarity_scores[i],
+                'rank': i + 1
+            }
+            for i in keep_indices
+        ]
     
     async def retrieve_documents(
         self, 
         question: str, 
         k: int = None,
-        similarity_threshold: float = None
+        similarity_threshold: float = None,
+        question_embedding: Optional[np.ndarray] = None
     ) -> List[Dict[str, Any]]:
         """
         检索相关文档
@@ -202,6 +465,7 @@ class QAProcessor:
             question: 用户问题
             k: 检索数量
             similarity_threshold: 相似度阈值
+            question_embedding: 已计算好的问题向量，为None时重新生成
             
         Returns:
             List[Dict[str, Any]]: 相关文档列表
@@ -211,46 +475,135 @@ class QAProcessor:
         
         try:
             # 生成问题嵌入向量
-            loop = asyncio.get_event_loop()
-            question_embedding = await loop.run_in_executor(
-                None, self.generate_question_embedding, question
-            )
+            if question_embedding is None:
+                question_embedding = await self.generate_question_embedding(question)
             
             # 检索相关文档
+            loop = asyncio.get_running_loop()
             results = await loop.run_in_executor(
-                None,
-                self.collection.query,
-                question_embedding,
-                k
+                self._chroma_executor,
+                partial(
+                    self.collection.query,
+                    # Chroma只接受Python浮点数，向量在此处才转换为列表
+                    query_embeddings=[np.asarray(question_embedding).tolist()],
+                    n_results=k,
+                    include=QUERY_INCLUDE
+                )
             )
             
             # 处理检索结果
             documents = []
             if results['documents'] and results['documents'][0]:
-                for i, (doc, metadata, distance) in enumerate(zip(
+                documents = self._filter_documents(
                     results['documents'][0],
                     results['metadatas'][0],
-                    results['distances'][0]
-                )):
-                    # 计算相似度分数 (距离越小，相似度越高)
-                    similarity_score = 1 - distance
-                    
-                    # 过滤低相似度文档
-                    if similarity_score >= similarity_threshold:
-                        documents.append({
-                            'content': doc,
-                            'metadata': metadata,
-                            'similarity_score': similarity_score,
-                            'rank': i + 1
-                        })
-            
-            logger.info(f"检索到{len(documents)}个相关文档 (阈值: {similarity_threshold})")
+                    results['distances'][0],
+                    similarity_threshold
+                )
+            
+            logger.info("检索到{}个相关文档 (阈值: {})", len(documents), similarity_threshold)
             return documents
             
         except Exception as e:
-            logger.error(f"文档检索失败: {e}")
+            logger.error("文档检索失败: {}", e)
+            raise
+    
+    async def retrieve_documents_batch(
+        self,
+        questions: List[str],
+        k: int = None,
+        similarity_threshold: float = None
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        批量检索相关文档
+        
+        所有问题的向量一次生成，并通过一次向量数据库查询完成检索
+        
+        Args:
+            questions: 问题列表
+            k: 每个问题的检索数量
+            similarity_threshold: 相似度阈值
+            
+        Returns:
+            List[List[Dict[str, Any]]]: 与问题一一对应的相关文档列表
+        """
+        k = k or settings.retrieval_k
+        similarity_threshold = similarity_threshold or settings.similarity_threshold
+        
+        try:
+            question_embeddings = await self._encode_questions(questions)
+            results = await asyncio.get_running_loop().run_in_executor(
+                self._chroma_executor,
+                partial(
+                    self.collection.query,
+                    query_embeddings=np.asarray(question_embeddings).tolist(),
+                    n_results=k,
+                    include=QUERY_INCLUDE
+                )
+            )
+            
+            if len(results['documents']) != len(questions):
+                raise ValueError("检索结果数量与问题数量不一致")
+            
+            batch_documents = [
+                self._filter_documents(
+                    results['documents'][i],
+                    results['metadatas'][i],
+                    results['distances'][i],
+                    similarity_threshold
+                )
+                for i in range(len(questions))
+            ]
+            logger.info("批量检索完成: {}个问题 (阈值: {})", len(questions), similarity_threshold)
+            return batch_documents
+            
+        except Exception as e:
+            logger.error("批量文档检索失败: {}", e)
             raise
     
+    def _build_generate_payload(
+        self,
+        question: str,
+        context_documents: List[Dict[str, Any]],
+        stream: bool
+    ) -> Dict[str, Any]:
+        """
+        构建Ollama生成接口的请求体
+        
+        Args:
+            question: 用户问题
+            context_documents: 上下文文档列表
+            stream: 是否流式返回
+            
+        Returns:
+            Dict[str, Any]: 请求体
+        """
+        # 构建上下文
+        context_parts = []
+        for i, doc in enumerate(context_documents, 1):
+            context_parts.append(
+                f"文档片段{i} (相似度: {doc['similarity_score']:.3f}):\n"
+                f"{doc['content']}\n"
+            )
+        
+        context = "\n".join(context_parts)
+        
+        # 构建用户提示词
+        prompt = "".join((
+            self._prompt_prefix, context, self._prompt_middle, question, self._prompt_suffix
+        ))
+        
+        return {
+            "model": settings.ollama_model,
+            "system": self.system_prompt,
+            "prompt": prompt,
+            "stream": stream,
+            "options": {
+                "temperature": settings.temperature,
+                "num_predict": settings.max_tokens
+            }
+        }
+    
     async def generate_answer(
         self, 
         question: str, 
@@ -267,43 +620,20 @@ class QAProcessor:
             Dict[str, Any]: 生成的答案和相关信息
         """
         try:
-            # 构建上下文
-            context_parts = []
-            for i, doc in enumerate(context_documents, 1):
-                context_parts.append(
-                    f"文档片段{i} (相似度: {doc['similarity_score']:.3f}):\n"
-                    f"{doc['content']}\n"
-                )
-            
-            context = "\n".join(context_parts)
-            
-            # 构建完整提示词
-            prompt = self.system_prompt.format(
-                context=context,
-                question=question
-            )
-            
             # 调用Ollama生成答案
-            start_time = time.time()
+            start_time = time.perf_counter()
             
-            payload = {
-                "model": settings.ollama_model,
-                "prompt": prompt,
-                "stream": False,
-                "options": {
-                    "temperature": settings.temperature,
-                    "num_predict": settings.max_tokens
-                }
-            }
+            payload = self._build_generate_payload(question, context_documents, stream=False)
             
-            response = await self.http_client.post(
-                f"{settings.ollama_base_url}/api/generate",
-                json=payload
-            )
+            async with self._generation_semaphore:
+                response = await self.http_client.post(
+                    f"{settings.ollama_base_url}/api/generate",
+                    json=payload
+                )
             response.raise_for_status()
             
-            result = response.json()
-            generation_time = time.time() - start_time
+            result = orjson.loads(response.content)
+            generation_time = time.perf_counter() - start_time
             
             answer_data = {
                 "answer": result.get("response", "").strip(),
@@ -311,7 +641,7 @@ class QAProcessor:
                 "context_documents": context_documents,
                 "generation_time": generation_time,
                 "model": settings.ollama_model,
-                "timestamp": datetime.now().isoformat(),
+                "timestamp": cached_clock.now().isoformat(),
                 "token_count": {
                     "prompt_tokens": result.get("prompt_eval_count", 0),
                     "completion_tokens": result.get("eval_count", 0),
@@ -319,11 +649,11 @@ class QAProcessor:
                 }
             }
             
-            logger.info(f"答案生成完成，耗时: {generation_time:.2f}秒")
+            logger.info("答案生成完成，耗时: {:.2f}秒", generation_time)
             return answer_data
             
         except Exception as e:
-            logger.error(f"答案生成失败: {e}")
+            logger.error("答案生成失败: {}", e)
             raise
     
     async def process_question(
@@ -331,7 +661,8 @@ class QAProcessor:
         question: str,
         k: int = None,
         similarity_threshold: float = None,
-        use_cache: bool = True
+        use_cache: bool = True,
+        documents: Optional[List[Dict[str, Any]]] = None
     ) -> Dict[str, Any]:
         """
         处理用户问题的完整流程
@@ -341,28 +672,34 @@ class QAProcessor:
             k: 检索文档数量
             similarity_threshold: 相似度阈值
             use_cache: 是否使用缓存
+            documents: 调用方已检索到的相关文档，传入时跳过缓存读取和检索
             
         Returns:
             Dict[str, Any]: 问答结果
         """
+        embedding_task: Optional[asyncio.Task] = None
         try:
-            start_time = time.time()
+            start_time = time.perf_counter()
             
-            # 检查缓存
+            # 检查缓存，同时提前开始生成问题向量，缓存命中时取消
             cache_key = self._generate_cache_key(question, k)
-            if use_cache:
+            if use_cache and documents is None:
+                if self.cache_client:
+                    embedding_task = asyncio.create_task(self.generate_question_embedding(question))
                 cached_answer = await self._get_cached_answer(cache_key)
                 if cached_answer:
                     cached_answer["from_cache"] = True
-                    cached_answer["total_time"] = time.time() - start_time
+                    cached_answer["total_time"] = time.perf_counter() - start_time
                     logger.info("从缓存返回答案")
                     return cached_answer
             
             # 1. 检索相关文档
-            logger.info(f"开始处理问题: {question}")
-            documents = await self.retrieve_documents(
-                question, k, similarity_threshold
-            )
+            logger.info("开始处理问题: {}", question)
+            if documents is None:
+                question_embedding = await embedding_task if embedding_task else None
+                documents = await self.retrieve_documents(
+                    question, k, similarity_threshold, question_embedding=question_embedding
+                )
             
             if not documents:
                 result = {
@@ -371,7 +708,7 @@ class QAProcessor:
                     "answer": "抱歉，我在知识库中没有找到与您问题相关的信息。请尝试重新表述您的问题或联系管理员添加相关文档。",
                     "question": question,
                     "context_documents": [],
-                    "total_time": time.time() - start_time,
+                    "total_time": time.perf_counter() - start_time,
                     "from_cache": False
                 }
                 return result
@@ -384,7 +721,7 @@ class QAProcessor:
                 "success": True,
                 "message": "问答处理完成",
                 "from_cache": False,
-                "total_time": time.time() - start_time,
+                "total_time": time.perf_counter() - start_time,
                 "retrieval_stats": {
                     "retrieved_count": len(documents),
                     "similarity_threshold": similarity_threshold or settings.similarity_threshold,
@@ -397,7 +734,7 @@ class QAProcessor:
             if use_cache:
                 await self._set_cached_answer(cache_key, result)
             
-            logger.info(f"问答处理完成，总耗时: {result['total_time']:.2f}秒")
+            logger.info("问答处理完成，总耗时: {:.2f}秒", result['total_time'])
             return result
             
         except Exception as e:
@@ -407,11 +744,172 @@ class QAProcessor:
                 "answer": "抱歉，处理您的问题时出现了错误。请稍后重试或联系管理员。",
                 "question": question,
                 "error": str(e),
-                "total_time": time.time() - start_time,
+                "total_time": time.perf_counter() - start_time,
                 "from_cache": False
             }
-            logger.error(f"问答处理失败: {error_result}")
+            logger.error("问答处理失败: {}", error_result)
             return error_result
+        finally:
+            # 缓存命中或出错时丢弃提前生成的问题向量
+            if embedding_task is not None:
+                if not embedding_task.done():
+                    embedding_task.cancel()
+                elif not embedding_task.cancelled():
+                    # 读取一次异常，避免任务失败后出现异常未被获取的警告
+                    embedding_task.exception()
+    
+    async def generate_answer_stream(
+        self,
+        question: str,
+        context_documents: List[Dict[str, Any]]
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        基于检索到的文档流式生成答案
+        
+        Args:
+            question: 用户问题
+            context_documents: 上下文文档列表
+            
+        Yields:
+            Dict[str, Any]: Ollama返回的每个流式片段，最后一个片段的done为True并带有token统计
+        """
+        payload = self._build_generate_payload(question, context_documents, stream=True)
+        
+        async with self._generation_semaphore, self.http_client.stream(
+            "POST",
+            f"{settings.ollama_base_url}/api/generate",
+            json=payload
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                chunk = orjson.loads(line)
+                yield chunk
+                # done片段之后不再读取，连接可尽快归还连接池
+                if chunk.get("done"):
+                    break
+    
+    async def process_question_stream(
+        self,
+        question: str,
+        k: int = None,
+        similarity_threshold: float = None,
+        use_cache: bool = True
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        流式处理用户问题
+        
+        检索完成后立即开始推送生成的token，最终结果与process_question一致并写入缓存
+        
+        Args:
+            question: 用户问题
+            k: 检索文档数量
+            similarity_threshold: 相似度阈值
+            use_cache: 是否使用缓存
+            
+        Yields:
+            Tuple[str, Dict[str, Any]]: (事件类型, 事件数据)，事件类型依次为
+                generation、token（多次）、answer；失败时为error
+        """
+        start_time = time.perf_counter()
+        
+        try:
+            # 检查缓存
+            cache_key = self._generate_cache_key(question, k)
+            if use_cache:
+                cached_answer = await self._get_cached_answer(cache_key)
+                if cached_answer:
+                    cached_answer["from_cache"] = True
+                    cached_answer["total_time"] = time.perf_counter() - start_time
+                    logger.info("从缓存返回答案")
+                    yield "answer", cached_answer
+                    return
+            
+            # 1. 检索相关文档
+            logger.info("开始流式处理问题: {}", question)
+            documents = await self.retrieve_documents(
+                question, k, similarity_threshold
+            )
+            
+            if not documents:
+                yield "error", {
+                    "success": False,
+                    "message": "未找到相关文档",
+                    "answer": "抱歉，我在知识库中没有找到与您问题相关的信息。请尝试重新表述您的问题或联系管理员添加相关文档。",
+                    "question": question,
+                    "context_documents": [],
+                    "total_time": time.perf_counter() - start_time,
+                    "from_cache": False
+                }
+                return
+            
+            # 2. 流式生成答案
+            yield "generation", {"context_count": len(documents)}
+            
+            generation_start = time.perf_counter()
+            answer_parts = []
+            final_chunk: Dict[str, Any] = {}
+            async for chunk in self.generate_answer_stream(question, documents):
+                if "error" in chunk:
+                    raise RuntimeError(f"Ollama生成失败: {chunk['error']}")
+                token = chunk.get("response", "")
+                if token:
+                    answer_parts.append(token)
+                    yield "token", {"content": token}
+                if chunk.get("done"):
+                    final_chunk = chunk
+            
+            # 流在done片段之前结束（如连接中断）时答案不完整，按失败处理且不写入缓存
+            if not final_chunk:
+                raise RuntimeError("Ollama流式响应在生成完成前中断")
+            
+            generation_time = time.perf_counter() - generation_start
+            prompt_tokens = final_chunk.get("prompt_eval_count", 0)
+            completion_tokens = final_chunk.get("eval_count", 0)
+            
+            # 3. 构建最终结果
+            result = {
+                "success": True,
+                "message": "问答处理完成",
+                "from_cache": False,
+                "total_time": time.perf_counter() - start_time,
+                "retrieval_stats": {
+                    "retrieved_count": len(documents),
+                    "similarity_threshold": similarity_threshold or settings.similarity_threshold,
+                    "avg_similarity": sum(doc['similarity_score'] for doc in documents) / len(documents)
+                },
+                "answer": "".join(answer_parts).strip(),
+                "question": question,
+                "context_documents": documents,
+                "generation_time": generation_time,
+                "model": settings.ollama_model,
+                "timestamp": cached_clock.now().isoformat(),
+                "token_count": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens
+                }
+            }
+            
+            # 4. 缓存结果
+            if use_cache:
+                await self._set_cached_answer(cache_key, result)
+            
+            logger.info("流式问答处理完成，总耗时: {:.2f}秒", result['total_time'])
+            yield "answer", result
+            
+        except Exception as e:
+            logger.error("流式问答处理失败: {}", e)
+            yield "error", {
+                "success": False,
+                "message": f"问答处理失败: {str(e)}",
+                "answer": "抱歉，处理您的问题时出现了错误。请稍后重试或联系管理员。",
+                "question": question,
+                "error": str(e),
+                "total_time": time.perf_counter() - start_time,
+                "from_cache": False
+            }
     
     async def batch_process_questions(
         self, 
@@ -429,12 +927,49 @@ class QAProcessor:
             List[Dict[str, Any]]: 批量处理结果
         """
         try:
-            logger.info(f"开始批量处理{len(questions)}个问题")
+            logger.info("开始批量处理{}个问题", len(questions))
+            start_time = time.perf_counter()
+            
+            # 先一次性读取缓存，未命中的问题通过一次向量数据库查询统一检索
+            use_cache = kwargs.pop("use_cache", True)
+            cache_keys = [self._generate_cache_key(question, kwargs.get("k")) for question in questions]
+            cached_answers = [None] * len(questions)
+            if use_cache:
+                cached_answers = await self._get_cached_answers(cache_keys)
+            
+            missed_questions = [
+                question for question, cached in zip(questions, cached_answers) if not cached
+            ]
+            retrieved: Dict[str, List[Dict[str, Any]]] = {}
+            if missed_questions:
+                try:
+                    batch_documents = await self.retrieve_documents_batch(
+                        missed_questions, kwargs.get("k"), kwargs.get("similarity_threshold")
+                    )
+                    retrieved = dict(zip(missed_questions, batch_documents))
+                except Exception as e:
+                    logger.warning("批量检索失败，改为逐个检索: {}", e)
+            
+            # 并发生成答案，同时处理的问题数不超过并发上限，避免压垮Ollama后端
+            semaphore = asyncio.Semaphore(settings.qa_concurrency)
+            
+            async def process_limited(
+                question: str,
+                cached_answer: Optional[Dict[str, Any]]
+            ) -> Dict[str, Any]:
+                if cached_answer:
+                    cached_answer["from_cache"] = True
+                    cached_answer["total_time"] = time.perf_counter() - start_time
+                    return cached_answer
+                # 新生成的答案在全部完成后统一写入缓存
+                async with semaphore:
+                    return await self.process_question(
+                        question, documents=retrieved.get(question), use_cache=False, **kwargs
+                    )
             
-            # 并发处理问题
             tasks = [
-                self.process_question(question, **kwargs)
-                for question in questions
+                process_limited(question, cached)
+                for question, cached in zip(questions, cached_answers)
             ]
             
             results = await asyncio.gather(*tasks, return_exceptions=True)
@@ -452,11 +987,18 @@ class QAProcessor:
                 else:
                     processed_results.append(result)
             
-            logger.info(f"批量处理完成: {len(processed_results)}个结果")
+            if use_cache:
+                await self._set_cached_answers({
+                    cache_key: result
+                    for cache_key, result in zip(cache_keys, processed_results)
+                    if result.get("success") and not result.get("from_cache")
+                })
+            
+            logger.info("批量处理完成: {}个结果", len(processed_results))
             return processed_results
             
         except Exception as e:
-            logger.error(f"批量处理失败: {e}")
+            logger.error("批量处理失败: {}", e)
             raise
     
     def get_stats(self) -> Dict[str, Any]:
@@ -476,10 +1018,11 @@ class QAProcessor:
                 "llm_model": settings.ollama_model,
                 "retrieval_k": settings.retrieval_k,
                 "similarity_threshold": settings.similarity_threshold,
-                "cache_enabled": self.cache_client is not None
+                "cache_enabled": self.cache_client is not None,
+                "local_cache_size": self.answer_cache.local_size
             }
         except Exception as e:
-            logger.error(f"获取统计信息失败: {e}")
+            logger.error("获取统计信息失败: {}", e)
             return {"error": str(e)}
     
     async def close(self) -> None:
@@ -487,12 +1030,13 @@ class QAProcessor:
         关闭资源连接
         """
         try:
+            # 缓存客户端为全局共享，由RAG引擎通过close_cache_client()统一关闭
             await self.http_client.aclose()
-            if self.cache_client:
-                await self.cache_client.close()
+            self._embed_executor.shutdown(wait=False, cancel_futures=True)
+            self._chroma_executor.shutdown(wait=False, cancel_futures=True)
             logger.info("问答处理器资源已关闭")
         except Exception as e:
-            logger.error(f"关闭资源失败: {e}")
+            logger.error("关闭资源失败: {}", e)
     
     async def __aenter__(self):
         """异步上下文管理器入口"""
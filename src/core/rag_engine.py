@@ -4,16 +4,18 @@ RAG引擎主模块
 """
 
 import asyncio
-from typing import Dict, Any, List, Optional, Union
+from typing import AsyncIterator, Dict, Any, List, Optional, Tuple, Union
 from pathlib import Path
 import time
 
+import orjson
+
 from .document_processor import DocumentProcessor
 from .qa_processor import QAProcessor
 from ..config.settings import get_settings
 from ..utils.logger import get_logger
-from ..utils.metrics import metrics_collector, metrics_middleware
-from ..utils.cache import init_cache_client
+from ..utils.metrics import metrics_collector, metrics_middleware, request_metrics_buffer
+from ..utils.cache import close_cache_client, init_cache_client
 
 logger = get_logger(__name__)
 settings = get_settings()
@@ -47,7 +49,7 @@ class RAGEngine:
                 await init_cache_client()
                 logger.info("缓存客户端初始化成功")
             except Exception as e:
-                logger.warning(f"缓存客户端初始化失败，将在无缓存模式下运行: {e}")
+                logger.warning("缓存客户端初始化失败，将在无缓存模式下运行: {}", e)
             
             # 初始化文档处理器
             logger.info("初始化文档处理器...")
@@ -61,7 +63,7 @@ class RAGEngine:
             logger.info("RAG引擎初始化完成")
             
         except Exception as e:
-            logger.error(f"RAG引擎初始化失败: {e}")
+            logger.error("RAG引擎初始化失败: {}", e)
             raise
     
     def _check_initialized(self) -> None:
@@ -89,11 +91,14 @@ class RAGEngine:
             
         Returns:
             Dict[str, Any]: 处理结果
+            
+        Raises:
+            FileNotFoundError: 文件不存在
         """
         self._check_initialized()
         
         try:
-            logger.info(f"开始处理文档: {file_path}")
+            logger.info("开始处理文档: {}", file_path)
             result = await self.document_processor.process_file(file_path)
             
             # 记录指标
@@ -113,8 +118,10 @@ class RAGEngine:
             
             return result
             
+        except FileNotFoundError:
+            raise
         except Exception as e:
-            logger.error(f"文档处理失败: {e}")
+            logger.error("文档处理失败: {}", e)
             metrics_collector.record_document_processing("error", 0)
             return {
                 "success": False,
@@ -138,11 +145,14 @@ class RAGEngine:
             
         Returns:
             Dict[str, Any]: 处理结果
+            
+        Raises:
+            FileNotFoundError: 目录不存在
         """
         self._check_initialized()
         
         try:
-            logger.info(f"开始处理目录: {directory_path}")
+            logger.info("开始处理目录: {}", directory_path)
             result = await self.document_processor.process_directory(directory_path)
             
             # 记录指标
@@ -159,8 +169,10 @@ class RAGEngine:
             
             return result
             
+        except FileNotFoundError:
+            raise
         except Exception as e:
-            logger.error(f"目录处理失败: {e}")
+            logger.error("目录处理失败: {}", e)
             metrics_collector.record_document_processing("error", 0)
             return {
                 "success": False,
@@ -194,7 +206,7 @@ class RAGEngine:
         self._check_initialized()
         
         try:
-            logger.info(f"开始处理问题: {question}")
+            logger.info("开始处理问题: {}", question)
             result = await self.qa_processor.process_question(
                 question=question,
                 k=k,
@@ -204,25 +216,22 @@ class RAGEngine:
             
             # 记录指标
             if result.get("success"):
-                metrics_collector.record_qa_processing(
+                request_metrics_buffer.record_qa(
                     "success",
                     0,  # 耗时已在装饰器中记录
                     len(result.get("context_documents", []))
                 )
                 
                 # 记录缓存操作
-                if result.get("from_cache"):
-                    metrics_collector.record_cache_operation("get", "success", True)
-                else:
-                    metrics_collector.record_cache_operation("get", "success", False)
+                request_metrics_buffer.record_cache_get(bool(result.get("from_cache")))
             else:
-                metrics_collector.record_qa_processing("error", 0)
+                request_metrics_buffer.record_qa("error", 0)
             
             return result
             
         except Exception as e:
-            logger.error(f"问答处理失败: {e}")
-            metrics_collector.record_qa_processing("error", 0)
+            logger.error("问答处理失败: {}", e)
+            request_metrics_buffer.record_qa("error", 0)
             return {
                 "success": False,
                 "message": f"问答处理失败: {str(e)}",
@@ -230,6 +239,47 @@ class RAGEngine:
                 "error": str(e)
             }
     
+    async def answer_question_stream(
+        self,
+        question: str,
+        k: Optional[int] = None,
+        similarity_threshold: Optional[float] = None,
+        use_cache: bool = True
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        流式回答用户问题
+        
+        Args:
+            question: 用户问题
+            k: 检索文档数量
+            similarity_threshold: 相似度阈值
+            use_cache: 是否使用缓存
+            
+        Yields:
+            Tuple[str, Dict[str, Any]]: (事件类型, 事件数据)
+        """
+        self._check_initialized()
+        
+        start_time = time.perf_counter()
+        async for event, payload in self.qa_processor.process_question_stream(
+            question=question,
+            k=k,
+            similarity_threshold=similarity_threshold,
+            use_cache=use_cache
+        ):
+            # 记录指标
+            if event == "answer":
+                request_metrics_buffer.record_qa(
+                    "success",
+                    time.perf_counter() - start_time,
+                    len(payload.get("context_documents", []))
+                )
+                request_metrics_buffer.record_cache_get(bool(payload.get("from_cache")))
+            elif event == "error":
+                request_metrics_buffer.record_qa("error", 0)
+            
+            yield event, payload
+    
     async def batch_answer_questions(
         self,
         questions: List[str],
@@ -248,7 +298,7 @@ class RAGEngine:
         self._check_initialized()
         
         try:
-            logger.info(f"开始批量处理{len(questions)}个问题")
+            logger.info("开始批量处理{}个问题", len(questions))
             
             # 使用QAProcessor的批量处理方法
             results = await self.qa_processor.batch_process_questions(
@@ -258,18 +308,18 @@ class RAGEngine:
             # 记录指标
             for result in results:
                 if result.get("success"):
-                    metrics_collector.record_qa_processing(
+                    request_metrics_buffer.record_qa(
                         "success",
                         result.get("total_time", 0),
                         len(result.get("context_documents", []))
                     )
                 else:
-                    metrics_collector.record_qa_processing("error", 0)
+                    request_metrics_buffer.record_qa("error", 0)
             
             return results
             
         except Exception as e:
-            logger.error(f"批量问答处理失败: {e}")
+            logger.error("批量问答处理失败: {}", e)
             return [{
                 "success": False,
                 "message": f"批量问答处理失败: {str(e)}",
@@ -290,13 +340,16 @@ class RAGEngine:
         self._check_initialized()
         
         try:
-            logger.info(f"开始删除文档: {file_path}")
+            logger.info("开始删除文档: {}", file_path)
             result = await self.document_processor.delete_document(file_path)
             
             # 记录指标
             if result.get("success"):
                 metrics_collector.record_vector_db_operation("delete", "success")
                 
+                # 已删除文档的答案不能再从进程内缓存返回
+                self.qa_processor.clear_local_cache()
+                
                 # 更新向量数据库文档数量
                 stats = self.document_processor.get_collection_stats()
                 if "total_documents" in stats:
@@ -307,7 +360,7 @@ class RAGEngine:
             return result
             
         except Exception as e:
-            logger.error(f"文档删除失败: {e}")
+            logger.error("文档删除失败: {}", e)
             metrics_collector.record_vector_db_operation("delete", "error")
             return {
                 "success": False,
@@ -351,7 +404,7 @@ class RAGEngine:
             }
             
         except Exception as e:
-            logger.error(f"获取系统统计信息失败: {e}")
+            logger.error("获取系统统计信息失败: {}", e)
             return {"error": str(e)}
     
     def get_supported_formats(self) -> List[str]:
@@ -362,12 +415,69 @@ class RAGEngine:
             List[str]: 支持的文档格式列表
         """
         self._check_initialized()
-        return list(self.document_processor.supported_formats.keys())
+        return list(self.document_processor.supported_formats)
+    
+    async def _check_vector_database(self) -> Dict[str, Any]:
+        """
+        检查向量数据库连接
+        
+        Returns:
+            Dict[str, Any]: 组件健康状态
+        """
+        stats = await asyncio.to_thread(self.document_processor.get_collection_stats)
+        return {
+            "status": "healthy",
+            "document_count": stats.get("total_documents", 0)
+        }
+    
+    async def _check_llm(self) -> Dict[str, Any]:
+        """
+        检查LLM连接
+        
+        只查询Ollama已有的模型列表，不发起生成请求，频繁的健康检查不会占用GPU
+        
+        Returns:
+            Dict[str, Any]: 组件健康状态
+            
+        Raises:
+            ValueError: Ollama中不存在配置的模型
+        """
+        response = await self.qa_processor.http_client.get(
+            f"{settings.ollama_base_url}/api/tags",
+            timeout=settings.health_check_timeout
+        )
+        response.raise_for_status()
+        
+        # 未指定标签的模型名称在Ollama中以:latest结尾
+        model_names = {model.get("name") for model in orjson.loads(response.content).get("models", [])}
+        if not {settings.ollama_model, f"{settings.ollama_model}:latest"} & model_names:
+            raise ValueError(f"Ollama中不存在模型: {settings.ollama_model}")
+        
+        return {
+            "status": "healthy",
+            "model": settings.ollama_model
+        }
+    
+    async def _check_cache(self) -> Dict[str, Any]:
+        """
+        检查缓存连接
+        
+        Returns:
+            Dict[str, Any]: 组件健康状态
+        """
+        if not self.qa_processor.cache_client:
+            return {"status": "disabled"}
+        
+        await self.qa_processor.cache_client.ping()
+        return {"status": "healthy"}
     
     async def health_check(self) -> Dict[str, Any]:
         """
         健康检查
         
+        各组件并发检查，每个组件的耗时不超过settings.health_check_timeout，
+        超时的组件标记为degraded
+        
         Returns:
             Dict[str, Any]: 健康检查结果
         """
@@ -388,61 +498,39 @@ class RAGEngine:
                 health_status["status"] = "unhealthy"
                 return health_status
             
-            # 检查向量数据库连接
-            try:
-                stats = self.document_processor.get_collection_stats()
-                health_status["components"]["vector_database"] = {
-                    "status": "healthy",
-                    "document_count": stats.get("total_documents", 0)
-                }
-            except Exception as e:
-                health_status["components"]["vector_database"] = {
-                    "status": "unhealthy",
-                    "error": str(e)
-                }
-                health_status["status"] = "unhealthy"
-            
-            # 检查LLM连接
-            try:
-                # 简单的测试问题
-                test_result = await self.qa_processor.process_question(
-                    "测试连接",
-                    k=1,
-                    use_cache=False
-                )
-                health_status["components"]["llm"] = {
-                    "status": "healthy",
-                    "model": settings.ollama_model
-                }
-            except Exception as e:
-                health_status["components"]["llm"] = {
-                    "status": "unhealthy",
-                    "error": str(e)
-                }
-                health_status["status"] = "unhealthy"
+            # 缓存失败不影响整体健康状态
+            checks = (
+                ("vector_database", self._check_vector_database(), True),
+                ("llm", self._check_llm(), True),
+                ("cache", self._check_cache(), False),
+            )
+            timeout = settings.health_check_timeout
+            results = await asyncio.gather(
+                *(asyncio.wait_for(check, timeout) for _, check, _ in checks),
+                return_exceptions=True
+            )
             
-            # 检查缓存连接
-            try:
-                if self.qa_processor.cache_client:
-                    await self.qa_processor.cache_client.ping()
-                    health_status["components"]["cache"] = {
-                        "status": "healthy"
+            for (name, _, critical), result in zip(checks, results):
+                if isinstance(result, asyncio.TimeoutError):
+                    result = {
+                        "status": "degraded",
+                        "error": f"检查超时 ({timeout}秒)"
                     }
-                else:
-                    health_status["components"]["cache"] = {
-                        "status": "disabled"
+                    if critical and health_status["status"] == "healthy":
+                        health_status["status"] = "degraded"
+                elif isinstance(result, Exception):
+                    result = {
+                        "status": "unhealthy",
+                        "error": str(result)
                     }
-            except Exception as e:
-                health_status["components"]["cache"] = {
-                    "status": "unhealthy",
-                    "error": str(e)
-                }
-                # 缓存失败不影响整体健康状态
+                    if critical:
+                        health_status["status"] = "unhealthy"
+                health_status["components"][name] = result
             
             return health_status
             
         except Exception as e:
-            logger.error(f"健康检查失败: {e}")
+            logger.error("健康检查失败: {}", e)
             return {
                 "status": "unhealthy",
                 "timestamp": time.time(),
@@ -456,11 +544,14 @@ class RAGEngine:
         try:
             if self.qa_processor:
                 await self.qa_processor.close()
+            if self.document_processor:
+                await self.document_processor.close()
+            await close_cache_client()
             
             logger.info("RAG引擎资源已释放")
             
         except Exception as e:
-            logger.error(f"关闭RAG引擎失败: {e}")
+            logger.error("关闭RAG引擎失败: {}", e)
     
     async def __aenter__(self):
         """异步上下文管理器入口"""
@@ -6,13 +6,15 @@ RAG知识库问答系统 - FastAPI应用主文件
 import asyncio
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
-from fastapi.responses import JSONResponse, RedirectResponse
+from fastapi.responses import ORJSONResponse, RedirectResponse
 import uvicorn
 
 from .config.settings import get_settings
-from .utils.logger import get_logger
+from .utils.logger import complete_logging, get_logger
 from .core.rag_engine import rag_engine
-from .api.middleware import setup_middleware
+from .utils.metrics import request_metrics_buffer, system_metrics_sampler
+from .utils.clock import cached_clock
+from .api.middleware import setup_middleware, request_log_writer
 from .api.routes import documents, qa, system
 
 # 获取配置和日志
@@ -29,18 +31,24 @@ async def lifespan(app: FastAPI):
     # 启动事件
     logger.info("🚀 RAG系统启动中...")
     
+    # 启动缓存时钟，请求日志和请求指标的后台写入任务，以及系统指标采样任务
+    cached_clock.start()
+    request_log_writer.start()
+    request_metrics_buffer.start()
+    system_metrics_sampler.start()
+    
     try:
         # 初始化RAG引擎
         await rag_engine.initialize()
         logger.info("✅ RAG引擎初始化完成")
         
         # 应用启动完成
-        logger.info(f"🎉 RAG系统启动完成 - {settings.app_name} v{settings.app_version}")
-        logger.info(f"📡 服务地址: http://{settings.host}:{settings.port}")
-        logger.info(f"📚 API文档: http://{settings.host}:{settings.port}/docs")
+        logger.info("🎉 RAG系统启动完成 - {} v{}", settings.app_name, settings.app_version)
+        logger.info("📡 服务地址: http://{}:{}", settings.host, settings.port)
+        logger.info("📚 API文档: http://{}:{}/docs", settings.host, settings.port)
         
     except Exception as e:
-        logger.error(f"❌ RAG系统启动失败: {e}")
+        logger.error("❌ RAG系统启动失败: {}", e)
         raise
     
     yield
@@ -54,9 +62,18 @@ async def lifespan(app: FastAPI):
         logger.info("✅ RAG引擎已关闭")
         
     except Exception as e:
-        logger.error(f"❌ RAG系统关闭失败: {e}")
+        logger.error("❌ RAG系统关闭失败: {}", e)
+    
+    # 写出剩余的请求日志和请求指标
+    await system_metrics_sampler.stop()
+    await request_metrics_buffer.stop()
+    await request_log_writer.stop()
+    await cached_clock.stop()
     
     logger.info("👋 RAG系统已关闭")
+    
+    # 写出后台队列中剩余的日志
+    await complete_logging()
 
 
 # 创建FastAPI应用
@@ -95,6 +112,7 @@ app = FastAPI(
     docs_url="/docs",
     redoc_url="/redoc",
     openapi_url="/openapi.json",
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
@@ -154,7 +172,7 @@ async def not_found_handler(request, exc):
     """
     404错误处理
     """
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=404,
         content={
             "success": False,
@@ -176,8 +194,8 @@ async def internal_error_handler(request, exc):
     """
     500错误处理
     """
-    logger.error(f"内部服务器错误: {exc}")
-    return JSONResponse(
+    logger.error("内部服务器错误: {}", exc)
+    return ORJSONResponse(
         status_code=500,
         content={
             "success": False,
@@ -202,29 +220,32 @@ def main():
     应用入口点
     """
     try:
-        logger.info(f"启动RAG系统服务器...")
-        logger.info(f"配置信息:")
-        logger.info(f"  - 应用名称: {settings.app_name}")
-        logger.info(f"  - 版本: {settings.app_version}")
-        logger.info(f"  - 监听地址: {settings.host}:{settings.port}")
-        logger.info(f"  - 调试模式: {settings.debug}")
-        logger.info(f"  - 工作进程: {settings.workers}")
+        logger.info("启动RAG系统服务器...")
+        logger.info("配置信息:")
+        logger.info("  - 应用名称: {}", settings.app_name)
+        logger.info("  - 版本: {}", settings.app_version)
+        logger.info("  - 监听地址: {}:{}", settings.host, settings.port)
+        logger.info("  - 调试模式: {}", settings.debug)
+        logger.info("  - 工作进程: {}", settings.workers)
         
-        # 启动服务器
+        # 启动服务器：loop="auto"在安装了uvloop时自动使用uvloop(由uvicorn[standard]提供，Windows上除外)，
+        # httptools解析器同样由uvicorn[standard]提供；调试模式下启用热重载并保留访问日志
         uvicorn.run(
             "src.main:app",
             host=settings.host,
             port=settings.port,
             workers=settings.workers,
+            loop="auto",
+            http="httptools",
             log_level=settings.log_level.lower(),
             reload=settings.debug,
-            access_log=True
+            access_log=settings.debug
         )
         
     except KeyboardInterrupt:
         logger.info("收到中断信号，正在关闭服务器...")
     except Exception as e:
-        logger.error(f"服务器启动失败: {e}")
+        logger.error("服务器启动失败: {}", e)
         raise
 
 
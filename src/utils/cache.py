@@ -3,21 +3,54 @@
 提供Redis缓存客户端和相关工具函数
 """
 
-import json
-from typing import Any, Optional, Union, List, Dict
-import aioredis
-from aioredis import Redis
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Union, List, Dict, Tuple
+
+import orjson
+from redis.asyncio import BlockingConnectionPool, Redis
 
 from ..config.settings import get_settings
 from .logger import get_logger
+from .metrics import metrics_collector
 
 logger = get_logger(__name__)
 settings = get_settings()
 
+# SCAN每步建议返回的键数量，以及批量删除时每次提交的键数量
+SCAN_COUNT = 1000
+DELETE_BATCH_SIZE = 500
+
 # 全局缓存客户端实例
 _cache_client: Optional[Redis] = None
 
 
+def _dumps(value: Any) -> bytes:
+    """
+    序列化缓存对象
+    
+    Args:
+        value: 要缓存的对象
+        
+    Returns:
+        bytes: JSON字节
+    """
+    return orjson.dumps(value)
+
+
+def _loads(data: Union[str, bytes]) -> Any:
+    """
+    反序列化缓存对象
+    
+    Args:
+        data: JSON字节或字符串
+        
+    Returns:
+        Any: 解析后的对象
+    """
+    return orjson.loads(data)
+
+
 async def init_cache_client() -> Redis:
     """
     初始化Redis缓存客户端
@@ -34,22 +67,24 @@ async def init_cache_client() -> Redis:
             if settings.redis_password:
                 redis_url = f"redis://:{settings.redis_password}@{settings.redis_host}:{settings.redis_port}/{settings.redis_db}"
             
-            _cache_client = aioredis.from_url(
+            # 连接池满时最多等待5秒而不是新建连接，限制并发请求下的连接数
+            connection_pool = BlockingConnectionPool.from_url(
                 redis_url,
-                encoding="utf-8",
-                decode_responses=True,
+                max_connections=settings.redis_pool_size,
+                timeout=5,
                 socket_connect_timeout=5,
                 socket_timeout=5,
                 retry_on_timeout=True,
                 health_check_interval=30
             )
+            _cache_client = Redis(connection_pool=connection_pool)
             
             # 测试连接
             await _cache_client.ping()
-            logger.info(f"Redis缓存客户端连接成功: {settings.redis_host}:{settings.redis_port}")
+            logger.info("Redis缓存客户端连接成功: {}:{}", settings.redis_host, settings.redis_port)
             
         except Exception as e:
-            logger.error(f"Redis缓存客户端连接失败: {e}")
+            logger.error("Redis缓存客户端连接失败: {}", e)
             _cache_client = None
             raise
     
@@ -74,10 +109,10 @@ async def close_cache_client() -> None:
     
     if _cache_client:
         try:
-            await _cache_client.close()
+            await _cache_client.aclose(close_connection_pool=True)
             logger.info("Redis缓存客户端连接已关闭")
         except Exception as e:
-            logger.error(f"关闭Redis缓存客户端失败: {e}")
+            logger.error("关闭Redis缓存客户端失败: {}", e)
         finally:
             _cache_client = None
 
@@ -86,6 +121,10 @@ class CacheManager:
     """
     缓存管理器类
     提供高级缓存操作接口
+    
+    读取先查询进程内缓存（L1，保存序列化后的字节），未命中再访问Redis；
+    通过本管理器写入或删除时同步更新L1，L1条目的存活时间不超过写入时指定的过期时间。
+    其他进程的修改最多在local_cache_ttl秒后可见
     """
     
     def __init__(self, client: Optional[Redis] = None):
@@ -95,9 +134,64 @@ class CacheManager:
         Args:
             client: Redis客户端实例，如果为None则使用全局客户端
         """
-        self.client = client or get_cache_client()
+        self._client = client
+        self._l1 = LocalTTLCache(settings.local_cache_size, settings.local_cache_ttl)
+    
+    @property
+    def client(self) -> Optional[Redis]:
+        """
+        Redis客户端实例
+        
+        未指定客户端时每次读取全局客户端，模块级实例在init_cache_client()之前创建也能使用
+        
+        Returns:
+            Optional[Redis]: Redis客户端实例，如果未初始化返回None
+        """
+        return self._client or get_cache_client()
     
-    async def get(self, key: str) -> Optional[str]:
+    @client.setter
+    def client(self, client: Optional[Redis]) -> None:
+        """
+        指定Redis客户端实例
+        
+        Args:
+            client: Redis客户端实例，为None时使用全局客户端
+        """
+        self._client = client
+    
+    @property
+    def local_size(self) -> int:
+        """
+        进程内缓存的条目数
+        
+        Returns:
+            int: 条目数
+        """
+        return len(self._l1)
+    
+    def clear_local(self) -> None:
+        """
+        清空进程内缓存，不影响Redis中的数据
+        """
+        self._l1.clear()
+    
+    def _get_local(self, key: str) -> Optional[bytes]:
+        """
+        读取进程内缓存并记录L1命中情况
+        
+        L1命中单独计数，不计入整体缓存命中率（整体命中率按问答结果是否来自缓存统计）
+        
+        Args:
+            key: 缓存键
+            
+        Returns:
+            Optional[bytes]: 缓存值的原始字节，如果不存在返回None
+        """
+        value = self._l1.get(key)
+        metrics_collector.record_cache_operation("l1_get", "hit" if value is not None else "miss")
+        return value
+    
+    async def get(self, key: str) -> Optional[bytes]:
         """
         获取缓存值
         
@@ -105,21 +199,29 @@ class CacheManager:
             key: 缓存键
             
         Returns:
-            Optional[str]: 缓存值，如果不存在返回None
+            Optional[bytes]: 缓存值的原始字节，如果不存在返回None
         """
+        value = self._get_local(key)
+        if value is not None:
+            return value
+        
         if not self.client:
             return None
         
         try:
-            return await self.client.get(key)
+            value = await self.client.get(key)
         except Exception as e:
-            logger.error(f"获取缓存失败 {key}: {e}")
+            logger.error("获取缓存失败 {}: {}", key, e)
             return None
+        
+        if value is not None:
+            self._l1.set(key, value)
+        return value
     
     async def set(
         self, 
         key: str, 
-        value: str, 
+        value: Union[str, bytes], 
         expire: Optional[int] = None
     ) -> bool:
         """
@@ -133,6 +235,7 @@ class CacheManager:
         Returns:
             bool: 是否设置成功
         """
+        self._l1.delete(key)
         if not self.client:
             return False
         
@@ -141,10 +244,12 @@ class CacheManager:
                 await self.client.setex(key, expire, value)
             else:
                 await self.client.set(key, value)
-            return True
         except Exception as e:
-            logger.error(f"设置缓存失败 {key}: {e}")
+            logger.error("设置缓存失败 {}: {}", key, e)
             return False
+        
+        self._l1.set(key, value.encode("utf-8") if isinstance(value, str) else value, expire)
+        return True
     
     async def delete(self, key: str) -> bool:
         """
@@ -156,6 +261,7 @@ class CacheManager:
         Returns:
             bool: 是否删除成功
         """
+        self._l1.delete(key)
         if not self.client:
             return False
         
@@ -163,7 +269,7 @@ class CacheManager:
             result = await self.client.delete(key)
             return result > 0
         except Exception as e:
-            logger.error(f"删除缓存失败 {key}: {e}")
+            logger.error("删除缓存失败 {}: {}", key, e)
             return False
     
     async def exists(self, key: str) -> bool:
@@ -183,7 +289,7 @@ class CacheManager:
             result = await self.client.exists(key)
             return result > 0
         except Exception as e:
-            logger.error(f"检查缓存存在性失败 {key}: {e}")
+            logger.error("检查缓存存在性失败 {}: {}", key, e)
             return False
     
     async def expire(self, key: str, seconds: int) -> bool:
@@ -197,6 +303,8 @@ class CacheManager:
         Returns:
             bool: 是否设置成功
         """
+        # L1条目不记录Redis中的过期时间，直接淘汰，下次读取时重新从Redis加载
+        self._l1.delete(key)
         if not self.client:
             return False
         
@@ -204,7 +312,7 @@ class CacheManager:
             result = await self.client.expire(key, seconds)
             return result
         except Exception as e:
-            logger.error(f"设置缓存过期时间失败 {key}: {e}")
+            logger.error("设置缓存过期时间失败 {}: {}", key, e)
             return False
     
     async def ttl(self, key: str) -> int:
@@ -223,7 +331,7 @@ class CacheManager:
         try:
             return await self.client.ttl(key)
         except Exception as e:
-            logger.error(f"获取缓存TTL失败 {key}: {e}")
+            logger.error("获取缓存TTL失败 {}: {}", key, e)
             return -2
     
     async def get_json(self, key: str) -> Optional[Any]:
@@ -241,9 +349,9 @@ class CacheManager:
             return None
         
         try:
-            return json.loads(value)
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON解析失败 {key}: {e}")
+            return _loads(value)
+        except orjson.JSONDecodeError as e:
+            logger.error("JSON解析失败 {}: {}", key, e)
             return None
     
     async def set_json(
@@ -264,10 +372,83 @@ class CacheManager:
             bool: 是否设置成功
         """
         try:
-            json_value = json.dumps(value, ensure_ascii=False)
-            return await self.set(key, json_value, expire)
+            return await self.set(key, _dumps(value), expire)
         except (TypeError, ValueError) as e:
-            logger.error(f"JSON序列化失败 {key}: {e}")
+            logger.error("JSON序列化失败 {}: {}", key, e)
+            return False
+    
+    async def mget_json(self, keys: List[str]) -> List[Optional[Any]]:
+        """
+        批量获取JSON格式的缓存值，L1未命中的键通过一次MGET往返读取
+        
+        Args:
+            keys: 缓存键列表
+            
+        Returns:
+            List[Optional[Any]]: 与键一一对应的解析结果，不存在或解析失败的位置为None
+        """
+        values = [self._get_local(key) for key in keys]
+        missed = [i for i, value in enumerate(values) if value is None]
+        
+        if missed and self.client:
+            try:
+                fetched = await self.client.mget([keys[i] for i in missed])
+            except Exception as e:
+                logger.error("批量获取缓存失败: {}", e)
+                fetched = [None] * len(missed)
+            for i, value in zip(missed, fetched):
+                if value is not None:
+                    values[i] = value
+                    self._l1.set(keys[i], value)
+        
+        results = []
+        for key, value in zip(keys, values):
+            if value is None:
+                results.append(None)
+                continue
+            try:
+                results.append(_loads(value))
+            except orjson.JSONDecodeError as e:
+                logger.error("JSON解析失败 {}: {}", key, e)
+                results.append(None)
+        return results
+    
+    async def mset_json(
+        self,
+        mapping: Dict[str, Any],
+        expire: Optional[int] = None
+    ) -> bool:
+        """
+        批量设置JSON格式的缓存值，通过非事务管道一次往返写入
+        
+        Args:
+            mapping: 缓存键到缓存对象的映射
+            expire: 过期时间（秒），None表示不过期
+            
+        Returns:
+            bool: 是否设置成功
+        """
+        for key in mapping:
+            self._l1.delete(key)
+        if not self.client:
+            return False
+        if not mapping:
+            return True
+        
+        try:
+            serialized = {key: _dumps(value) for key, value in mapping.items()}
+            async with self.client.pipeline(transaction=False) as pipe:
+                for key, json_value in serialized.items():
+                    if expire:
+                        pipe.setex(key, expire, json_value)
+                    else:
+                        pipe.set(key, json_value)
+                await pipe.execute()
+            for key, json_value in serialized.items():
+                self._l1.set(key, json_value, expire)
+            return True
+        except Exception as e:
+            logger.error("批量设置缓存失败: {}", e)
             return False
     
     async def increment(self, key: str, amount: int = 1) -> Optional[int]:
@@ -287,48 +468,60 @@ class CacheManager:
         try:
             return await self.client.incrby(key, amount)
         except Exception as e:
-            logger.error(f"递增缓存失败 {key}: {e}")
+            logger.error("递增缓存失败 {}: {}", key, e)
             return None
     
-    async def get_keys(self, pattern: str) -> List[str]:
+    async def get_keys(self, pattern: str) -> List[bytes]:
         """
         根据模式获取缓存键列表
         
+        使用SCAN分步遍历，避免KEYS在键较多时长时间阻塞Redis
+        
         Args:
             pattern: 键模式（支持通配符）
             
         Returns:
-            List[str]: 匹配的键列表
+            List[bytes]: 匹配的键列表
         """
         if not self.client:
             return []
         
         try:
-            return await self.client.keys(pattern)
+            return [key async for key in self.client.scan_iter(match=pattern, count=SCAN_COUNT)]
         except Exception as e:
-            logger.error(f"获取缓存键列表失败 {pattern}: {e}")
+            logger.error("获取缓存键列表失败 {}: {}", pattern, e)
             return []
     
     async def clear_pattern(self, pattern: str) -> int:
         """
         清除匹配模式的所有缓存
         
+        通过SCAN边遍历边分批删除，不一次性加载全部键
+        
         Args:
             pattern: 键模式（支持通配符）
             
         Returns:
             int: 删除的键数量
         """
+        # L1无法按模式匹配，整体清空
+        self._l1.clear()
         if not self.client:
             return 0
         
         try:
-            keys = await self.get_keys(pattern)
-            if keys:
-                return await self.client.delete(*keys)
-            return 0
+            deleted = 0
+            batch = []
+            async for key in self.client.scan_iter(match=pattern, count=SCAN_COUNT):
+                batch.append(key)
+                if len(batch) >= DELETE_BATCH_SIZE:
+                    deleted += await self.client.delete(*batch)
+                    batch = []
+            if batch:
+                deleted += await self.client.delete(*batch)
+            return deleted
         except Exception as e:
-            logger.error(f"清除缓存模式失败 {pattern}: {e}")
+            logger.error("清除缓存模式失败 {}: {}", pattern, e)
             return 0
     
     async def get_stats(self) -> Dict[str, Any]:
@@ -352,9 +545,88 @@ class CacheManager:
                 "redis_version": info.get("redis_version", "unknown")
             }
         except Exception as e:
-            logger.error(f"获取缓存统计信息失败: {e}")
+            logger.error("获取缓存统计信息失败: {}", e)
             return {"error": str(e)}
 
 
+class LocalTTLCache:
+    """
+    进程内LRU缓存，条目在ttl秒后过期
+    
+    放在Redis前面缓存热点数据，命中时省去一次网络往返。
+    仅在事件循环线程中使用，不加锁
+    """
+    
+    def __init__(self, maxsize: int, ttl: float):
+        """
+        初始化进程内缓存
+        
+        Args:
+            maxsize: 最大条目数，为0时不缓存任何内容
+            ttl: 过期时间（秒）
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+    
+    def get(self, key: str) -> Optional[Any]:
+        """
+        获取缓存值
+        
+        Args:
+            key: 缓存键
+            
+        Returns:
+            Optional[Any]: 缓存值，如果不存在或已过期返回None
+        """
+        item = self._data.get(key)
+        if item is None:
+            return None
+        
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        
+        self._data.move_to_end(key)
+        return value
+    
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """
+        设置缓存值，超出容量时淘汰最久未使用的条目
+        
+        Args:
+            key: 缓存键
+            value: 缓存值
+            ttl: 该条目的过期时间（秒），不超过缓存的ttl，None表示使用缓存的ttl
+        """
+        if self.maxsize <= 0:
+            return
+        
+        lifetime = min(ttl, self.ttl) if ttl else self.ttl
+        self._data[key] = (time.monotonic() + lifetime, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+    
+    def delete(self, key: str) -> None:
+        """
+        删除缓存值
+        
+        Args:
+            key: 缓存键
+        """
+        self._data.pop(key, None)
+    
+    def clear(self) -> None:
+        """
+        清空缓存
+        """
+        self._data.clear()
+    
+    def __len__(self) -> int:
+        return len(self._data)
+
+
 # 创建全局缓存管理器实例
 cache_manager = CacheManager()
\ No newline at end of file
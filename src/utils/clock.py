@@ -0,0 +1,73 @@
+"""
+时钟工具模块
+提供按固定间隔刷新的缓存时间，减少高频路径上的系统时钟调用
+"""
+
+import asyncio
+from datetime import datetime
+from typing import Optional
+
+
+class CachedClock:
+    """
+    缓存时钟类
+    由后台任务按固定间隔刷新当前时间，读取时直接返回缓存值；
+    后台任务未启动时退化为直接读取系统时间
+    """
+    
+    def __init__(self, resolution: float = 0.01):
+        """
+        初始化缓存时钟
+        
+        Args:
+            resolution: 刷新间隔（秒），即缓存时间的精度
+        """
+        self.resolution = resolution
+        self._now: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+    
+    def now(self) -> datetime:
+        """
+        获取当前时间
+        
+        Returns:
+            datetime: 缓存的当前本地时间，误差不超过刷新间隔
+        """
+        if self._now is None:
+            return datetime.now()
+        return self._now
+    
+    def start(self) -> None:
+        """
+        启动后台刷新任务（需在事件循环中调用）
+        """
+        if self._task is None:
+            self._now = datetime.now()
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self) -> None:
+        """
+        停止后台刷新任务
+        """
+        if self._task is None:
+            return
+        
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._now = None
+    
+    async def _run(self) -> None:
+        """
+        后台任务：按固定间隔刷新缓存时间
+        """
+        while True:
+            await asyncio.sleep(self.resolution)
+            self._now = datetime.now()
+
+
+# 创建全局缓存时钟实例
+cached_clock = CachedClock()
@@ -5,14 +5,28 @@
 
 import logging
 import sys
+from contextvars import ContextVar
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional
 from loguru import logger as loguru_logger
 
 from ..config.settings import get_settings
 
 settings = get_settings()
 
+# 当前请求ID，由API中间件在每个请求开始时设置
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+
+
+def get_request_id() -> str:
+    """
+    获取当前上下文中的请求ID
+    
+    Returns:
+        str: 请求ID，不在请求上下文中时返回"-"
+    """
+    return request_id_var.get()
+
 
 class InterceptHandler(logging.Handler):
     """
@@ -44,6 +58,13 @@ def setup_logging() -> None:
     # 移除默认的loguru处理器
     loguru_logger.remove()
     
+    # 日志写入放到后台线程，调用方只做一次入队；异常的变量诊断信息仅在调试模式输出
+    sink_options = {
+        "enqueue": True,
+        "backtrace": settings.debug,
+        "diagnose": settings.debug
+    }
+    
     # 添加控制台输出
     loguru_logger.add(
         sys.stdout,
@@ -52,7 +73,8 @@ def setup_logging() -> None:
                "<level>{level: <8}</level> | "
                "<cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> | "
                "<level>{message}</level>",
-        colorize=True
+        colorize=True,
+        **sink_options
     )
     
     # 添加文件输出
@@ -66,7 +88,8 @@ def setup_logging() -> None:
         format="{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {name}:{function}:{line} | {message}",
         rotation="10 MB",
         retention="7 days",
-        compression="zip"
+        compression="zip",
+        **sink_options
     )
     
     # 错误日志
@@ -76,7 +99,8 @@ def setup_logging() -> None:
         format="{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {name}:{function}:{line} | {message}",
         rotation="10 MB",
         retention="30 days",
-        compression="zip"
+        compression="zip",
+        **sink_options
     )
     
     # 拦截标准库日志
@@ -88,22 +112,24 @@ def setup_logging() -> None:
     logging.getLogger("sentence_transformers").setLevel(logging.WARNING)
 
 
-def get_logger(name: Optional[str] = None) -> "loguru.Logger":
+async def complete_logging() -> None:
+    """
+    等待后台队列中的日志全部写出，应用关闭时调用
+    """
+    await loguru_logger.complete()
+
+
+@lru_cache(maxsize=None)
+def get_logger(name: str = "app") -> "loguru.Logger":
     """
-    获取logger实例
+    获取logger实例，相同名称返回同一个实例
     
     Args:
-        name: logger名称，默认为调用模块名
+        name: logger名称，通常传入模块的__name__
         
     Returns:
         loguru.Logger: logger实例
     """
-    if name is None:
-        # 获取调用者的模块名
-        import inspect
-        frame = inspect.currentframe().f_back
-        name = frame.f_globals.get('__name__', 'unknown')
-    
     return loguru_logger.bind(name=name)
 
 
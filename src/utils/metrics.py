@@ -3,8 +3,9 @@
 提供Prometheus指标收集和导出功能
 """
 
+import asyncio
 import time
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List, Tuple
 from functools import wraps
 from prometheus_client import (
     Counter, Histogram, Gauge, Info,
@@ -176,6 +177,35 @@ class MetricsCollector:
             method=method
         ).observe(duration)
     
+    def record_request_batch(
+        self,
+        endpoint: str,
+        method: str,
+        status: str,
+        durations: List[float]
+    ) -> None:
+        """
+        批量记录同一端点、方法、状态的请求指标
+        
+        Args:
+            endpoint: 端点名称
+            method: HTTP方法
+            status: 响应状态
+            durations: 各请求的耗时列表
+        """
+        request_count.labels(
+            endpoint=endpoint,
+            method=method,
+            status=status
+        ).inc(len(durations))
+        
+        histogram = request_duration.labels(
+            endpoint=endpoint,
+            method=method
+        )
+        for duration in durations:
+            histogram.observe(duration)
+    
     def record_document_processing(
         self, 
         status: str, 
@@ -213,6 +243,25 @@ class MetricsCollector:
         if retrieved_docs > 0:
             qa_retrieval_documents.observe(retrieved_docs)
     
+    def record_qa_processing_batch(
+        self,
+        status: str,
+        entries: List[Tuple[float, int]]
+    ) -> None:
+        """
+        批量记录同一状态的问答处理指标
+        
+        Args:
+            status: 处理状态
+            entries: 各次问答的(处理耗时, 检索到的文档数量)列表
+        """
+        qa_processing_count.labels(status=status).inc(len(entries))
+        
+        for duration, retrieved_docs in entries:
+            qa_processing_duration.observe(duration)
+            if retrieved_docs > 0:
+                qa_retrieval_documents.observe(retrieved_docs)
+    
     def record_cache_operation(
         self, 
         operation: str, 
@@ -233,16 +282,27 @@ class MetricsCollector:
         ).inc()
         
         if operation == 'get' and is_hit is not None:
+            # 命中率在定期更新系统指标时统一计算
             if is_hit:
                 self.cache_hits += 1
             else:
                 self.cache_misses += 1
-            
-            # 更新缓存命中率
-            total = self.cache_hits + self.cache_misses
-            if total > 0:
-                hit_rate = self.cache_hits / total
-                cache_hit_rate.set(hit_rate)
+    
+    def record_cache_get_batch(self, hits: int, misses: int) -> None:
+        """
+        批量记录缓存读取指标
+        
+        Args:
+            hits: 命中次数
+            misses: 未命中次数
+        """
+        cache_operations.labels(
+            operation="get",
+            status="success"
+        ).inc(hits + misses)
+        
+        self.cache_hits += hits
+        self.cache_misses += misses
     
     def record_vector_db_operation(
         self, 
@@ -270,13 +330,23 @@ class MetricsCollector:
         """
         vector_db_documents.set(count)
     
+    def update_cache_hit_rate(self) -> None:
+        """
+        根据累计的命中和未命中次数更新缓存命中率
+        """
+        total = self.cache_hits + self.cache_misses
+        if total > 0:
+            cache_hit_rate.set(self.cache_hits / total)
+    
     def update_system_metrics(self) -> None:
         """
-        更新系统资源指标
+        更新系统资源指标（非阻塞），同时更新缓存命中率
         """
+        self.update_cache_hit_rate()
+        
         try:
-            # CPU使用率
-            cpu_percent = psutil.cpu_percent(interval=1)
+            # CPU使用率：返回距上次调用以来的平均值，不在此处等待采样
+            cpu_percent = psutil.cpu_percent(interval=None)
             system_cpu_usage.set(cpu_percent)
             
             # 内存使用情况
@@ -288,7 +358,7 @@ class MetricsCollector:
             system_disk_usage.labels(path='/').set(disk_usage.used)
             
         except Exception as e:
-            logger.error(f"更新系统指标失败: {e}")
+            logger.error("更新系统指标失败: {}", e)
     
     def get_metrics_summary(self) -> Dict[str, Any]:
         """
@@ -307,61 +377,261 @@ class MetricsCollector:
                 "system_disk_percent": psutil.disk_usage('/').percent
             }
         except Exception as e:
-            logger.error(f"获取指标摘要失败: {e}")
+            logger.error("获取指标摘要失败: {}", e)
             return {"error": str(e)}
 
 
+class RequestMetricsBuffer:
+    """
+    请求指标缓冲区
+    请求路径上只做一次字典查找和列表追加，由后台任务定期批量写入Prometheus指标，
+    避免每个请求都经过带锁的计数器和直方图更新。
+    覆盖HTTP请求、问答处理和缓存读取这些每个请求都会产生的指标
+    """
+    
+    def __init__(self, collector: "MetricsCollector", flush_interval: float = 1.0):
+        """
+        初始化请求指标缓冲区
+        
+        Args:
+            collector: 指标收集器
+            flush_interval: 批量写入间隔（秒）
+        """
+        self.collector = collector
+        self.flush_interval = flush_interval
+        self._pending: Dict[Tuple[str, str, str], List[float]] = {}
+        self._pending_qa: Dict[str, List[Tuple[float, int]]] = {}
+        self._pending_cache_hits = 0
+        self._pending_cache_misses = 0
+        self._task: Optional[asyncio.Task] = None
+    
+    def record(
+        self,
+        endpoint: str,
+        method: str,
+        status: str,
+        duration: float
+    ) -> None:
+        """
+        记录一次请求指标
+        
+        Args:
+            endpoint: 端点名称
+            method: HTTP方法
+            status: 响应状态
+            duration: 请求耗时
+        """
+        if self._task is None:
+            # 后台任务未启动时直接写入
+            self.collector.record_request(endpoint, method, status, duration)
+            return
+        
+        key = (endpoint, method, status)
+        durations = self._pending.get(key)
+        if durations is None:
+            self._pending[key] = [duration]
+        else:
+            durations.append(duration)
+    
+    def record_qa(
+        self,
+        status: str,
+        duration: float,
+        retrieved_docs: int = 0
+    ) -> None:
+        """
+        记录一次问答处理指标
+        
+        Args:
+            status: 处理状态
+            duration: 处理耗时
+            retrieved_docs: 检索到的文档数量
+        """
+        if self._task is None:
+            self.collector.record_qa_processing(status, duration, retrieved_docs)
+            return
+        
+        entries = self._pending_qa.get(status)
+        if entries is None:
+            self._pending_qa[status] = [(duration, retrieved_docs)]
+        else:
+            entries.append((duration, retrieved_docs))
+    
+    def record_cache_get(self, is_hit: bool) -> None:
+        """
+        记录一次缓存读取
+        
+        Args:
+            is_hit: 是否命中缓存
+        """
+        if self._task is None:
+            self.collector.record_cache_operation("get", "success", is_hit)
+            return
+        
+        if is_hit:
+            self._pending_cache_hits += 1
+        else:
+            self._pending_cache_misses += 1
+    
+    def flush(self) -> None:
+        """
+        将缓冲的指标批量写入指标收集器
+        """
+        pending, self._pending = self._pending, {}
+        for (endpoint, method, status), durations in pending.items():
+            try:
+                self.collector.record_request_batch(endpoint, method, status, durations)
+            except Exception as e:
+                logger.error("写入请求指标失败: {}", e)
+        
+        pending_qa, self._pending_qa = self._pending_qa, {}
+        for status, entries in pending_qa.items():
+            try:
+                self.collector.record_qa_processing_batch(status, entries)
+            except Exception as e:
+                logger.error("写入问答指标失败: {}", e)
+        
+        hits, misses = self._pending_cache_hits, self._pending_cache_misses
+        if hits or misses:
+            self._pending_cache_hits = 0
+            self._pending_cache_misses = 0
+            try:
+                self.collector.record_cache_get_batch(hits, misses)
+            except Exception as e:
+                logger.error("写入缓存指标失败: {}", e)
+    
+    def start(self) -> None:
+        """
+        启动后台批量写入任务（需在事件循环中调用）
+        """
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self) -> None:
+        """
+        停止后台任务并写入剩余指标
+        """
+        if self._task is None:
+            return
+        
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self.flush()
+    
+    async def _run(self) -> None:
+        """
+        后台任务：按固定间隔批量写入指标
+        """
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self.flush()
+
+
+class SystemMetricsSampler:
+    """
+    系统资源指标采样器
+    由后台任务定期更新CPU、内存、磁盘和缓存命中率指标，Prometheus抓取时直接读取已有的Gauge值
+    """
+    
+    def __init__(self, collector: "MetricsCollector", interval: float = 5.0):
+        """
+        初始化系统资源指标采样器
+        
+        Args:
+            collector: 指标收集器
+            interval: 采样间隔（秒）
+        """
+        self.collector = collector
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+    
+    @property
+    def running(self) -> bool:
+        """后台采样任务是否在运行"""
+        return self._task is not None
+    
+    def start(self) -> None:
+        """
+        启动后台采样任务（需在事件循环中调用）
+        """
+        if self._task is None:
+            # 首次调用cpu_percent(interval=None)只建立基准，返回值无意义
+            psutil.cpu_percent(interval=None)
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self) -> None:
+        """
+        停止后台采样任务
+        """
+        if self._task is None:
+            return
+        
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+    
+    async def _run(self) -> None:
+        """
+        后台任务：按固定间隔更新系统资源指标
+        """
+        while True:
+            await asyncio.sleep(self.interval)
+            self.collector.update_system_metrics()
+
+
 def metrics_middleware(func):
     """
     指标收集装饰器
     自动收集函数执行的指标
+    
+    按函数名确定指标类型并在装饰时选定记录函数和包装器，调用时不再做判断
     """
-    @wraps(func)
-    async def async_wrapper(*args, **kwargs):
-        start_time = time.time()
-        status = "success"
+    name = func.__name__
+    is_async = asyncio.iscoroutinefunction(func)
+    
+    if 'process_question' in name:
+        # 异步问答走请求指标缓冲区，避免每次请求都更新带锁的直方图
+        recorder = request_metrics_buffer.record_qa if is_async else metrics_collector.record_qa_processing
+    elif 'process_file' in name or 'process_document' in name:
+        recorder = metrics_collector.record_document_processing
+    else:
+        return func
+    
+    if is_async:
+        @wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            start_time = time.perf_counter()
+            status = "success"
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                status = "error"
+                raise
+            finally:
+                recorder(status, time.perf_counter() - start_time)
         
-        try:
-            result = await func(*args, **kwargs)
-            return result
-        except Exception as e:
-            status = "error"
-            raise
-        finally:
-            duration = time.time() - start_time
-            
-            # 根据函数名确定指标类型
-            if 'process_question' in func.__name__:
-                metrics_collector.record_qa_processing(status, duration)
-            elif 'process_file' in func.__name__ or 'process_document' in func.__name__:
-                metrics_collector.record_document_processing(status, duration)
+        return async_wrapper
     
     @wraps(func)
     def sync_wrapper(*args, **kwargs):
-        start_time = time.time()
+        start_time = time.perf_counter()
         status = "success"
-        
         try:
-            result = func(*args, **kwargs)
-            return result
-        except Exception as e:
+            return func(*args, **kwargs)
+        except Exception:
             status = "error"
             raise
         finally:
-            duration = time.time() - start_time
-            
-            # 根据函数名确定指标类型
-            if 'process_question' in func.__name__:
-                metrics_collector.record_qa_processing(status, duration)
-            elif 'process_file' in func.__name__ or 'process_document' in func.__name__:
-                metrics_collector.record_document_processing(status, duration)
-    
-    # 检查是否为异步函数
-    import asyncio
-    if asyncio.iscoroutinefunction(func):
-        return async_wrapper
-    else:
-        return sync_wrapper
+            recorder(status, time.perf_counter() - start_time)
+    
+    return sync_wrapper
 
 
 def get_metrics() -> str:
@@ -372,13 +642,14 @@ def get_metrics() -> str:
         str: Prometheus格式的指标数据
     """
     try:
-        # 更新系统指标
-        metrics_collector.update_system_metrics()
+        # 系统指标由后台采样任务更新，未启动采样任务时在此处更新
+        if not system_metrics_sampler.running:
+            metrics_collector.update_system_metrics()
         
         # 生成指标数据
         return generate_latest(registry)
     except Exception as e:
-        logger.error(f"生成指标数据失败: {e}")
+        logger.error("生成指标数据失败: {}", e)
         return ""
 
 
@@ -393,4 +664,10 @@ def get_content_type() -> str:
 
 
 # 创建全局指标收集器实例
-metrics_collector = MetricsCollector()
\ No newline at end of file
+metrics_collector = MetricsCollector()
+
+# 创建全局请求指标缓冲区
+request_metrics_buffer = RequestMetricsBuffer(metrics_collector)
+
+# 创建全局系统资源指标采样器
+system_metrics_sampler = SystemMetricsSampler(metrics_collector)
\ No newline at end of file
@@ -4,6 +4,7 @@ pytest配置文件
 """
 
 import pytest
+import orjson
 import asyncio
 import tempfile
 import os
@@ -119,8 +120,7 @@ def mock_settings():
 def mock_embedding_model():
     """模拟嵌入模型"""
     mock_model = Mock()
-    mock_model.encode.return_value = Mock()
-    mock_model.encode.return_value.tolist.return_value = [
+    mock_model.encode.return_value = [
         [0.1, 0.2, 0.3, 0.4, 0.5],
         [0.6, 0.7, 0.8, 0.9, 1.0]
     ]
@@ -133,7 +133,7 @@ def mock_chroma_collection():
     mock_collection = Mock()
     mock_collection.count.return_value = 100
     mock_collection.get.return_value = {'ids': []}
-    mock_collection.add.return_value = None
+    mock_collection.upsert.return_value = None
     mock_collection.delete.return_value = None
     mock_collection.query.return_value = {
         'documents': [['测试文档内容1', '测试文档内容2']],
@@ -159,11 +159,11 @@ def mock_http_client():
     """模拟HTTP客户端"""
     mock_client = AsyncMock()
     mock_response = Mock()
-    mock_response.json.return_value = {
+    mock_response.content = orjson.dumps({
         "response": "这是一个测试回答。",
         "prompt_eval_count": 100,
         "eval_count": 50
-    }
+    })
     mock_client.post.return_value = mock_response
     return mock_client
 
@@ -261,8 +261,7 @@ class TestDocumentProcessorIntegration:
             
             # 模拟嵌入模型
             mock_embedding_model = Mock()
-            mock_embedding_model.encode.return_value = Mock()
-            mock_embedding_model.encode.return_value.tolist.return_value = [
+            mock_embedding_model.encode.return_value = [
                 [0.1, 0.2, 0.3], [0.4, 0.5, 0.6]
             ]
             mock_st.return_value = mock_embedding_model
@@ -271,7 +270,7 @@ class TestDocumentProcessorIntegration:
             mock_collection = Mock()
             mock_collection.count.return_value = 0
             mock_collection.get.return_value = {'ids': []}
-            mock_collection.add.return_value = None
+            mock_collection.upsert.return_value = None
             
             mock_client = Mock()
             mock_client.get_collection.return_value = mock_collection
@@ -294,7 +293,7 @@ class TestDocumentProcessorIntegration:
         
         try:
             # 模拟文档加载器
-            with patch('src.core.document_processor.TextLoader') as mock_loader:
+            with patch('src.core.document_processor._get_loader') as mock_get_loader:
                 mock_instance = Mock()
                 mock_instance.load.return_value = [
                     Document(
@@ -302,7 +301,7 @@ class TestDocumentProcessorIntegration:
                         metadata={"source": temp_file}
                     )
                 ]
-                mock_loader.return_value = mock_instance
+                mock_get_loader.return_value.return_value = mock_instance
                 
                 # 执行完整处理流程
                 result = await processor.process_file(temp_file)
@@ -314,9 +313,10 @@ class TestDocumentProcessorIntegration:
                 assert 'stored_count' in result
                 
                 # 验证各个步骤都被调用
-                mock_loader.assert_called_once_with(temp_file)
-                processor.collection.add.assert_called_once()
-        
+                mock_get_loader.assert_called_once_with(".txt")
+                mock_get_loader.return_value.assert_called_once_with(temp_file)
+                processor.collection.upsert.assert_called_once()
+                
         finally:
             os.unlink(temp_file)
     
@@ -373,11 +373,14 @@ class TestDocumentProcessorIntegration:
         processor.embedding_model.encode.assert_called_once()
         
         # 验证存储被调用
-        processor.collection.add.assert_called_once()
+        processor.collection.upsert.assert_called_once()
         
         # 验证调用参数
-        call_args = processor.collection.add.call_args
-        embeddings, metadatas, texts, ids = call_args[0]
+        call_args = processor.collection.upsert.call_args
+        embeddings = call_args.kwargs['embeddings']
+        metadatas = call_args.kwargs['metadatas']
+        texts = call_args.kwargs['documents']
+        ids = call_args.kwargs['ids']
         
         assert len(embeddings) == 2
         assert len(metadatas) == 2
@@ -6,6 +6,7 @@
 import pytest
 import asyncio
 import json
+import orjson
 from unittest.mock import Mock, patch, AsyncMock
 
 from src.core.rag_engine import RAGEngine
@@ -273,11 +274,11 @@ class TestQAProcessorIntegration:
         
         # 模拟HTTP客户端响应
         mock_response = Mock()
-        mock_response.json.return_value = {
+        mock_response.content = orjson.dumps({
             "response": "人工智能是计算机科学的一个分支，致力于创建智能系统。",
             "prompt_eval_count": 120,
             "eval_count": 60
-        }
+        })
         qa_processor.http_client.post.return_value = mock_response
         
         # 执行完整问答流程
@@ -310,11 +311,11 @@ class TestQAProcessorIntegration:
         
         # 模拟LLM响应
         mock_response = Mock()
-        mock_response.json.return_value = {
+        mock_response.content = orjson.dumps({
             "response": "基于高质量文档的回答",
             "prompt_eval_count": 80,
             "eval_count": 40
-        }
+        })
         qa_processor.http_client.post.return_value = mock_response
         
         # 使用较高的相似度阈值
@@ -338,11 +339,11 @@ class TestQAProcessorIntegration:
         qa_processor.cache_client.get.return_value = None
         
         mock_response = Mock()
-        mock_response.json.return_value = {
+        mock_response.content = orjson.dumps({
             "response": "第一次生成的答案",
             "prompt_eval_count": 100,
             "eval_count": 50
-        }
+        })
         qa_processor.http_client.post.return_value = mock_response
         
         result1 = await qa_processor.process_question(question)
@@ -10,11 +10,12 @@ import tempfile
 import os
 from unittest.mock import Mock, patch, AsyncMock
 from fastapi.testclient import TestClient
-from fastapi import UploadFile
+from fastapi import HTTPException, UploadFile
 import io
 
 from src.main import app
 from src.core.rag_engine import rag_engine
+from src.api.routes import documents, system
 
 
 class TestAPIEndpoints:
@@ -115,7 +116,7 @@ class TestDocumentAPI:
             files={"file": ("large.txt", test_file, "text/plain")}
         )
         
-        assert response.status_code == 400
+        assert response.status_code == 413
         data = response.json()
         assert "文件大小超过限制" in data["detail"]
     
@@ -142,6 +143,10 @@ class TestDocumentAPI:
     
     def test_process_document_not_found(self, client, mock_rag_engine):
         """测试处理不存在的文档"""
+        mock_rag_engine.process_document = AsyncMock(
+            side_effect=FileNotFoundError("文件不存在: /nonexistent/file.txt")
+        )
+        
         response = client.post(
             "/api/documents/process",
             json={"file_path": "/nonexistent/file.txt"}
@@ -188,6 +193,61 @@ class TestDocumentAPI:
         assert "files" in data
         assert "total_count" in data
     
+    def test_list_documents_invalid_limit(self, client, mock_rag_engine):
+        """测试文档数量限制必须为正数"""
+        response = client.get("/api/documents/list", params={"limit": 0})
+        
+        assert response.status_code == 422
+    
+    def test_write_upload_spooled_file(self, tmp_path):
+        """测试分块写入SpooledTemporaryFile上传内容"""
+        content = os.urandom(documents.UPLOAD_CHUNK_SIZE * 2 + 123)
+        target = tmp_path / "upload.bin"
+        
+        with tempfile.SpooledTemporaryFile(max_size=1024) as source:
+            source.write(content)
+            source.seek(0)
+            file_size = documents._write_upload(source, target, len(content))
+        
+        assert file_size == len(content)
+        assert target.read_bytes() == content
+    
+    def test_write_upload_without_readinto(self, tmp_path):
+        """测试上传文件对象没有readinto时退回read"""
+        content = b"x" * (documents.UPLOAD_CHUNK_SIZE + 10)
+        
+        class ReadOnlySource:
+            def __init__(self, data):
+                self._data = io.BytesIO(data)
+            
+            def read(self, size=-1):
+                return self._data.read(size)
+        
+        target = tmp_path / "upload.bin"
+        file_size = documents._write_upload(ReadOnlySource(content), target, len(content))
+        
+        assert file_size == len(content)
+        assert target.read_bytes() == content
+    
+    def test_write_upload_too_large(self, tmp_path):
+        """测试上传超过大小限制时删除部分文件并归还缓冲区"""
+        target = tmp_path / "upload.bin"
+        
+        with patch.object(documents, '_upload_buffer_pool', documents.deque(maxlen=32)) as pool, \
+             tempfile.SpooledTemporaryFile(max_size=1024) as source:
+            buffer = bytearray(documents.UPLOAD_CHUNK_SIZE)
+            pool.append(buffer)
+            source.write(b"x" * (documents.UPLOAD_CHUNK_SIZE * 2))
+            source.seek(0)
+            
+            with pytest.raises(HTTPException) as exc_info:
+                documents._write_upload(source, target, documents.UPLOAD_CHUNK_SIZE)
+            
+            assert exc_info.value.status_code == 413
+            assert not target.exists()
+            assert list(pool) == [buffer]
+            assert pool[0] is buffer
+    
     def test_get_supported_formats(self, client, mock_rag_engine):
         """测试获取支持的文档格式"""
         mock_rag_engine.get_supported_formats = Mock(return_value=[".pdf", ".txt", ".md", ".docx"])
@@ -427,7 +487,9 @@ class TestSystemAPI:
     
     @pytest.fixture
     def mock_rag_engine(self):
-        with patch.object(rag_engine, 'initialized', True):
+        with patch.object(rag_engine, 'initialized', True), \
+             patch.dict(system._health_cache, {"data": None, "ts": 0.0}), \
+             patch.dict(system._metrics_cache, {"payload": b"", "ts": 0.0, "gzip": None}):
             yield rag_engine
     
     def test_health_check(self, client, mock_rag_engine):
@@ -449,6 +511,39 @@ class TestSystemAPI:
         assert data["status"] == "healthy"
         assert "components" in data
     
+    def test_health_check_cached(self, client, mock_rag_engine):
+        """测试健康检查结果在TTL内被缓存"""
+        mock_rag_engine.health_check = AsyncMock(return_value={
+            "status": "healthy",
+            "components": {}
+        })
+        
+        client.get("/api/system/health")
+        response = client.get("/api/system/health/ready")
+        
+        assert response.status_code == 200
+        assert response.json()["status"] == "healthy"
+        assert mock_rag_engine.health_check.await_count == 1
+    
+    def test_readiness_check_unhealthy(self, client, mock_rag_engine):
+        """测试系统不健康时就绪检查返回503"""
+        mock_rag_engine.health_check = AsyncMock(return_value={
+            "status": "degraded",
+            "components": {"llm": {"status": "unhealthy"}}
+        })
+        
+        response = client.get("/api/system/health/ready")
+        
+        assert response.status_code == 503
+        assert response.json()["status"] == "degraded"
+    
+    def test_liveness_check(self, client):
+        """测试存活检查"""
+        response = client.get("/api/system/health/live")
+        
+        assert response.status_code == 200
+        assert response.json() == {"status": "alive"}
+    
     def test_get_system_stats(self, client, mock_rag_engine):
         """测试获取系统统计"""
         mock_rag_engine.get_system_stats = Mock(return_value={
@@ -494,6 +589,48 @@ class TestSystemAPI:
             assert response.status_code == 200
             assert "test_metric" in response.text
     
+    def test_get_prometheus_metrics_cached(self, client, mock_rag_engine):
+        """测试Prometheus指标在TTL内被缓存"""
+        with patch('src.api.routes.system.get_metrics') as mock_get_metrics:
+            mock_get_metrics.return_value = "test_metric 1.0"
+            
+            client.get("/api/system/metrics")
+            response = client.get("/api/system/metrics")
+            
+            assert response.status_code == 200
+            assert "test_metric" in response.text
+            mock_get_metrics.assert_called_once()
+    
+    def test_get_prometheus_metrics_gzip(self, client, mock_rag_engine):
+        """测试Prometheus指标按Accept-Encoding压缩"""
+        with patch('src.api.routes.system.get_metrics') as mock_get_metrics:
+            mock_get_metrics.return_value = b"test_metric 1.0"
+            
+            response = client.get("/api/system/metrics", headers={"Accept-Encoding": "gzip"})
+            assert response.status_code == 200
+            assert response.headers["content-encoding"] == "gzip"
+            assert "test_metric" in response.text
+            
+            response = client.get("/api/system/metrics", headers={"Accept-Encoding": "identity"})
+            assert response.status_code == 200
+            assert "content-encoding" not in response.headers
+            assert "test_metric" in response.text
+            
+            response = client.get("/api/system/metrics", headers={"Accept-Encoding": "gzip;q=0, *"})
+            assert response.status_code == 200
+            assert "content-encoding" not in response.headers
+    
+    def test_accepts_gzip(self):
+        """测试Accept-Encoding解析"""
+        assert system._accepts_gzip("gzip, deflate") is True
+        assert system._accepts_gzip("deflate, gzip;q=0.5") is True
+        assert system._accepts_gzip("*") is True
+        assert system._accepts_gzip("gzip;q=0") is False
+        assert system._accepts_gzip("GZIP; Q=0.0, *;q=1") is False
+        assert system._accepts_gzip("*;q=0") is False
+        assert system._accepts_gzip("identity") is False
+        assert system._accepts_gzip("") is False
+    
     def test_get_system_config(self, client, mock_rag_engine):
         """测试获取系统配置"""
         response = client.get("/api/system/config")
@@ -0,0 +1,91 @@
+"""
+缓存模块单元测试
+测试进程内缓存和缓存管理器的L1行为
+"""
+
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from src.utils.cache import CacheManager, LocalTTLCache
+
+
+class TestLocalTTLCache:
+    """进程内缓存测试类"""
+    
+    def test_entry_ttl_capped(self):
+        """测试条目过期时间不超过指定值"""
+        cache = LocalTTLCache(maxsize=10, ttl=60)
+        
+        with patch('src.utils.cache.time.monotonic', return_value=100.0):
+            cache.set("short", b"1", ttl=5)
+            cache.set("long", b"2", ttl=600)
+            cache.set("default", b"3")
+        
+        with patch('src.utils.cache.time.monotonic', return_value=106.0):
+            assert cache.get("short") is None
+            assert cache.get("long") == b"2"
+            assert cache.get("default") == b"3"
+        
+        with patch('src.utils.cache.time.monotonic', return_value=161.0):
+            assert cache.get("long") is None
+            assert cache.get("default") is None
+    
+    def test_lru_eviction(self):
+        """测试超出容量时淘汰最久未使用的条目"""
+        cache = LocalTTLCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+        assert cache.get("c") == 3
+
+
+class TestCacheManager:
+    """缓存管理器测试类"""
+    
+    @pytest.fixture
+    def client(self):
+        """模拟Redis客户端"""
+        client = AsyncMock()
+        client.get.return_value = None
+        return client
+    
+    def test_client_resolved_lazily(self, client):
+        """测试未指定客户端时读取当前的全局客户端"""
+        manager = CacheManager()
+        
+        with patch('src.utils.cache.get_cache_client', return_value=client):
+            assert manager.client is client
+        with patch('src.utils.cache.get_cache_client', return_value=None):
+            assert manager.client is None
+    
+    @pytest.mark.asyncio
+    async def test_set_with_expire_caps_l1(self, client):
+        """测试写入时的过期时间同样作用于L1"""
+        manager = CacheManager(client)
+        
+        with patch('src.utils.cache.time.monotonic', return_value=100.0):
+            assert await manager.set("key", "value", expire=5) is True
+        client.setex.assert_awaited_once_with("key", 5, "value")
+        
+        with patch('src.utils.cache.time.monotonic', return_value=106.0):
+            assert await manager.get("key") is None
+        client.get.assert_awaited_once_with("key")
+    
+    @pytest.mark.asyncio
+    async def test_expire_evicts_l1(self, client):
+        """测试修改过期时间时淘汰L1条目"""
+        manager = CacheManager(client)
+        client.expire.return_value = True
+        
+        await manager.set("key", "value")
+        assert await manager.get("key") == b"value"
+        client.get.assert_not_awaited()
+        
+        assert await manager.expire("key", 1) is True
+        assert await manager.get("key") is None
+        client.get.assert_awaited_once_with("key")
@@ -10,7 +10,8 @@ import os
 from unittest.mock import Mock, patch, AsyncMock, MagicMock
 from pathlib import Path
 
-from src.core.document_processor import DocumentProcessor
+from src.core import document_processor
+from src.core.document_processor import DocumentProcessor, _get_loader
 from langchain.schema import Document
 
 
@@ -52,9 +53,14 @@ class TestDocumentProcessor:
     def test_supported_formats(self, processor):
         """测试支持的文件格式"""
         expected_formats = {'.pdf', '.txt', '.md', '.docx'}
-        actual_formats = set(processor.supported_formats.keys())
+        actual_formats = set(processor.supported_formats)
         assert expected_formats.issubset(actual_formats)
     
+    def test_get_loader_unsupported(self):
+        """测试不支持的格式没有对应的加载器"""
+        with pytest.raises(ValueError, match="不支持的文件格式"):
+            _get_loader('.xyz')
+    
     def test_get_file_hash(self, processor):
         """测试文件哈希计算"""
         # 创建临时文件
@@ -72,6 +78,27 @@ class TestDocumentProcessor:
         finally:
             os.unlink(temp_file)
     
+    def test_get_file_hash_cache_invalidation(self, processor):
+        """测试文件修改后哈希缓存失效"""
+        with tempfile.NamedTemporaryFile(mode='w', delete=False) as f:
+            f.write("原始内容")
+            temp_file = f.name
+        
+        try:
+            hash1 = processor._get_file_hash(temp_file)
+            
+            with open(temp_file, 'w') as f:
+                f.write("修改后的内容")
+            stat = os.stat(temp_file)
+            os.utime(temp_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+            
+            hash2 = processor._get_file_hash(temp_file)
+            
+            # 文件修改后应重新计算哈希
+            assert hash1 != hash2
+        finally:
+            os.unlink(temp_file)
+    
     def test_is_file_processed(self, processor):
         """测试文件处理状态检查"""
         # 模拟未处理的文件
@@ -104,12 +131,12 @@ class TestDocumentProcessor:
             # 模拟文件未处理
             processor._is_file_processed = Mock(return_value=False)
             
-            with patch('src.core.document_processor.TextLoader') as mock_loader:
+            with patch('src.core.document_processor._get_loader') as mock_get_loader:
                 mock_instance = Mock()
                 mock_instance.load.return_value = [
                     Document(page_content="测试内容", metadata={})
                 ]
-                mock_loader.return_value = mock_instance
+                mock_get_loader.return_value.return_value = mock_instance
                 
                 documents = await processor.load_document(temp_file)
                 
@@ -175,17 +202,65 @@ class TestDocumentProcessor:
         
         # 模拟嵌入模型返回
         mock_embeddings = [[0.1, 0.2, 0.3], [0.4, 0.5, 0.6]]
-        processor.embedding_model.encode.return_value = Mock()
-        processor.embedding_model.encode.return_value.tolist.return_value = mock_embeddings
+        processor.embedding_model.encode.return_value = mock_embeddings
         
         embeddings = processor.generate_embeddings(texts)
         
         assert len(embeddings) == len(texts)
         assert embeddings == mock_embeddings
         processor.embedding_model.encode.assert_called_once_with(
-            texts, convert_to_numpy=True, show_progress_bar=True
+            texts,
+            batch_size=processor.embedding_batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False
         )
     
+    def test_generate_embeddings_oom_fallback(self, processor):
+        """测试显存不足时减半批处理大小重试"""
+        texts = ["这是第一个文本"]
+        processor.embedding_batch_size = 64
+        processor.embedding_model.encode.side_effect = [
+            RuntimeError("CUDA out of memory"),
+            [[0.1, 0.2]]
+        ]
+        
+        embeddings = processor.generate_embeddings(texts)
+        
+        assert embeddings == [[0.1, 0.2]]
+        assert processor.embedding_batch_size == 32
+        assert processor.embedding_model.encode.call_count == 2
+    
+    def test_embedding_model_lazy_load(self):
+        """测试嵌入模型在首次生成向量时才加载"""
+        with patch('src.core.document_processor.SentenceTransformer') as mock_st, \
+             patch('src.core.document_processor.chromadb.HttpClient'):
+            mock_st.return_value.encode.return_value = [[0.1, 0.2]]
+            processor = DocumentProcessor()
+            
+            assert processor.embedding_model is None
+            mock_st.assert_not_called()
+            
+            processor.generate_embeddings(["文本一"])
+            processor.generate_embeddings(["文本二"])
+            
+            mock_st.assert_called_once()
+            assert processor.embedding_model is mock_st.return_value
+    
+    def test_apply_embedding_precision(self):
+        """测试嵌入模型推理精度按设备自动选择"""
+        gpu_model = Mock()
+        gpu_model.device.type = "cuda"
+        cpu_model = Mock()
+        cpu_model.device.type = "cpu"
+        
+        with patch.object(document_processor.settings, 'embedding_precision', 'auto'):
+            assert document_processor.apply_embedding_precision(gpu_model) == "float16"
+            assert document_processor.apply_embedding_precision(cpu_model) == "float32"
+        
+        gpu_model.half.assert_called_once()
+        cpu_model.half.assert_not_called()
+    
     @pytest.mark.asyncio
     async def test_store_documents(self, processor, sample_documents):
         """测试存储文档"""
@@ -198,13 +273,29 @@ class TestDocumentProcessor:
         processor.generate_embeddings = Mock(return_value=mock_embeddings)
         
         # 模拟集合添加
-        processor.collection.add = Mock()
+        processor.collection.upsert = Mock()
         
         result = await processor.store_documents(sample_documents)
         
         assert result['stored_count'] == len(sample_documents)
         assert result['skipped_count'] == 0
-        processor.collection.add.assert_called_once()
+        processor.collection.upsert.assert_called_once()
+    
+    @pytest.mark.asyncio
+    async def test_store_documents_paged(self, processor):
+        """测试大量分块分页写入向量数据库"""
+        documents = [
+            Document(page_content=f"内容{i}", metadata={"chunk_id": f"chunk_{i}"})
+            for i in range(1200)
+        ]
+        processor.generate_embeddings = Mock(return_value=[[0.1, 0.2]] * 1200)
+        processor.collection.upsert = Mock()
+        
+        result = await processor.store_documents(documents)
+        
+        assert result['stored_count'] == 1200
+        page_sizes = [len(c.kwargs['ids']) for c in processor.collection.upsert.call_args_list]
+        assert page_sizes == [500, 500, 200]
     
     @pytest.mark.asyncio
     async def test_store_empty_documents(self, processor):
@@ -272,10 +363,16 @@ class TestDocumentProcessor:
                     f.write(f"测试文档 {i}")
                 test_files.append(file_path)
             
-            # 模拟处理结果
-            processor.process_file = AsyncMock(return_value={
-                'success': True, 'chunks_created': 1
-            })
+            # 模拟加载结果，每个文件一个分块
+            async def load_document(file_path):
+                return [Document(
+                    page_content=file_path,
+                    metadata={'file_hash': file_path, 'chunk_id': f"{file_path}_0"}
+                )]
+            
+            processor.load_document = load_document
+            processor.split_documents = Mock(side_effect=lambda docs: docs)
+            processor.store_documents = AsyncMock(return_value={'stored_count': 3})
             
             result = await processor.process_directory(temp_dir)
             
@@ -283,6 +380,58 @@ class TestDocumentProcessor:
             assert result['success_count'] == 3
             assert result['error_count'] == 0
             assert result['total_chunks'] == 3
+            # 所有文件的分块合并为一次存储
+            processor.store_documents.assert_awaited_once()
+            assert len(processor.store_documents.await_args[0][0]) == 3
+    
+    @pytest.mark.asyncio
+    async def test_process_directory_partial_failure(self, processor):
+        """测试目录中单个文件加载失败不影响其他文件"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for name in ("good.txt", "bad.txt"):
+                with open(os.path.join(temp_dir, name), 'w') as f:
+                    f.write(name)
+            
+            async def load_document(file_path):
+                if file_path.endswith("bad.txt"):
+                    raise ValueError("加载失败")
+                return [Document(
+                    page_content="内容",
+                    metadata={'file_hash': 'good', 'chunk_id': 'good_0'}
+                )]
+            
+            processor.load_document = load_document
+            processor.split_documents = Mock(side_effect=lambda docs: docs)
+            processor.store_documents = AsyncMock(return_value={'stored_count': 1})
+            
+            result = await processor.process_directory(temp_dir)
+            
+            assert result['success_count'] == 1
+            assert result['error_count'] == 1
+            assert result['errors'][0]['file_path'].endswith("bad.txt")
+    
+    @pytest.mark.asyncio
+    async def test_process_directory_nested(self, processor):
+        """测试递归查找子目录中的支持文件"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            sub_dir = os.path.join(temp_dir, "sub", "deep")
+            os.makedirs(sub_dir)
+            for path in (
+                os.path.join(temp_dir, "a.txt"),
+                os.path.join(sub_dir, "b.MD"),
+                os.path.join(sub_dir, "c.csv")
+            ):
+                with open(path, 'w') as f:
+                    f.write("内容")
+            
+            processor.load_document = AsyncMock(return_value=[])
+            processor.split_documents = Mock(side_effect=lambda docs: docs)
+            
+            result = await processor.process_directory(temp_dir)
+            
+            assert result['total_files'] == 2
+            loaded = sorted(Path(c.args[0]).name for c in processor.load_document.await_args_list)
+            assert loaded == ["a.txt", "b.MD"]
     
     @pytest.mark.asyncio
     async def test_process_directory_not_found(self, processor):
@@ -363,17 +512,16 @@ class TestDocumentProcessorIntegration:
             try:
                 # 模拟各个组件
                 processor._is_file_processed = Mock(return_value=False)
-                processor.embedding_model.encode.return_value = Mock()
-                processor.embedding_model.encode.return_value.tolist.return_value = [[0.1, 0.2]]
-                processor.collection.add = Mock()
+                processor.embedding_model.encode.return_value = [[0.1, 0.2]]
+                processor.collection.upsert = Mock()
                 processor.collection.count.return_value = 1
                 
-                with patch('src.core.document_processor.TextLoader') as mock_loader:
+                with patch('src.core.document_processor._get_loader') as mock_get_loader:
                     mock_instance = Mock()
                     mock_instance.load.return_value = [
                         Document(page_content="测试内容", metadata={})
                     ]
-                    mock_loader.return_value = mock_instance
+                    mock_get_loader.return_value.return_value = mock_instance
                     
                     # 执行完整流程
                     result = await processor.process_file(temp_file)
@@ -0,0 +1,104 @@
+"""
+API中间件单元测试
+测试路径匹配、请求ID生成等中间件工具
+"""
+
+import os
+from unittest.mock import patch
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from src.api import middleware
+from src.api.middleware import CombinedMiddleware, PathTrie, _PUBLIC_TRIE
+
+
+class TestPathTrie:
+    """路径前缀树测试类"""
+    
+    @pytest.fixture
+    def trie(self):
+        """创建路径前缀树"""
+        return PathTrie(["/", "/docs", "/docs/*", "/openapi.json"])
+    
+    def test_exact_match(self, trie):
+        """测试精确匹配"""
+        assert trie.match("/") is True
+        assert trie.match("/docs") is True
+        assert trie.match("/openapi.json") is True
+    
+    def test_wildcard_match(self, trie):
+        """测试前缀通配匹配"""
+        assert trie.match("/docs/oauth2-redirect") is True
+        assert trie.match("/docs/static/swagger-ui.css") is True
+    
+    def test_no_match(self, trie):
+        """测试不匹配的路径"""
+        assert trie.match("/docsx") is False
+        assert trie.match("/openapi.json/extra") is False
+        assert trie.match("/api/qa/ask") is False
+    
+    def test_public_paths(self):
+        """测试默认公开路径"""
+        assert _PUBLIC_TRIE.match("/system/health") is True
+        assert _PUBLIC_TRIE.match("/redoc") is True
+        assert _PUBLIC_TRIE.match("/api/system/health") is True
+        assert _PUBLIC_TRIE.match("/api/system/health/ready") is True
+        assert _PUBLIC_TRIE.match("/api/documents/upload") is False
+
+
+class TestCombinedMiddleware:
+    """组合中间件测试类"""
+    
+    @pytest.fixture
+    def client(self):
+        """创建配置了API密钥的测试应用"""
+        app = FastAPI()
+        
+        @app.get("/api/system/health/live")
+        async def live():
+            return {"status": "alive"}
+        
+        @app.get("/api/system/health/ready")
+        async def ready():
+            return {"status": "healthy"}
+        
+        @app.get("/api/system/stats")
+        async def stats():
+            return {"success": True}
+        
+        app.add_middleware(CombinedMiddleware, api_key="secret")
+        return TestClient(app)
+    
+    def test_health_probes_public_and_untracked(self, client):
+        """测试探活路径无需API密钥且不记录日志和指标"""
+        with patch.object(middleware, '_record_request') as mock_record, \
+             patch.object(middleware.request_log_writer, 'submit') as mock_submit:
+            assert client.get("/api/system/health/live").status_code == 200
+            assert client.get("/api/system/health/ready").status_code == 200
+        
+        mock_record.assert_not_called()
+        mock_submit.assert_not_called()
+    
+    def test_protected_path_requires_api_key(self, client):
+        """测试非公开路径需要API密钥"""
+        assert client.get("/api/system/stats").status_code == 401
+        
+        response = client.get("/api/system/stats", headers={"X-API-Key": "secret"})
+        assert response.status_code == 200
+
+
+class TestRequestId:
+    """请求ID生成测试类"""
+    
+    def test_unique_ids(self):
+        """测试请求ID进程内唯一"""
+        ids = {middleware._next_request_id() for _ in range(100)}
+        assert len(ids) == 100
+    
+    def test_reset_after_fork(self):
+        """测试fork后重置请求ID状态"""
+        middleware._next_request_id()
+        middleware._reset_request_id_state()
+        assert middleware._next_request_id() == f"{os.getpid():x}-0"
@@ -6,9 +6,12 @@
 import pytest
 import asyncio
 import json
+import orjson
+import numpy as np
 from unittest.mock import Mock, patch, AsyncMock, MagicMock
 import httpx
 
+from src.config.settings import get_settings
 from src.core.qa_processor import QAProcessor
 
 
@@ -110,21 +113,89 @@ class TestQAProcessor:
         assert call_args[0][0] == cache_key
         assert json.loads(call_args[0][2]) == answer_data
     
-    def test_generate_question_embedding(self, processor, sample_question):
+    @pytest.mark.asyncio
+    async def test_get_cached_answer_local_hit(self, processor):
+        """测试进程内缓存命中时不访问Redis"""
+        cache_key = "test_key"
+        processor.cache_client = AsyncMock()
+        
+        await processor._set_cached_answer(cache_key, {"answer": "测试答案"})
+        result = await processor._get_cached_answer(cache_key)
+        result["from_cache"] = True
+        
+        assert await processor._get_cached_answer(cache_key) == {"answer": "测试答案"}
+        processor.cache_client.get.assert_not_called()
+        
+        processor.clear_local_cache()
+        processor.cache_client.get.return_value = None
+        assert await processor._get_cached_answer(cache_key) is None
+        processor.cache_client.get.assert_called_once_with(cache_key)
+    
+    @pytest.mark.asyncio
+    async def test_get_cached_answers(self, processor):
+        """测试批量读取缓存时进程内未命中的键合并为一次MGET"""
+        processor.cache_client = AsyncMock()
+        processor.cache_client.mget.return_value = [orjson.dumps({"answer": "答案2"}).decode(), None]
+        await processor._set_cached_answer("key1", {"answer": "答案1"})
+        
+        results = await processor._get_cached_answers(["key1", "key2", "key3"])
+        
+        assert results == [{"answer": "答案1"}, {"answer": "答案2"}, None]
+        processor.cache_client.mget.assert_awaited_once_with(["key2", "key3"])
+        processor.cache_client.get.assert_not_called()
+    
+    @pytest.mark.asyncio
+    async def test_generate_question_embedding(self, processor, sample_question):
         """测试问题嵌入向量生成"""
         mock_embedding = [[0.1, 0.2, 0.3]]
         processor.embedding_model.encode.return_value = mock_embedding
         
-        result = processor.generate_question_embedding(sample_question)
+        result = await processor.generate_question_embedding(sample_question)
+        
+        assert isinstance(result, np.ndarray)
+        assert result.tolist() == [0.1, 0.2, 0.3]
+        processor.embedding_model.encode.assert_called_once_with(
+            [sample_question],
+            batch_size=get_settings().embedding_batch_size,
+            normalize_embeddings=True,
+            show_progress_bar=False
+        )
+    
+    @pytest.mark.asyncio
+    async def test_generate_question_embedding_batched(self, processor):
+        """测试并发问题合并为一次模型推理"""
+        processor.embedding_model.encode.side_effect = lambda texts, **kwargs: [
+            [float(i)] for i in range(len(texts))
+        ]
+        
+        results = await asyncio.gather(*[
+            processor.generate_question_embedding(f"问题{i}") for i in range(3)
+        ])
         
-        assert result == [0.1, 0.2, 0.3]
-        processor.embedding_model.encode.assert_called_once_with([sample_question])
+        assert [result.tolist() for result in results] == [[0.0], [1.0], [2.0]]
+        processor.embedding_model.encode.assert_called_once()
+        assert processor.embedding_model.encode.call_args[0][0] == ["问题0", "问题1", "问题2"]
+    
+    @pytest.mark.asyncio
+    async def test_generate_question_embedding_cached(self, processor, sample_question):
+        """测试问题向量命中缓存时不再调用模型"""
+        processor.cache_client = AsyncMock()
+        processor.cache_client.get.return_value = None
+        processor.embedding_model.encode.return_value = [[0.5, 0.25]]
+        
+        first = await processor.generate_question_embedding(sample_question)
+        processor.cache_client.get.return_value = processor.cache_client.setex.call_args[0][2]
+        second = await processor.generate_question_embedding(sample_question)
+        
+        assert first.tolist() == second.tolist() == [0.5, 0.25]
+        processor.embedding_model.encode.assert_called_once()
+        assert processor.cache_client.setex.call_args[0][0].startswith("emb:")
     
     @pytest.mark.asyncio
     async def test_retrieve_documents_success(self, processor, sample_question):
         """测试成功检索文档"""
         # 模拟嵌入向量生成
-        processor.generate_question_embedding = Mock(return_value=[0.1, 0.2, 0.3])
+        processor.generate_question_embedding = AsyncMock(return_value=[0.1, 0.2, 0.3])
         
         # 模拟检索结果
         mock_results = {
@@ -143,10 +214,21 @@ class TestQAProcessor:
         assert documents[0]['rank'] == 1
         assert documents[1]['rank'] == 2
     
+    def test_filter_documents_l2_collection(self, processor):
+        """测试l2距离的旧集合换算为余弦相似度"""
+        processor.distance_space = "l2"
+        
+        documents = processor._filter_documents(
+            ['文档1', '文档2'], [{}, {}], [0.2, 1.2], similarity_threshold=0.5
+        )
+        
+        assert [doc['content'] for doc in documents] == ['文档1']
+        assert documents[0]['similarity_score'] == pytest.approx(0.9)
+    
     @pytest.mark.asyncio
     async def test_retrieve_documents_with_threshold(self, processor, sample_question):
         """测试带相似度阈值的文档检索"""
-        processor.generate_question_embedding = Mock(return_value=[0.1, 0.2, 0.3])
+        processor.generate_question_embedding = AsyncMock(return_value=[0.1, 0.2, 0.3])
         
         # 模拟检索结果，包含低相似度文档
         mock_results = {
@@ -168,7 +250,7 @@ class TestQAProcessor:
     @pytest.mark.asyncio
     async def test_retrieve_documents_empty_result(self, processor, sample_question):
         """测试检索空结果"""
-        processor.generate_question_embedding = Mock(return_value=[0.1, 0.2, 0.3])
+        processor.generate_question_embedding = AsyncMock(return_value=[0.1, 0.2, 0.3])
         
         mock_results = {
             'documents': [[]],
@@ -186,11 +268,11 @@ class TestQAProcessor:
         """测试成功生成答案"""
         # 模拟Ollama API响应
         mock_response = Mock()
-        mock_response.json.return_value = {
+        mock_response.content = orjson.dumps({
             "response": "人工智能是一门计算机科学分支。",
             "prompt_eval_count": 100,
             "eval_count": 50
-        }
+        })
         processor.http_client.post.return_value = mock_response
         
         result = await processor.generate_answer(sample_question, sample_documents)
@@ -202,6 +284,37 @@ class TestQAProcessor:
         assert 'token_count' in result
         assert result['token_count']['prompt_tokens'] == 100
         assert result['token_count']['completion_tokens'] == 50
+        
+        # 固定的系统提示词单独发送，用户提示词只包含上下文和问题
+        payload = processor.http_client.post.call_args.kwargs['json']
+        assert payload['system'] == processor.system_prompt
+        assert payload['prompt'].startswith("相关文档内容：\n文档片段1")
+        assert payload['prompt'].endswith(f"用户问题：{sample_question}\n\n请基于上述文档内容回答用户问题：")
+        assert processor.system_prompt not in payload['prompt']
+    
+    @pytest.mark.asyncio
+    async def test_generate_answer_concurrency_limit(self, processor, sample_question, sample_documents):
+        """测试同时发往Ollama的生成请求数不超过配置的并行数"""
+        in_flight = 0
+        max_in_flight = 0
+        
+        async def mock_post(*args, **kwargs):
+            nonlocal in_flight, max_in_flight
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            response = Mock()
+            response.content = orjson.dumps({"response": "答案"})
+            return response
+        
+        processor.http_client.post = mock_post
+        
+        await asyncio.gather(*[
+            processor.generate_answer(sample_question, sample_documents) for _ in range(10)
+        ])
+        
+        assert max_in_flight == get_settings().ollama_num_parallel
     
     @pytest.mark.asyncio
     async def test_generate_answer_api_error(self, processor, sample_question, sample_documents):
@@ -215,7 +328,8 @@ class TestQAProcessor:
     @pytest.mark.asyncio
     async def test_process_question_success(self, processor, sample_question):
         """测试成功处理问题"""
-        # 模拟检索文档
+        # 模拟问题向量和检索文档
+        processor.generate_question_embedding = AsyncMock(return_value=[0.1, 0.2, 0.3])
         processor.retrieve_documents = AsyncMock(return_value=[
             {
                 'content': '人工智能相关内容',
@@ -246,6 +360,10 @@ class TestQAProcessor:
         assert result['from_cache'] is False
         assert 'total_time' in result
         assert 'retrieval_stats' in result
+        # 与缓存查询并行生成的问题向量直接用于检索
+        processor.retrieve_documents.assert_awaited_once_with(
+            sample_question, None, None, question_embedding=[0.1, 0.2, 0.3]
+        )
     
     @pytest.mark.asyncio
     async def test_process_question_from_cache(self, processor, sample_question):
@@ -268,6 +386,7 @@ class TestQAProcessor:
     @pytest.mark.asyncio
     async def test_process_question_no_documents(self, processor, sample_question):
         """测试未找到相关文档"""
+        processor.generate_question_embedding = AsyncMock(return_value=[0.1, 0.2, 0.3])
         processor.retrieve_documents = AsyncMock(return_value=[])
         processor._get_cached_answer = AsyncMock(return_value=None)
         
@@ -280,6 +399,7 @@ class TestQAProcessor:
     @pytest.mark.asyncio
     async def test_process_question_error(self, processor, sample_question):
         """测试处理问题时发生错误"""
+        processor.generate_question_embedding = AsyncMock(return_value=[0.1, 0.2, 0.3])
         processor.retrieve_documents = AsyncMock(side_effect=Exception("检索错误"))
         processor._get_cached_answer = AsyncMock(return_value=None)
         
@@ -326,6 +446,164 @@ class TestQAProcessor:
         assert results[1]['success'] is False
         assert "处理失败" in results[1]['message']
     
+    @pytest.mark.asyncio
+    async def test_generate_question_embedding_remote(self, processor, sample_question):
+        """测试配置外部嵌入服务时通过HTTP生成问题向量"""
+        mock_response = Mock()
+        mock_response.content = orjson.dumps([[0.1, 0.2, 0.3]])
+        processor.http_client.post.return_value = mock_response
+        
+        with patch('src.core.qa_processor.settings.embedding_endpoint', 'http://tei:80'):
+            result = await processor.generate_question_embedding(sample_question)
+        
+        assert result.tolist() == pytest.approx([0.1, 0.2, 0.3])
+        processor.embedding_model.encode.assert_not_called()
+        call_args = processor.http_client.post.call_args
+        assert call_args[0][0] == "http://tei:80/embed"
+        assert call_args.kwargs['json']['inputs'] == [sample_question]
+    
+    @pytest.mark.asyncio
+    async def test_retrieve_documents_batch(self, processor):
+        """测试批量检索只查询一次向量数据库"""
+        processor.generate_question_embeddings = Mock(return_value=[[0.1], [0.2]])
+        processor.collection.query.return_value = {
+            'documents': [['文档A'], ['文档B', '文档C']],
+            'metadatas': [[{'source': 'a.txt'}], [{'source': 'b.txt'}, {'source': 'c.txt'}]],
+            'distances': [[0.1], [0.2, 0.9]]
+        }
+        
+        results = await processor.retrieve_documents_batch(["问题1", "问题2"], k=2, similarity_threshold=0.5)
+        
+        processor.collection.query.assert_called_once_with(
+            query_embeddings=[[0.1], [0.2]],
+            n_results=2,
+            include=["documents", "metadatas", "distances"]
+        )
+        assert [doc['content'] for doc in results[0]] == ['文档A']
+        assert [doc['content'] for doc in results[1]] == ['文档B']
+    
+    @pytest.mark.asyncio
+    async def test_batch_process_questions_shared_retrieval(self, processor, sample_documents):
+        """测试批量处理时统一检索并跳过缓存命中的问题"""
+        processor._get_cached_answers = AsyncMock(return_value=[{'answer': '缓存答案'}, None])
+        processor.retrieve_documents_batch = AsyncMock(return_value=[sample_documents])
+        processor.process_question = AsyncMock(return_value={'success': True, 'answer': '答案'})
+        processor._set_cached_answers = AsyncMock()
+        
+        results = await processor.batch_process_questions(["问题1", "问题2"])
+        
+        assert results[0]['from_cache'] is True
+        assert results[1]['answer'] == '答案'
+        processor.retrieve_documents_batch.assert_awaited_once_with(["问题2"], None, None)
+        processor.process_question.assert_awaited_once_with(
+            "问题2", documents=sample_documents, use_cache=False
+        )
+        # 只有新生成的答案一次性写入缓存
+        processor._set_cached_answers.assert_awaited_once_with({
+            processor._generate_cache_key("问题2"): {'success': True, 'answer': '答案'}
+        })
+    
+    @pytest.mark.asyncio
+    async def test_generate_answer_stream_stops_at_done(self, processor, sample_question, sample_documents):
+        """测试流式生成在done片段后停止读取"""
+        async def aiter_lines():
+            yield '{"response": "人工", "done": false}'
+            yield ''
+            yield '{"response": "", "done": true, "eval_count": 1}'
+            yield '{"response": "多余", "done": false}'
+        
+        response = Mock()
+        response.aiter_lines = aiter_lines
+        stream_context = AsyncMock()
+        stream_context.__aenter__.return_value = response
+        processor.http_client.stream = Mock(return_value=stream_context)
+        
+        chunks = [chunk async for chunk in processor.generate_answer_stream(sample_question, sample_documents)]
+        
+        assert [chunk['response'] for chunk in chunks] == ['人工', '']
+        assert chunks[-1]['done'] is True
+    
+    @pytest.mark.asyncio
+    async def test_process_question_stream(self, processor, sample_question, sample_documents):
+        """测试流式处理问题"""
+        processor.cache_client = None
+        processor.retrieve_documents = AsyncMock(return_value=sample_documents)
+        
+        async def fake_stream(question, context_documents):
+            yield {'response': '人工', 'done': False}
+            yield {'response': '智能', 'done': False}
+            yield {'response': '', 'done': True, 'prompt_eval_count': 100, 'eval_count': 2}
+        
+        processor.generate_answer_stream = fake_stream
+        
+        events = [event async for event in processor.process_question_stream(sample_question)]
+        
+        assert [event for event, _ in events] == ['generation', 'token', 'token', 'answer']
+        assert events[1][1]['content'] == '人工'
+        result = events[-1][1]
+        assert result['success'] is True
+        assert result['answer'] == '人工智能'
+        assert result['token_count']['total_tokens'] == 102
+    
+    @pytest.mark.asyncio
+    async def test_process_question_stream_without_done(self, processor, sample_question, sample_documents):
+        """测试流式响应未收到done片段时返回错误且不缓存"""
+        processor.retrieve_documents = AsyncMock(return_value=sample_documents)
+        processor._get_cached_answer = AsyncMock(return_value=None)
+        processor._set_cached_answer = AsyncMock()
+        
+        async def fake_stream(question, context_documents):
+            yield {'response': '人工', 'done': False}
+        
+        processor.generate_answer_stream = fake_stream
+        
+        events = [event async for event in processor.process_question_stream(sample_question)]
+        
+        assert [event for event, _ in events] == ['generation', 'token', 'error']
+        assert events[-1][1]['success'] is False
+        processor._set_cached_answer.assert_not_called()
+    
+    @pytest.mark.asyncio
+    async def test_process_question_stream_error_chunk(self, processor, sample_question, sample_documents):
+        """测试流式响应中的error片段按失败处理且不缓存"""
+        processor.retrieve_documents = AsyncMock(return_value=sample_documents)
+        processor._get_cached_answer = AsyncMock(return_value=None)
+        processor._set_cached_answer = AsyncMock()
+        
+        async def fake_stream(question, context_documents):
+            yield {'error': 'model not found'}
+        
+        processor.generate_answer_stream = fake_stream
+        
+        events = [event async for event in processor.process_question_stream(sample_question)]
+        
+        assert [event for event, _ in events] == ['generation', 'error']
+        assert 'model not found' in events[-1][1]['error']
+        processor._set_cached_answer.assert_not_called()
+    
+    @pytest.mark.asyncio
+    async def test_batch_process_questions_concurrency_limit(self, processor):
+        """测试批量处理问题的并发上限"""
+        questions = [f"问题{i}" for i in range(10)]
+        running = 0
+        max_running = 0
+        
+        async def fake_process(question, **kwargs):
+            nonlocal running, max_running
+            running += 1
+            max_running = max(max_running, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            return {'success': True, 'question': question}
+        
+        processor.process_question = fake_process
+        
+        with patch('src.core.qa_processor.settings.qa_concurrency', 3):
+            results = await processor.batch_process_questions(questions)
+        
+        assert [result['question'] for result in results] == questions
+        assert max_running == 3
+    
     def test_get_stats(self, processor):
         """测试获取统计信息"""
         processor.collection.count.return_value = 100
@@ -341,12 +619,12 @@ class TestQAProcessor:
     async def test_close(self, processor):
         """测试关闭资源"""
         processor.http_client.aclose = AsyncMock()
-        processor.cache_client.close = AsyncMock()
+        processor.cache_client.aclose = AsyncMock()
         
         await processor.close()
         
         processor.http_client.aclose.assert_called_once()
-        processor.cache_client.close.assert_called_once()
+        processor.cache_client.aclose.assert_not_called()
     
     @pytest.mark.asyncio
     async def test_context_manager(self, processor):
@@ -393,11 +671,11 @@ class TestQAProcessorIntegration:
             
             # 4. 生成答案
             mock_response = Mock()
-            mock_response.json.return_value = {
+            mock_response.content = orjson.dumps({
                 "response": "机器学习是人工智能的重要分支。",
                 "prompt_eval_count": 80,
                 "eval_count": 40
-            }
+            })
             processor.http_client.post.return_value = mock_response
             
             # 5. 设置缓存